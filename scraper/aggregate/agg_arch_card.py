@@ -1,7 +1,9 @@
+import numpy as np
 import pandas as pd
 import logging
 
-from .aggregator import Aggregator
+from transform.decklists import Decklists
+from .aggregator import Aggregator, DECK_INDEX
 from .aggregate_manager import AggregateManager
 
 GROUPBY_COLUMNS = ["seasonId", "sourceName", "archetypeId", "archetypeName"]
@@ -10,38 +12,44 @@ GROUPBY_COLUMNS = ["seasonId", "sourceName", "archetypeId", "archetypeName"]
 class ArchetypeCardsAggregator(Aggregator):
     def __init__(self, column: str) -> None:
         self.column = column
-        extra_columns = ["matches", "wins"]
-        extra_columns.append(column)
+        extra_columns = ["matches", "wins", DECK_INDEX]
         super().__init__(GROUPBY_COLUMNS, GROUPBY_COLUMNS + extra_columns)
 
-    def execute(self, df: pd.DataFrame) -> pd.DataFrame:
+    def execute(self, df: pd.DataFrame, decklists: Decklists) -> pd.DataFrame:
         df = self._preprocess(df)
-        df = df.rename(columns={self.column: "card"})
-        res_dfs = []
-        for grp, _df in df.groupby(GROUPBY_COLUMNS, observed=True):
-            n_decks = len(_df)
-            _df = _df.explode("card").dropna(subset="card")
-            if _df.empty:
-                logging.warn(f"No cards found for {grp}")
-                continue
-            card_info = pd.DataFrame(_df["card"].tolist())
-            _df = _df.drop(columns=["card"]).reset_index(drop=True)
-            _df = pd.concat([_df, card_info], axis=1).rename(columns={"name": "card"})
-            _df = _df.groupby(["card"]).agg(
-                decks=pd.NamedAgg("wins", "count"),
-                n=pd.NamedAgg("n", "sum"),
-                wins=pd.NamedAgg("wins", "sum"),
-                matches=pd.NamedAgg("matches", "sum"),
-            )
-            _df["includeRate"] = _df["decks"] * 1.0 / n_decks
-            _df["includeAverageNumber"] = _df["n"] * 1.0 / _df["decks"]
-            _df["winRate"] = _df["wins"] * 1.0 / _df["matches"]
-            _df = _df.drop(columns=["n"])
-            for c, v in zip(GROUPBY_COLUMNS, grp):
-                _df[c] = v
-            res_dfs.append(_df)
-        df = pd.concat(res_dfs, axis=0, ignore_index=True)
-        return df
+        groups = df.groupby(GROUPBY_COLUMNS, observed=True, sort=False)
+        group = groups.ngroup().to_numpy()
+        n_decks = groups.size().to_numpy()
+        board = decklists.boards[self.column]
+        rows, card_ids, counts = board.explode(df[DECK_INDEX].to_numpy())
+        cards_df = pd.DataFrame(
+            {
+                "group": group[rows],
+                "card": card_ids,
+                "n": counts.astype(np.int64),
+                "wins": df["wins"].to_numpy()[rows],
+                "matches": df["matches"].to_numpy()[rows],
+            }
+        )
+        for grp in set(range(len(n_decks))) - set(cards_df["group"]):
+            logging.warn(f"No cards found for group {grp}")
+        cards_df = cards_df.groupby(["group", "card"]).agg(
+            decks=pd.NamedAgg("wins", "count"),
+            n=pd.NamedAgg("n", "sum"),
+            wins=pd.NamedAgg("wins", "sum"),
+            matches=pd.NamedAgg("matches", "sum"),
+        )
+        cards_df = cards_df.reset_index()
+        group = cards_df["group"].to_numpy()
+        cards_df["card"] = decklists.names[cards_df["card"].to_numpy()]
+        cards_df["includeRate"] = cards_df["decks"] * 1.0 / n_decks[group]
+        cards_df["includeAverageNumber"] = cards_df["n"] * 1.0 / cards_df["decks"]
+        cards_df["winRate"] = cards_df["wins"] * 1.0 / cards_df["matches"]
+        cards_df = cards_df.drop(columns=["group", "n"])
+        keys = groups.size().index.to_frame(index=False)
+        for c in GROUPBY_COLUMNS:
+            cards_df[c] = keys[c].to_numpy()[group]
+        return cards_df
 
 
 @AggregateManager.register("average_archetype_maindeck")
@@ -3,6 +3,7 @@ from typing import List
 import logging
 from datetime import datetime
 
+from transform.decklists import Decklists
 from .aggregator import Aggregator
 from .aggregate_manager import AggregateManager
 
@@ -33,7 +34,7 @@ class ArchetypeDayAggregator(Aggregator):
             ],
         )
 
-    def execute(self, df: pd.DataFrame) -> pd.DataFrame:
+    def execute(self, df: pd.DataFrame, decklists: Decklists) -> pd.DataFrame:
         df = self._preprocess(df)
         df = df[df["matches"] > 0].copy()
         df["updatedDatetime"] = df["updatedDatetime"].fillna(datetime.now())
@@ -1,9 +1,11 @@
 from abc import ABC, abstractmethod
+import numpy as np
 import pandas as pd
 from typing import List, Dict, Union, Callable
 import logging
 
-from .aggregator import Aggregator
+from transform.decklists import Decklists
+from .aggregator import Aggregator, DECK_INDEX
 from .aggregate_manager import AggregateManager
 
 GROUPBY_COLUMNS = ["seasonId", "sourceName", "archetypeId", "archetypeName"]
@@ -21,63 +23,75 @@ class Strategy(ABC):
 class ArchetypeDeckAggregator(Aggregator):
     def __init__(self, strategy: Strategy) -> None:
         self.strategy = strategy
-        extra_columns = strategy.columns
-        if not extra_columns:
-            extra_columns = ["maindeck", "sideboard"]
-        for c in ["maindeck", "sideboard"]:
-            if c not in extra_columns:
-                extra_columns.append(c)
+        extra_columns = strategy.columns + [DECK_INDEX]
         super().__init__(GROUPBY_COLUMNS, GROUPBY_COLUMNS + extra_columns)
 
     @staticmethod
-    def expand_cards(deck: "list[dict[str, str|int]]") -> "list[str]":
-        return [f"{r['name']} {i:02}" for r in deck for i in range(r["n"])]
+    def expand_cards(
+        rows: np.ndarray, card_ids: np.ndarray, counts: np.ndarray
+    ) -> "tuple[np.ndarray, np.ndarray, np.ndarray]":
+        """
+        Repeats each card once per copy, numbering the copies,
+        so the 3rd copy of a card can be weighed separately from the 1st.
+        """
+        counts = counts.astype(np.int64)
+        starts = np.cumsum(counts) - counts
+        copies = np.arange(counts.sum()) - np.repeat(starts, counts)
+        return np.repeat(rows, counts), np.repeat(card_ids, counts), copies
 
     @staticmethod
     def aggregate_cards(df: pd.DataFrame, total: int) -> pd.DataFrame:
         """
-        Given a dataframe of weights and cards,
-        returns a list of `total` cards with highest weights
-        for each groupby combination
+        Given a dataframe of weights and card copies,
+        returns the `total` copies with highest weights for each group,
+        counted per card
 
         Args:
-            df (pd.DataFrame): dataframe with GROUPBY_COLUMNS, "weight", and "card"
+            df (pd.DataFrame): dataframe with "group", "card", "copy" and "weight"
             total (int): number of cards to take
 
         Returns:
-            pd.DataFrame: dataframe with GROUPBY_COLUMNS, and "card",
-            which contains `total` cards of the highest weights
+            pd.DataFrame: dataframe with "group", "card" and "n",
+            the number of copies of the card among the `total` kept
         """
-        values = []
-        # use loop instead since sort_values over entire df is very slow
-        for gp, _df in df.groupby(GROUPBY_COLUMNS, observed=True, sort=False):
-            _df = _df.groupby("card")["weight"].sum().reset_index()
-            _df["card"] = _df["card"].str.replace(" [0-9]+$", "", regex=True)
-            _df = _df.sort_values(by="weight", ascending=False)
-            cards_vc = _df["card"][:total].value_counts().reset_index()
-            cards_vc.columns = ["name", "n"]
-            cards_ls = cards_vc.to_dict(orient="records")
-            values.append([*gp, cards_ls])
-        res_df = pd.DataFrame(values, columns=GROUPBY_COLUMNS + ["card"])
-        return res_df
-
-    def execute(self, df: pd.DataFrame) -> pd.DataFrame:
+        df = df.groupby(["group", "card", "copy"])["weight"].sum().reset_index()
+        df = df.sort_values(
+            by=["group", "weight", "card", "copy"],
+            ascending=[True, False, True, True],
+            kind="stable",
+        )
+        df = df.groupby("group").head(total)
+        df = df.groupby(["group", "card"]).size().reset_index(name="n")
+        return df.sort_values(by=["group", "n"], ascending=[True, False], kind="stable")
+
+    def execute(self, df: pd.DataFrame, decklists: Decklists) -> pd.DataFrame:
         df = self._preprocess(df)
-        counts = df.groupby(GROUPBY_COLUMNS, observed=True).size().reset_index()
-        counts = counts.rename({0: "decks"}, axis=1)
-        df["weight"] = self.strategy.weight_function(df)
-        dfs = []
+        groups = df.groupby(GROUPBY_COLUMNS, observed=True, sort=False)
+        group = groups.ngroup().to_numpy()
+        weight = self.strategy.weight_function(df).to_numpy()
+        res_df = groups.size().reset_index(name="decks")
         for col, n in [("maindeck", 60), ("sideboard", 15)]:
-            df[col] = df[col].map(self.expand_cards)
-            temp_df = df[GROUPBY_COLUMNS + [col, "weight"]].rename(
-                columns={col: "card"}
+            board = decklists.boards[col]
+            rows, card_ids, copies = self.expand_cards(
+                *board.explode(df[DECK_INDEX].to_numpy())
+            )
+            cards_df = pd.DataFrame(
+                {
+                    "group": group[rows],
+                    "card": card_ids,
+                    "copy": copies,
+                    "weight": weight[rows],
+                }
             )
-            temp_df = temp_df.explode("card")
-            temp_df = self.aggregate_cards(temp_df, n)
-            dfs.append(temp_df.rename(columns={"card": col}))
-        df = dfs[0].merge(dfs[1], on=GROUPBY_COLUMNS, how="outer")
-        df = df.merge(counts, on=GROUPBY_COLUMNS, how="outer")
-        df = df[GROUPBY_COLUMNS + ["decks", "maindeck", "sideboard"]]
+            cards_df = self.aggregate_cards(cards_df, n)
+            cards_df["name"] = decklists.names[cards_df["card"].to_numpy()]
+            cards_ls = [[] for _ in range(len(res_df))]
+            for grp, name, count in zip(
+                cards_df["group"], cards_df["name"], cards_df["n"]
+            ):
+                cards_ls[grp].append({"name": name, "n": int(count)})
+            res_df[col] = cards_ls
+        df = res_df[GROUPBY_COLUMNS + ["decks", "maindeck", "sideboard"]]
         return df
 
 
@@ -2,6 +2,7 @@ import pandas as pd
 from typing import List
 import logging
 
+from transform.decklists import Decklists
 from .aggregator import Aggregator
 from .aggregate_manager import AggregateManager
 
@@ -18,7 +19,7 @@ class ArchetypeWinRateAggregator(Aggregator):
         extra_columns = ["personId", "wins", "matches"]
         super().__init__(groupby_cols, groupby_cols + extra_columns)
 
-    def execute(self, df: pd.DataFrame) -> pd.DataFrame:
+    def execute(self, df: pd.DataFrame, decklists: Decklists) -> pd.DataFrame:
         df = self._preprocess(df)
         df = df[df["matches"] > 2].copy()
         df = df.groupby(self.groupby_columns, observed=True, as_index=False).agg(
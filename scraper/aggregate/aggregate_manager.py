@@ -1,17 +1,76 @@
-from dataclasses import dataclass, field
-from typing import ClassVar, Dict, Type
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from multiprocessing import get_context
+from time import perf_counter
+from typing import ClassVar, Dict, Tuple, Type
 import pandas as pd
 import logging
+import os
+import resource
+import tempfile
 
 from .aggregator import Aggregator
+from .shared_frame import SharedFrame
 from load import Writer
+from transform.decklists import Decklists
+
+# tmpfs on linux, so the shared frame stays in memory
+SHARED_MEMORY_FOLDER = "/dev/shm"
+
+
+def _reset_peak_memory() -> None:
+    try:
+        # resets VmHWM, as pool workers run several aggregators
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_memory_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # peak of the whole process, kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _aggregate(
+    agg_class: Type[Aggregator], shared: SharedFrame
+) -> Tuple[pd.DataFrame, Dict[str, float]]:
+    _reset_peak_memory()
+    start_time = perf_counter()
+    df, decklists = shared.load()
+    agg_df = agg_class().execute(df, decklists)
+    stats = {
+        "seconds": perf_counter() - start_time,
+        "peakMemoryMB": _peak_memory_mb(),
+    }
+    return agg_df, stats
 
 
 @dataclass
 class AggregateManager:
+    """
+    Runs every registered aggregator on the decks and writes their results.
+
+    With `max_workers`, aggregators run in that many processes, reading the
+    decks from one SharedFrame, and each result is written as soon as it's
+    done, while the others are still running.
+    Time and peak memory of each aggregator are kept in `stats`.
+    """
+
     writer: Writer
+    max_workers: int = 0
     aggregators: ClassVar[Dict[str, Type[Aggregator]]] = {}
 
+    def __post_init__(self):
+        self.stats: "dict[str, dict[str, float]]" = {}
+
     @classmethod
     def register(cls, name: str):
         def wrapped(subcls: Type[Aggregator]) -> Type[Aggregator]:
@@ -24,10 +83,48 @@ class AggregateManager:
 
         return wrapped
 
-    def execute(self, df: pd.DataFrame):
+    def _write(self, name: str, agg_df: pd.DataFrame, stats: Dict[str, float]):
+        start_time = perf_counter()
+        groupby_columns = self.aggregators[name]().groupby_columns
+        self.writer.execute(agg_df, name + ".parquet", groupby_columns)
+        self.stats[name] = {**stats, "writeSeconds": perf_counter() - start_time}
+        logging.info(f"Aggregated with {name}: {self.stats[name]}")
+
+    def execute(self, df: pd.DataFrame, decklists: "Decklists | None" = None):
         logging.info(f"Found {len(self.aggregators)} registered aggregators")
+        if decklists is None:
+            decklists = Decklists.build(df)
+        self.stats = {}
+        if self.max_workers > 0:
+            self._execute_parallel(df, decklists)
+            return
         for name, agg_class in self.aggregators.items():
             logging.info(f"Aggregating df with {name} aggregator")
+            start_time = perf_counter()
             aggregator = agg_class()
-            agg_df = aggregator.execute(df)
-            self.writer.execute(agg_df, name + ".parquet", aggregator.groupby_columns)
+            agg_df = aggregator.execute(df, decklists)
+            stats = {
+                "seconds": perf_counter() - start_time,
+                # of the whole run so far, as it's the same process
+                "peakMemoryMB": _peak_memory_mb(),
+            }
+            self._write(name, agg_df, stats)
+
+    def _execute_parallel(self, df: pd.DataFrame, decklists: Decklists):
+        parent = None
+        if os.path.isdir(SHARED_MEMORY_FOLDER):
+            parent = SHARED_MEMORY_FOLDER
+        with tempfile.TemporaryDirectory(dir=parent) as folder:
+            shared = SharedFrame.publish(df, decklists, folder)
+            logging.info(f"Aggregating with {self.max_workers} processes from {folder}")
+            # spawned, so workers only have the frame through the shared files
+            with ProcessPoolExecutor(
+                self.max_workers, mp_context=get_context("spawn")
+            ) as pool:
+                futures = {
+                    pool.submit(_aggregate, agg_class, shared): name
+                    for name, agg_class in self.aggregators.items()
+                }
+                for future in as_completed(futures):
+                    agg_df, stats = future.result()
+                    self._write(futures[future], agg_df, stats)
@@ -1,8 +1,14 @@
+import numpy as np
 import pandas as pd
 from dataclasses import dataclass, field
 from abc import ABC, abstractmethod
 from typing import List
 
+from transform.decklists import Decklists
+
+# position of each deck in the Decklists, kept through _preprocess
+DECK_INDEX = "deckIndex"
+
 
 @dataclass
 class Aggregator:
@@ -10,6 +16,8 @@ class Aggregator:
     source_columns: List[str]
 
     def _preprocess(self, df: pd.DataFrame) -> pd.DataFrame:
+        if DECK_INDEX in self.source_columns:
+            df = df.assign(**{DECK_INDEX: np.arange(len(df))})
         df = df[self.source_columns].copy()
         if "sourceName" in self.source_columns:
             df["sourceName"] = df["sourceName"].cat.add_categories("Both")
@@ -19,5 +27,5 @@ class Aggregator:
         return df
 
     @abstractmethod
-    def execute(self, df: pd.DataFrame) -> pd.DataFrame:
+    def execute(self, df: pd.DataFrame, decklists: Decklists) -> pd.DataFrame:
         raise NotImplementedError
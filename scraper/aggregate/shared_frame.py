@@ -0,0 +1,60 @@
+from dataclasses import dataclass
+from typing import Tuple
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from transform.decklists import BOARDS, Board, Decklists
+
+FRAME_FILENAME = "frame.arrow"
+BOARD_ARRAYS = ["offsets", "card_ids", "counts"]
+
+
+@dataclass
+class SharedFrame:
+    """
+    A DataFrame and its Decklists written once to `folder`, the frame as an
+    uncompressed Arrow IPC file and the decklists as .npy arrays,
+    for worker processes to open memory-mapped instead of each being sent
+    a pickled copy. On a tmpfs like /dev/shm the files never touch a disk.
+    """
+
+    folder: str
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.folder, name)
+
+    @classmethod
+    def publish(
+        cls, df: pd.DataFrame, decklists: Decklists, folder: str
+    ) -> "SharedFrame":
+        shared = cls(folder)
+        table = pa.Table.from_pandas(df)
+        with pa.OSFile(shared._path(FRAME_FILENAME), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        # fixed width strings, so the names can be mapped too
+        np.save(shared._path("names.npy"), decklists.names.astype(str))
+        for name, board in decklists.boards.items():
+            for array in BOARD_ARRAYS:
+                np.save(shared._path(f"{name}-{array}.npy"), getattr(board, array))
+        return shared
+
+    def load(self) -> Tuple[pd.DataFrame, Decklists]:
+        with pa.memory_map(self._path(FRAME_FILENAME), "r") as source:
+            table = pa.ipc.open_file(source).read_all()
+        # columns without nulls stay views of the mapped file
+        df = table.to_pandas(split_blocks=True)
+        names = np.load(self._path("names.npy")).astype(object)
+        boards = {
+            name: Board(
+                *(
+                    np.load(self._path(f"{name}-{array}.npy"), mmap_mode="r")
+                    for array in BOARD_ARRAYS
+                )
+            )
+            for name in BOARDS
+        }
+        return df, Decklists(names, boards)
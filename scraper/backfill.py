@@ -0,0 +1,177 @@
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from extract import RateLimiter
+from main import main
+
+PROGRESS_FILE = "backfill_progress.json"
+
+# set in each worker process by _init_worker
+_limiter: "RateLimiter | None" = None
+
+
+def _init_worker(limiter: RateLimiter, level: int) -> None:
+    global _limiter
+    _limiter = limiter
+    logging.getLogger().setLevel(level)
+
+
+def _run_season(seasonId: int, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    start_time = time.perf_counter()
+    # main logs and swallows exceptions, returning None
+    result = main(seasonId, limiter=_limiter, **kwargs)
+    return {
+        "seasonId": seasonId,
+        "status": "fail" if result is None else "done",
+        "seconds": time.perf_counter() - start_time,
+        "rows": None if result is None else result["rows"],
+        "finishedAt": datetime.now().isoformat(),
+    }
+
+
+def load_progress(path: str) -> Dict[str, Dict[str, Any]]:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_progress(path: str, progress: Dict[str, Dict[str, Any]]) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(progress, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def print_summary(results: List[Dict[str, Any]], seconds: float) -> None:
+    lines = [f"{'season':>6} {'status':>6} {'rows':>8} {'time':>16}"]
+    for res in sorted(results, key=lambda r: r["seasonId"]):
+        rows = "" if res["rows"] is None else str(res["rows"])
+        taken = str(timedelta(seconds=round(res["seconds"], 2)))
+        lines.append(f"{res['seasonId']:>6} {res['status']:>6} {rows:>8} {taken:>16}")
+    num_done = sum(res["status"] == "done" for res in results)
+    lines.append(
+        f"{num_done}/{len(results)} seasons done in {timedelta(seconds=seconds)}"
+    )
+    logging.info("Backfill summary:\n" + "\n".join(lines))
+
+
+def backfill(
+    first_season: int,
+    last_season: int,
+    processes: int = 4,
+    min_time_between_calls: float = 0.5,
+    progress_file: str = PROGRESS_FILE,
+    force: bool = False,
+    **kwargs,
+) -> List[Dict[str, Any]]:
+    """
+    Runs main for every season from `first_season` to `last_season` inclusive
+    in a pool of `processes` worker processes.
+    All workers share one rate limit against the API, and seasons recorded
+    as done in `progress_file` are skipped unless `force` is set.
+
+    Args:
+        first_season (int): first season to run
+        last_season (int): last season to run
+        processes (int): number of seasons to run at the same time
+        min_time_between_calls (float): politeness budget across all workers
+        progress_file (str): json file recording the result of each season
+        force (bool): rerun seasons that are already done
+        **kwargs: passed on to main
+
+    Returns:
+        List[Dict[str, Any]]: the result of each season that was run
+    """
+    assert processes > 0, f"{processes=} must be greater than 0"
+    progress = load_progress(progress_file)
+    season_ids = [
+        seasonId
+        for seasonId in range(first_season, last_season + 1)
+        if force or progress.get(str(seasonId), {}).get("status") != "done"
+    ]
+    logging.info(f"Backfilling seasons {season_ids} with {processes=}")
+    limiter = RateLimiter(rate=1 / min_time_between_calls, shared=True)
+    start_time = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        initializer=_init_worker,
+        initargs=(limiter, logging.getLogger().level),
+    ) as executor:
+        futures = [
+            executor.submit(_run_season, seasonId, kwargs) for seasonId in season_ids
+        ]
+        for future in as_completed(futures):
+            res = future.result()
+            logging.info(f"Season {res['seasonId']} {res['status']}")
+            results.append(res)
+            progress[str(res["seasonId"])] = res
+            save_progress(progress_file, progress)
+    print_summary(results, time.perf_counter() - start_time)
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    import argparse
+
+    p = argparse.ArgumentParser()
+    p.add_argument(metavar="FIRST", dest="first_season", type=int)
+    p.add_argument(metavar="LAST", dest="last_season", type=int)
+    p.add_argument(
+        "--processes",
+        dest="processes",
+        type=int,
+        default=4,
+        help="Number of seasons to run in parallel",
+    )
+    p.add_argument(
+        "--min-time-between-calls",
+        dest="min_time_between_calls",
+        type=float,
+        default=0.5,
+        help="Seconds between API calls, shared by all processes",
+    )
+    p.add_argument(
+        "--progress-file",
+        dest="progress_file",
+        default=PROGRESS_FILE,
+        help="Where to record which seasons are done",
+    )
+    p.add_argument(
+        "--force",
+        dest="force",
+        action="store_true",
+        default=False,
+        help="Rerun seasons that are already done",
+    )
+    p.add_argument(
+        "--concurrency",
+        dest="concurrency",
+        type=int,
+        default=1,
+        help="Number of pages to fetch in parallel within each season",
+    )
+    p.add_argument(
+        "--batch-pages",
+        dest="batch_pages",
+        type=int,
+        default=None,
+        help="Stream every N pages through transform and load",
+    )
+    p.add_argument(
+        "--adaptive",
+        dest="adaptive",
+        action="store_true",
+        default=False,
+        help="Tune the request rate and page size from response latencies",
+    )
+    args = p.parse_args()
+    results = backfill(**vars(args))
+    exit(0 if all(res["status"] == "done" for res in results) else 1)
@@ -0,0 +1,309 @@
+"""
+Compares load strategies on synthetic seasons against a local PostgreSQL.
+
+Each strategy loads a season into an empty schema made from database/models.py,
+then loads it again with some decks updated, in a process of its own
+so its peak memory can be told apart from the other strategies'.
+
+Run from the scraper folder with
+    python -m benchmarks.load --sizes 10000 50000 --strategies csv binary parallel
+Starts a throwaway server with initdb and pg_ctl, found on PATH or in --pg-bin,
+unless --host is given, in which case that server's database is wiped.
+"""
+
+import json
+import logging
+import os
+import resource
+import shutil
+import socket
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import get_context
+from time import perf_counter
+from typing import Callable, Dict, Generator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from database import Database
+from load import Loader, ParallelLoader
+from transform import Decklists, Transformer
+from .synthetic import make_decks
+
+STRATEGIES: Dict[str, Callable[[], Loader]] = {
+    "csv": lambda: Loader(),
+    "binary": lambda: Loader(copy_format="binary"),
+    "server-delta": lambda: Loader(server_delta=True),
+    "chunked": lambda: Loader(chunk_rows=5000),
+    "parallel": lambda: ParallelLoader(max_workers=4),
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def local_postgres(pg_bin: Optional[str] = None) -> Generator[Dict, None, None]:
+    """
+    Runs a PostgreSQL server in a temporary folder for as long as the context,
+    and yields the config Database connects to it with.
+    """
+    initdb = shutil.which("initdb", path=pg_bin)
+    pg_ctl = shutil.which("pg_ctl", path=pg_bin)
+    if initdb is None or pg_ctl is None:
+        raise FileNotFoundError(
+            "initdb and pg_ctl not found, install PostgreSQL or pass --pg-bin"
+        )
+    port = _free_port()
+    with tempfile.TemporaryDirectory() as folder:
+        data = os.path.join(folder, "data")
+        subprocess.run(
+            [initdb, "-D", data, "-U", "bench", "--auth=trust"],
+            check=True,
+            capture_output=True,
+        )
+        options = f"-p {port} -k {folder} -c listen_addresses=localhost"
+        subprocess.run(
+            [pg_ctl, "-D", data, "-o", options, "-l", f"{folder}/log", "-w", "start"],
+            check=True,
+            capture_output=True,
+        )
+        try:
+            yield {
+                "dbHost": "localhost",
+                "dbPort": str(port),
+                "dbName": "postgres",
+                "dbUser": "bench",
+                "dbPassword": "",
+            }
+        finally:
+            subprocess.run(
+                [pg_ctl, "-D", data, "-m", "fast", "stop"], capture_output=True
+            )
+
+
+def connect(config: Dict[str, str]) -> Database:
+    db = Database()
+    db.config = {**db.config, **config}
+    # a local server has no certificates
+    Database._sslmode = "disable"
+    return db
+
+
+def reset_schema(db: Database) -> None:
+    from sqlalchemy import create_engine
+
+    from database.models import Base
+
+    with db.connection().cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS temp_deck_ids, load_progress;")
+    db.connection().commit()
+    engine = create_engine("postgresql+psycopg2://", creator=db.connect)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+
+def update_decks(raw: pd.DataFrame, fraction: float, seed: int = 1) -> pd.DataFrame:
+    """
+    Returns the decks with `fraction` of them updated a day later,
+    and half of those with a card swapped, as when a league run goes on.
+    """
+    rng = np.random.default_rng(seed)
+    raw = raw.copy()
+    updated = rng.random(len(raw)) < fraction
+    raw.loc[updated, "updatedDate"] += 24 * 3600
+    raw.loc[updated, "wins"] += 1
+    swapped = np.flatnonzero(updated & (rng.random(len(raw)) < 0.5))
+    for i in swapped:
+        maindeck = [dict(card) for card in raw.at[i, "maindeck"]]
+        maindeck[0]["n"] = maindeck[0]["n"] % 4 + 1
+        raw.at[i, "maindeck"] = maindeck
+        raw.at[i, "decklistHash"] = f"{raw.at[i, 'decklistHash'][:-1]}x"
+    return raw
+
+
+def _peak_memory_mb() -> float:
+    # kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def time_load(loader: Loader, df: pd.DataFrame, decklists: Decklists) -> Dict:
+    loader.write_stats = {}
+    start_time = perf_counter()
+    loader.execute(df, decklists)
+    seconds = perf_counter() - start_time
+    tables = {
+        t: {k: stats[k] for k in ["rows", "seconds", "rowsPerSecond"]}
+        for t, stats in loader.write_stats.items()
+    }
+    if loader.chunk_rows and loader.chunk_stats:
+        # decks and their cards are only timed per chunk
+        tables["chunks"] = {
+            "rows": sum(c["rows"] for c in loader.chunk_stats),
+            "seconds": sum(c["seconds"] for c in loader.chunk_stats),
+        }
+        tables["chunks"]["rowsPerSecond"] = (
+            tables["chunks"]["rows"] / tables["chunks"]["seconds"]
+        )
+    rows = sum(stats["rows"] for t, stats in tables.items() if t != "temp_deck_ids")
+    return {
+        "seconds": seconds,
+        "rows": rows,
+        "rowsPerSecond": rows / seconds,
+        "tables": tables,
+    }
+
+
+def run_strategy(
+    strategy: str, size: int, config: Dict[str, str], updated_fraction: float
+) -> Dict:
+    """
+    Loads a season of `size` decks, then the same season with some decks
+    updated, with a fresh loader of the strategy. Runs in its own process.
+    """
+    logging.basicConfig(level=logging.WARNING)
+    db = connect(config)
+    reset_schema(db)
+    with open("transform/schema.json") as f:
+        schema = json.load(f)
+    transformer = Transformer(schema)
+    raw = make_decks(size)
+    base_memory = _peak_memory_mb()
+    loader = STRATEGIES[strategy]()
+    passes = {}
+    for name, decks in [
+        ("insert", raw),
+        ("update", update_decks(raw, updated_fraction)),
+    ]:
+        df = transformer.execute(decks.copy())
+        decklists = Decklists.build(df)
+        passes[name] = time_load(loader, df, decklists)
+    return {
+        "strategy": strategy,
+        "decks": size,
+        "passes": passes,
+        "baseMemoryMB": base_memory,
+        "peakMemoryMB": _peak_memory_mb(),
+        "database": db.stats(),
+    }
+
+
+def main(
+    sizes: List[int],
+    strategies: List[str],
+    updated_fraction: float = 0.1,
+    host: Optional[str] = None,
+    port: int = 5432,
+    user: str = "postgres",
+    password: str = "",
+    dbname: str = "postgres",
+    pg_bin: Optional[str] = None,
+) -> List[Dict]:
+    unknown = set(strategies) - set(STRATEGIES)
+    assert not unknown, f"{unknown=} not in {list(STRATEGIES)}"
+
+    @contextmanager
+    def server() -> Generator[Dict, None, None]:
+        if host is None:
+            with local_postgres(pg_bin) as config:
+                yield config
+            return
+        yield {
+            "dbHost": host,
+            "dbPort": str(port),
+            "dbName": dbname,
+            "dbUser": user,
+            "dbPassword": password,
+        }
+
+    results = []
+    with server() as config:
+        for size in sizes:
+            for strategy in strategies:
+                # spawned so each strategy starts without the others' memory
+                with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+                    future = pool.submit(
+                        run_strategy, strategy, size, config, updated_fraction
+                    )
+                    result = future.result()
+                results.append(result)
+                insert, update = result["passes"]["insert"], result["passes"]["update"]
+                print(
+                    f"{size:>7} decks {strategy:>12}: "
+                    f"insert {insert['seconds']:.2f}s "
+                    f"({insert['rowsPerSecond']:.0f} rows/s), "
+                    f"update {update['seconds']:.2f}s "
+                    f"({update['rowsPerSecond']:.0f} rows/s), "
+                    f"peak {result['peakMemoryMB']:.0f} MB"
+                )
+                for table, stats in insert["tables"].items():
+                    print(
+                        f"{'':>22}{table:>14} {stats['rows']:>9} rows "
+                        f"{stats['seconds']:.2f}s"
+                    )
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    import argparse
+
+    p = argparse.ArgumentParser()
+    p.add_argument(
+        "--sizes",
+        dest="sizes",
+        nargs="+",
+        type=int,
+        default=[10_000, 50_000],
+        help="Numbers of decks per season to benchmark with",
+    )
+    p.add_argument(
+        "--strategies",
+        dest="strategies",
+        nargs="+",
+        choices=list(STRATEGIES),
+        default=list(STRATEGIES),
+        help="Load strategies to compare",
+    )
+    p.add_argument(
+        "--updated-fraction",
+        dest="updated_fraction",
+        type=float,
+        default=0.1,
+        help="Fraction of decks updated for the second load",
+    )
+    p.add_argument(
+        "--host",
+        dest="host",
+        default=None,
+        help="Use this server instead of starting one, its tables are dropped",
+    )
+    p.add_argument("--port", dest="port", type=int, default=5432)
+    p.add_argument("--user", dest="user", default="postgres")
+    p.add_argument("--password", dest="password", default="")
+    p.add_argument("--dbname", dest="dbname", default="postgres")
+    p.add_argument(
+        "--pg-bin",
+        dest="pg_bin",
+        default=None,
+        help="Folder with initdb and pg_ctl, if they aren't on PATH",
+    )
+    p.add_argument(
+        "--output",
+        dest="output",
+        default=None,
+        help="Also write the results to this json file",
+    )
+    args = vars(p.parse_args())
+    output = args.pop("output")
+    results = main(**args)
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
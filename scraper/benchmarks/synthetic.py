@@ -0,0 +1,81 @@
+from typing import Any, Dict, List
+import hashlib
+import numpy as np
+import pandas as pd
+
+COLORS = list("WUBRGC")
+NUM_CARDS = 5000
+
+
+def card_names(num_cards: int = NUM_CARDS) -> List[str]:
+    return [f"Card {i:05}" for i in range(num_cards)]
+
+
+def make_board(
+    rng: np.random.Generator, names: List[str], num_cards: int
+) -> List[Dict[str, Any]]:
+    picks = rng.choice(len(names), size=num_cards, replace=False)
+    counts = rng.integers(1, 5, size=num_cards)
+    return [{"n": int(n), "name": names[i]} for i, n in zip(picks, counts)]
+
+
+def make_decks(num_decks: int, seasonId: int = 30, seed: int = 0) -> pd.DataFrame:
+    """
+    Makes a DataFrame shaped like the decks returned by the API,
+    with only the fields that transform/schema.json is built from.
+
+    Args:
+        num_decks (int): number of decks
+        seasonId (int): season of every deck
+        seed (int): seed for the random generator
+
+    Returns:
+        pd.DataFrame: decks as returned by ColumnarDecoder
+    """
+    rng = np.random.default_rng(seed)
+    names = card_names()
+    created = 1_600_000_000 + rng.integers(0, 90 * 24 * 3600, size=num_decks)
+    num_colors = rng.integers(0, 4, size=num_decks)
+    wins = rng.integers(0, 6, size=num_decks)
+    losses = rng.integers(0, 6, size=num_decks)
+    draws = rng.integers(0, 2, size=num_decks)
+    archetype_ids = rng.integers(1, 200, size=num_decks).astype(float)
+    archetype_ids[rng.random(num_decks) < 0.05] = np.nan
+    omw = rng.integers(0, 101, size=num_decks).astype(str).astype(object) + "%"
+    omw[rng.random(num_decks) < 0.1] = ""
+    person_ids = rng.integers(1, 5000, size=num_decks)
+    maindecks = [make_board(rng, names, 20) for _ in range(num_decks)]
+    sideboards = [make_board(rng, names, 7) for _ in range(num_decks)]
+    return pd.DataFrame(
+        {
+            "id": np.arange(1, num_decks + 1),
+            "name": [f"Deck {i}" for i in range(num_decks)],
+            "maindeck": maindecks,
+            "sideboard": sideboards,
+            "decklistHash": [
+                hashlib.sha1(f"{m}{s}".encode()).hexdigest()[:16]
+                for m, s in zip(maindecks, sideboards)
+            ],
+            "colors": [
+                list(rng.choice(COLORS, size=n, replace=False)) for n in num_colors
+            ],
+            "createdDate": created,
+            "updatedDate": created + rng.integers(0, 7 * 24 * 3600, size=num_decks),
+            "person": [f"Player {i}" for i in person_ids],
+            "personId": person_ids,
+            "seasonId": seasonId,
+            "sourceName": rng.choice(["League", "Gatherling"], size=num_decks),
+            "url": [f"/decks/{i}/" for i in range(1, num_decks + 1)],
+            "archetypeId": archetype_ids,
+            "archetypeName": [
+                None if np.isnan(a) else f"Archetype {int(a)}" for a in archetype_ids
+            ],
+            "competitionId": rng.integers(1, 3000, size=num_decks),
+            "finish": np.where(rng.random(num_decks) < 0.5, np.nan, 1.0),
+            "retired": rng.random(num_decks) < 0.3,
+            "wins": wins,
+            "losses": losses,
+            "draws": draws,
+            "omw": omw,
+        }
+    )
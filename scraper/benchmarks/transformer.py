@@ -0,0 +1,110 @@
+"""
+Compares the original row-wise Transformer with the vectorized one
+on synthetic decks.
+
+Run from the scraper folder with
+    python -m benchmarks.transformer --sizes 10000 50000 200000
+"""
+import json
+import logging
+from time import perf_counter
+from typing import Dict, List
+
+import pandas as pd
+
+from transform import Transformer
+from .synthetic import make_decks
+
+
+class RowWiseTransformer(Transformer):
+    """
+    The Transformer before it was vectorized, kept to benchmark against.
+    """
+
+    def execute(self, df: pd.DataFrame) -> pd.DataFrame:
+        df["url"] = "https://pennydreadfulmagic.com" + df["url"]
+        df["omw"] = df["omw"].str.replace("%", "")
+        df["omwPercent"] = df["omw"].replace("", None)
+        df["matches"] = df[["wins", "losses", "draws"]].sum(axis=1)
+        df["archetypeId"] = df["archetypeId"].fillna(-1)
+        df["archetypeName"] = df["archetypeName"].fillna("N/A")
+        df["archetypeName"] = df["archetypeName"].replace({"": "N/A"})
+        for c in "WUBRGC":
+            df[f"colorHas{c}"] = df["colors"].apply(lambda x: c in x)
+        df["createdDatetime"] = pd.to_datetime(df["createdDate"], unit="s")
+        df["createdDate"] = df["createdDatetime"].dt.strftime("%Y%m%d")
+        df["updatedDatetime"] = pd.to_datetime(df["updatedDate"], unit="s")
+        df["updatedDate"] = df["updatedDatetime"].dt.strftime("%Y%m%d")
+
+        keep_columns = []
+        for source, dct in self.schema.items():
+            if dct["dtype"] == "object":
+                keep_columns.append(source)
+                continue
+            else:
+                df.loc[df[source].isna(), source] = None
+                df[source] = df[source].astype(dct["dtype"])
+            if dct["dtype"] == "category" and "categories" in dct:
+                df[source] = df[source].cat.set_categories(dct["categories"])
+            keep_columns.append(source)
+        df = df[keep_columns].copy()
+        return df
+
+
+def time_transformer(transformer: Transformer, df: pd.DataFrame, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        _df = df.copy()
+        start_time = perf_counter()
+        transformer.execute(_df)
+        best = min(best, perf_counter() - start_time)
+    return best
+
+
+def main(sizes: List[int], repeat: int = 3) -> List[Dict[str, float]]:
+    with open("transform/schema.json") as f:
+        schema = json.load(f)
+    old, new = RowWiseTransformer(schema), Transformer(schema)
+    results = []
+    for size in sizes:
+        df = make_decks(size)
+        expected = old.execute(df.copy())
+        pd.testing.assert_frame_equal(new.execute(df.copy()), expected)
+        old_seconds = time_transformer(old, df, repeat)
+        new_seconds = time_transformer(new, df, repeat)
+        results.append(
+            {
+                "decks": size,
+                "rowWiseSeconds": old_seconds,
+                "vectorizedSeconds": new_seconds,
+                "speedup": old_seconds / new_seconds,
+            }
+        )
+        print(
+            f"{size:>7} decks: row-wise {old_seconds:.3f}s, "
+            f"vectorized {new_seconds:.3f}s, {old_seconds / new_seconds:.1f}x"
+        )
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    import argparse
+
+    p = argparse.ArgumentParser()
+    p.add_argument(
+        "--sizes",
+        dest="sizes",
+        nargs="+",
+        type=int,
+        default=[10_000, 50_000, 200_000],
+        help="Numbers of decks to benchmark with",
+    )
+    p.add_argument(
+        "--repeat",
+        dest="repeat",
+        type=int,
+        default=3,
+        help="Best of how many runs to report",
+    )
+    main(**vars(p.parse_args()))
@@ -0,0 +1,133 @@
+"""
+Compares how many uploads ParquetWriter runs at once, writing synthetic decks
+partitioned as in main.py to an fsspec filesystem.
+
+Run from the scraper folder with
+    python -m benchmarks.upload --sizes 50000 --max-uploads 1 4 16 --latency 0.05
+Writes to an in-memory filesystem that waits `latency` seconds per file,
+like a round trip to a bucket, unless --bucket is given, e.g. gs://my-bucket,
+in which case its decks.parquet is overwritten.
+"""
+
+import json
+import logging
+import time
+from time import perf_counter
+from typing import Dict, List, Optional
+
+import fsspec
+from fsspec.implementations.memory import MemoryFileSystem
+
+from load import ParquetWriter
+from transform import Transformer
+from transform.decklists import BOARDS
+from .synthetic import make_decks
+
+PARTITION_COLS = ["seasonId", "archetypeId", "archetypeName"]
+
+
+class SlowMemoryFileSystem(MemoryFileSystem):
+    """
+    Keeps files in memory, taking `latency` seconds to put each one.
+    """
+
+    # each instance keeps its own files
+    cachable = False
+
+    def __init__(self, latency: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.store = {}
+        self.pseudo_dirs = [""]
+        self.latency = latency
+
+    def put_file(self, lpath, rpath, **kwargs):
+        time.sleep(self.latency)
+        return super().put_file(lpath, rpath, **kwargs)
+
+
+def main(
+    sizes: List[int],
+    max_uploads: List[int],
+    latency: float = 0.05,
+    bucket: Optional[str] = None,
+) -> List[Dict]:
+    with open("transform/schema.json") as f:
+        schema = json.load(f)
+    transformer = Transformer(schema)
+    results = []
+    for size in sizes:
+        df = transformer.execute(make_decks(size)).drop(columns=BOARDS)
+        for n in max_uploads:
+            if bucket is None:
+                fs, root = SlowMemoryFileSystem(latency), "benchmark"
+            else:
+                fs, root = fsspec.core.url_to_fs(bucket)
+            if fs.exists(f"{root}/decks.parquet"):
+                fs.rm(f"{root}/decks.parquet", recursive=True)
+            writer = ParquetWriter(root, target="gcsfs", fs=fs, max_uploads=n)
+            start_time = perf_counter()
+            writer.execute(df.copy(), "decks.parquet", PARTITION_COLS)
+            seconds = perf_counter() - start_time
+            files = writer.load_manifest("decks.parquet").files()
+            results.append(
+                {
+                    "decks": size,
+                    "maxUploads": n,
+                    "files": len(files),
+                    "bytes": sum(f["bytes"] for f in files),
+                    "seconds": seconds,
+                }
+            )
+            print(
+                f"{size:>7} decks, {n:>3} uploads at once: "
+                f"{len(files)} files in {seconds:.2f}s"
+            )
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    import argparse
+
+    p = argparse.ArgumentParser()
+    p.add_argument(
+        "--sizes",
+        dest="sizes",
+        nargs="+",
+        type=int,
+        default=[50_000],
+        help="Numbers of decks to benchmark with",
+    )
+    p.add_argument(
+        "--max-uploads",
+        dest="max_uploads",
+        nargs="+",
+        type=int,
+        default=[1, 4, 8, 16],
+        help="Numbers of uploads at once to compare",
+    )
+    p.add_argument(
+        "--latency",
+        dest="latency",
+        type=float,
+        default=0.05,
+        help="Seconds the in-memory filesystem takes per file",
+    )
+    p.add_argument(
+        "--bucket",
+        dest="bucket",
+        default=None,
+        help="Upload to this fsspec url instead of memory",
+    )
+    p.add_argument(
+        "--output",
+        dest="output",
+        default=None,
+        help="Also write the results to this json file",
+    )
+    args = vars(p.parse_args())
+    output = args.pop("output")
+    results = main(**args)
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -1 +1,2 @@
 from .database import Database
+from .watermark import Watermark, WatermarkStore
@@ -1,14 +1,37 @@
 import logging
+import threading
+from time import perf_counter
+from typing import Dict, Optional
+
 import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
 
 from dotenv import dotenv_values
 
+from .pool import ConnectionPool
 
 conf = {**dotenv_values()}
 
+# verify-full needs sslRootCert, require only encrypts
+SSL_MODES = ["verify-full", "require"]
+
+
+def is_certificate_error(e: Exception) -> bool:
+    """
+    Whether verify-full failed on the certificate, e.g. a missing root
+    certificate or a host name mismatch, rather than on the network.
+    """
+    if isinstance(e, KeyError):
+        # no sslRootCert configured
+        return True
+    return "certificate" in str(e).lower()
+
 
 class Database:
     _instance = None
+    # the ssl mode that last worked, so later connections
+    # don't repeat a handshake that is bound to fail
+    _sslmode: Optional[str] = None
 
     def __new__(cls):
         if cls._instance is None:
@@ -22,38 +45,119 @@ class Database:
         return cls._instance.connection()
 
     def __init__(self):
+        # every Database() is the same instance, keep its connections
+        if getattr(self, "_initialised", False):
+            return
+        self._initialised = True
         self.config = conf
         self._connection = None
+        self._opened_at = 0.0
+        self._pool: Optional[ConnectionPool] = None
+        self._lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self.max_age = float(self.config.get("dbMaxConnectionAge", 1800))
+        self.metrics: Dict[str, float] = {
+            "connects": 0,
+            "connectSeconds": 0.0,
+            "sslFallbacks": 0,
+        }
 
     def connection(self) -> "psycopg2.connection":
-        if not hasattr(self, "_connection") or self._connection is None:
-            self._connect()
-        elif self._connection.closed:
+        # callers keep the connection, so it's never closed from here
+        with self._lock:
+            if self._connection is None or self._connection.closed:
+                self._connect()
+            return self._connection
+
+    def recycle(self) -> None:
+        """
+        Reopens the shared connection if it's older than `max_age`.
+        Only call it where nothing holds the connection, e.g. as a run starts.
+        """
+        with self._lock:
+            if self._connection is None or self._connection.closed:
+                return
+            if perf_counter() - self._opened_at <= self.max_age:
+                return
+            status = self._connection.get_transaction_status()
+            if status != TRANSACTION_STATUS_IDLE:
+                return
+            logging.info("Recycling database connection")
+            self._connection.close()
             self._connect()
-        return self._connection
+
+    @classmethod
+    def pool(cls, maxconn: int = 4, minconn: int = 1) -> ConnectionPool:
+        """
+        Returns the process-wide pool of extra connections,
+        for work that runs on several connections at once.
+        Asking for a larger maxconn grows the existing pool.
+        """
+        if cls._instance is None:
+            cls._instance = cls()
+        self = cls._instance
+        with self._lock:
+            if self._pool is None or self._pool.closed:
+                self._pool = ConnectionPool(
+                    self, min(minconn, maxconn), maxconn, max_age=self.max_age
+                )
+            else:
+                self._pool.resize(maxconn)
+            return self._pool
 
     def _connect(self) -> None:
-        try:
-            conn = psycopg2.connect(
-                host=self.config["dbHost"],
-                port=self.config["dbPort"],
-                database=self.config["dbName"],
-                user=self.config["dbUser"],
-                password=self.config["dbPassword"],
-                sslmode="verify-full",
-                sslrootcert=self.config["sslRootCert"],
-                connect_timeout=10,
-            )
-        except Exception as e:
-            logging.error(e)
-            logging.info("Trying ssl mode = 'require")
-            conn = psycopg2.connect(
-                host=self.config["dbHost"],
-                port=self.config["dbPort"],
-                database=self.config["dbName"],
-                user=self.config["dbUser"],
-                password=self.config["dbPassword"],
-                sslmode="require",
-                connect_timeout=10,
-            )
-        self._connection = conn
+        self._connection = self.connect()
+        self._opened_at = perf_counter()
+
+    def _connect_with(self, sslmode: str) -> "psycopg2.connection":
+        kwargs = {}
+        if sslmode == "verify-full":
+            kwargs["sslrootcert"] = self.config["sslRootCert"]
+        return psycopg2.connect(
+            host=self.config["dbHost"],
+            port=self.config["dbPort"],
+            database=self.config["dbName"],
+            user=self.config["dbUser"],
+            password=self.config["dbPassword"],
+            sslmode=sslmode,
+            connect_timeout=10,
+            **kwargs,
+        )
+
+    def connect(self) -> "psycopg2.connection":
+        """
+        Opens a new connection, falling back to sslmode=require
+        if the server certificate can't be verified.
+        Other errors, e.g. timeouts, are raised without falling back,
+        so a transient failure doesn't downgrade later connections.
+        """
+        start_time = perf_counter()
+        sslmodes = SSL_MODES if Database._sslmode is None else [Database._sslmode]
+        for i, sslmode in enumerate(sslmodes):
+            try:
+                conn = self._connect_with(sslmode)
+                break
+            except Exception as e:
+                if i == len(sslmodes) - 1 or not is_certificate_error(e):
+                    raise e
+                logging.error(e)
+                logging.info(f"Trying ssl mode = '{sslmodes[i + 1]}'")
+                with self._metrics_lock:
+                    self.metrics["sslFallbacks"] += 1
+        Database._sslmode = sslmode
+        with self._metrics_lock:
+            self.metrics["connects"] += 1
+            self.metrics["connectSeconds"] += perf_counter() - start_time
+        return conn
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Connection setup costs, and checkout waits of the pool if there is one.
+        """
+        with self._metrics_lock:
+            stats = dict(self.metrics)
+        if stats["connects"]:
+            stats["meanConnectSeconds"] = stats["connectSeconds"] / stats["connects"]
+        if self._pool is not None:
+            stats.update({f"pool.{k}": v for k, v in self._pool.stats().items()})
+        return stats
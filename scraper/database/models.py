@@ -44,6 +44,9 @@ class Deck(Base):
     name = mapped_column(String)
     maindeck: Mapped["Maindeck"] = relationship(back_populates="deck")
     sideboard: Mapped["Sideboard"] = relationship(back_populates="deck")
+    # existing tables need
+    # ALTER TABLE decks ADD COLUMN "decklistHash" VARCHAR(64);
+    decklistHash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
     colorHasW: Mapped[bool]
     colorHasU: Mapped[bool]
     colorHasB: Mapped[bool]
@@ -87,6 +90,15 @@ class Sideboard(Base):
     name: Mapped[str] = mapped_column(String(128))
 
 
+class LoadProgress(Base):
+    __tablename__ = "load_progress"
+    # table and a fingerprint of the rows being loaded
+    key: Mapped[str] = mapped_column(String(128), primary_key=True)
+    chunks: Mapped[int]
+    rows: Mapped[int]
+    updatedAt = mapped_column(DateTime)
+
+
 # create tables (from scratch)
 # requires those tables to not exist in the first place
 if __name__ == "__main__":
@@ -0,0 +1,176 @@
+from collections import deque
+from contextlib import contextmanager
+from time import perf_counter
+from typing import TYPE_CHECKING, Deque, Dict, Generator, Optional, Tuple
+import logging
+import threading
+
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg2.pool import PoolError
+
+if TYPE_CHECKING:
+    from .database import Database
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of connections opened with Database.connect.
+
+    Checkouts wait for a free connection once `maxconn` are open.
+    Connections older than `max_age` seconds are recycled, and ones idle for
+    more than `check_after` seconds are checked with SELECT 1 before reuse.
+    Kept on the Database singleton, so warm invocations reuse connections.
+    """
+
+    def __init__(
+        self,
+        database: "Database",
+        minconn: int = 1,
+        maxconn: int = 4,
+        max_age: float = 1800.0,
+        check_after: float = 30.0,
+    ):
+        assert 0 <= minconn <= maxconn, f"{minconn=} must be in [0, {maxconn=}]"
+        self.database = database
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.max_age = max_age
+        self.check_after = check_after
+        self.closed = False
+        self._cond = threading.Condition()
+        # connection and when it was last returned
+        self._idle: Deque[Tuple["psycopg2.connection", float]] = deque()
+        self._opened_at: Dict[int, float] = {}
+        self._size = 0
+        self.metrics: Dict[str, float] = {
+            "checkouts": 0,
+            "checkoutWaitSeconds": 0.0,
+            "maxCheckoutWaitSeconds": 0.0,
+            "recycled": 0,
+            "healthCheckFailures": 0,
+        }
+        for _ in range(minconn):
+            self._size += 1
+            self._idle.append((self._open(), perf_counter()))
+
+    def _open(self) -> "psycopg2.connection":
+        conn = self.database.connect()
+        self._opened_at[id(conn)] = perf_counter()
+        return conn
+
+    def _close(self, conn: "psycopg2.connection") -> None:
+        self._opened_at.pop(id(conn), None)
+        try:
+            conn.close()
+        except psycopg2.Error as e:
+            logging.warning(f"Failed to close connection: {e}")
+
+    def _expired(self, conn: "psycopg2.connection") -> bool:
+        opened_at = self._opened_at.get(id(conn), 0.0)
+        return perf_counter() - opened_at > self.max_age
+
+    def _healthy(self, conn: "psycopg2.connection", last_used: float) -> bool:
+        if conn.closed or self._expired(conn):
+            return False
+        if perf_counter() - last_used < self.check_after:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error as e:
+            logging.warning(f"Pooled connection failed health check: {e}")
+            with self._cond:
+                self.metrics["healthCheckFailures"] += 1
+            return False
+
+    def getconn(self, timeout: Optional[float] = None) -> "psycopg2.connection":
+        start_time = perf_counter()
+        conn, last_used = None, 0.0
+        with self._cond:
+            while True:
+                if self.closed:
+                    raise PoolError("connection pool is closed")
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self.maxconn:
+                    self._size += 1
+                    break
+                if not self._cond.wait(timeout):
+                    raise PoolError(f"no connection free after {timeout} seconds")
+        waited = perf_counter() - start_time
+        try:
+            if conn is None:
+                conn = self._open()
+            elif not self._healthy(conn, last_used):
+                with self._cond:
+                    self.metrics["recycled"] += 1
+                self._close(conn)
+                conn = self._open()
+        except Exception as e:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise e
+        with self._cond:
+            self.metrics["checkouts"] += 1
+            self.metrics["checkoutWaitSeconds"] += waited
+            self.metrics["maxCheckoutWaitSeconds"] = max(
+                self.metrics["maxCheckoutWaitSeconds"], waited
+            )
+        return conn
+
+    def putconn(self, conn: "psycopg2.connection", close: bool = False) -> None:
+        if not close and not conn.closed:
+            if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                # don't hand the next caller someone else's transaction
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    close = True
+        close = close or conn.closed or self.closed or self._expired(conn)
+        with self._cond:
+            if close:
+                self._close(conn)
+                self._size -= 1
+            else:
+                self._idle.append((conn, perf_counter()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(
+        self, timeout: Optional[float] = None
+    ) -> Generator["psycopg2.connection", None, None]:
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def resize(self, maxconn: int) -> None:
+        with self._cond:
+            self.maxconn = max(self.maxconn, maxconn)
+            self._cond.notify_all()
+
+    def closeall(self) -> None:
+        with self._cond:
+            self.closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._close(conn)
+                self._size -= 1
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            stats = dict(self.metrics)
+            stats["size"] = self._size
+            stats["idle"] = len(self._idle)
+        checkouts = stats["checkouts"]
+        stats["meanCheckoutWaitSeconds"] = (
+            stats["checkoutWaitSeconds"] / checkouts if checkouts else 0.0
+        )
+        return stats
@@ -0,0 +1,124 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Literal, Optional
+import io
+import logging
+
+import numpy as np
+from fsspec.implementations.local import LocalFileSystem
+from gcsfs import GCSFileSystem
+
+from .database import Database
+
+
+@dataclass
+class Watermark:
+    """
+    Deck id -> updatedDatetime of every deck loaded for a season,
+    as two arrays sorted by id so lookups are a vectorized binary search.
+    Datetimes are kept as int64 nanoseconds.
+    """
+
+    seasonId: int
+    ids: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int64))
+    updated: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int64))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def max_updated(self) -> Optional[datetime]:
+        if not len(self):
+            return None
+        latest = np.datetime64(int(self.updated.max()), "ns")
+        return latest.astype("datetime64[us]").item()
+
+    def lookup(self, ids: np.ndarray) -> np.ndarray:
+        """
+        Returns the stored updatedDatetime of each id in nanoseconds,
+        or -1 for ids that aren't stored.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        if not len(self):
+            return np.full(len(ids), -1, dtype=np.int64)
+        pos = np.searchsorted(self.ids, ids).clip(max=len(self) - 1)
+        found = self.ids[pos] == ids
+        return np.where(found, self.updated[pos], -1)
+
+    def changed(self, ids: np.ndarray, updated: np.ndarray) -> np.ndarray:
+        """
+        Returns a mask of the ids that are new or were updated since stored.
+        """
+        return self.lookup(ids) < np.asarray(updated, dtype=np.int64)
+
+    def update(self, ids: np.ndarray, updated: np.ndarray) -> None:
+        ids = np.concatenate([self.ids, np.asarray(ids, dtype=np.int64)])
+        updated = np.concatenate([self.updated, np.asarray(updated, dtype=np.int64)])
+        # stable sort keeps the new value after the old one for each id
+        order = np.argsort(ids, kind="stable")
+        ids = ids[order]
+        updated = updated[order]
+        is_last = np.append(ids[1:] != ids[:-1], True)
+        self.ids = ids[is_last]
+        self.updated = updated[is_last]
+
+    @classmethod
+    def from_database(cls, seasonId: int) -> "Watermark":
+        with Database.common_connection() as conn:
+            with conn.cursor() as cur:
+                sql = """
+                SELECT id, "updatedDatetime"
+                from decks
+                where "seasonId" = %s
+                """
+                cur.execute(sql, (seasonId,))
+                res = cur.fetchall()
+        watermark = cls(seasonId)
+        if res:
+            ids, updated = zip(*res)
+            updated = np.array(updated, dtype="datetime64[ns]").view(np.int64)
+            watermark.update(np.array(ids), updated)
+        return watermark
+
+
+@dataclass
+class WatermarkStore:
+    """
+    Persists a Watermark per season as a .npz file, locally or in a bucket,
+    so change detection doesn't need to query the whole season.
+    Seasons without a file are rebuilt from the database.
+    """
+
+    bucket: str
+    target: Literal["local", "gcsfs"] = "local"
+    folder: str = "watermarks"
+
+    def __post_init__(self):
+        if self.target == "gcsfs":
+            self.fs = GCSFileSystem()
+        else:
+            self.fs = LocalFileSystem(auto_mkdir=True)
+        self._watermarks: Dict[int, Watermark] = {}
+
+    def _path(self, seasonId: int) -> str:
+        return "/".join([self.bucket, self.folder, f"season-{seasonId}.npz"])
+
+    def load(self, seasonId: int, rebuild: bool = False) -> Watermark:
+        if seasonId in self._watermarks and not rebuild:
+            return self._watermarks[seasonId]
+        path = self._path(seasonId)
+        if self.fs.exists(path) and not rebuild:
+            with np.load(io.BytesIO(self.fs.cat_file(path))) as data:
+                watermark = Watermark(seasonId, data["ids"], data["updated"])
+        else:
+            logging.info(f"Rebuilding watermark of season {seasonId} from database")
+            watermark = Watermark.from_database(seasonId)
+            self.save(watermark)
+        self._watermarks[seasonId] = watermark
+        return watermark
+
+    def save(self, watermark: Watermark) -> None:
+        s = io.BytesIO()
+        np.savez(s, ids=watermark.ids, updated=watermark.updated)
+        self.fs.pipe_file(self._path(watermark.seasonId), s.getvalue())
+        self._watermarks[watermark.seasonId] = watermark
@@ -1,2 +1,5 @@
 from .extractor import Extractor
 from .preparer import Preparer
+from .decoder import ColumnarDecoder
+from .rate_limiter import RateLimiter
+from .checkpoint import CheckpointStore
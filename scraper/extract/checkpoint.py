@@ -0,0 +1,76 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, Generator, Literal, Optional
+import hashlib
+import json
+import logging
+import pickle
+
+from fsspec.implementations.local import LocalFileSystem
+from gcsfs import GCSFileSystem
+
+# these change between runs of the same extraction
+IGNORED_PARAMS = ["page", "pageSize", "since"]
+
+
+@dataclass
+class CheckpointStore:
+    """
+    Keeps the pages a Paginator has fetched so far, and a cursor of where it
+    got to, in a folder locally or in a bucket.
+
+    Pages are stored under a key made from the url and params,
+    so a rerun of the same extraction can pick up from the cursor.
+    Cursors older than `max_age` are ignored.
+    """
+
+    bucket: str
+    target: Literal["local", "gcsfs"] = "local"
+    folder: str = "checkpoints"
+    max_age: timedelta = timedelta(hours=12)
+
+    def __post_init__(self):
+        if self.target == "gcsfs":
+            self.fs = GCSFileSystem()
+        else:
+            self.fs = LocalFileSystem(auto_mkdir=True)
+
+    @staticmethod
+    def key(url: str, params: Dict[str, Any]) -> str:
+        kept = {k: v for k, v in params.items() if k not in IGNORED_PARAMS}
+        raw = json.dumps([url, kept], sort_keys=True, default=str)
+        return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+    def _path(self, key: str, name: str = "") -> str:
+        return "/".join(p for p in [self.bucket, self.folder, key, name] if p)
+
+    def load_cursor(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key, "cursor.json")
+        if not self.fs.exists(path):
+            return None
+        cursor = json.loads(self.fs.cat_file(path))
+        age = datetime.now() - datetime.fromisoformat(cursor["updatedAt"])
+        if age > self.max_age:
+            logging.info(f"Ignoring checkpoint {key} from {age} ago")
+            self.clear(key)
+            return None
+        return cursor
+
+    def load_pages(self, key: str, num_pages: int) -> Generator[Any, None, None]:
+        for i in range(num_pages):
+            yield pickle.loads(self.fs.cat_file(self._path(key, f"page-{i:05}.pkl")))
+
+    def save_page(
+        self, key: str, page_number: int, objs: Any, cursor: Dict[str, Any]
+    ) -> None:
+        # page first, so the cursor never points past what is stored
+        path = self._path(key, f"page-{page_number:05}.pkl")
+        self.fs.pipe_file(path, pickle.dumps(objs, protocol=pickle.HIGHEST_PROTOCOL))
+        cursor = {**cursor, "pages": page_number + 1}
+        cursor["updatedAt"] = datetime.now().isoformat()
+        self.fs.pipe_file(self._path(key, "cursor.json"), json.dumps(cursor).encode())
+
+    def clear(self, key: str) -> None:
+        path = self._path(key)
+        if self.fs.exists(path):
+            self.fs.rm(path, recursive=True)
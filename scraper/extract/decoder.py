@@ -0,0 +1,46 @@
+from typing import Any, Dict, List, Literal
+import pandas as pd
+import pyarrow as pa
+
+from transform.arrow_transformer import BOARD_TYPE
+
+try:
+    import orjson as json_parser
+except ImportError:
+    import json as json_parser
+
+
+class ColumnarDecoder:
+    """
+    Decodes a page of decks straight into a DataFrame,
+    keeping only the fields that the transform schema is built from.
+    With output="arrow" pages are decoded into pyarrow Tables instead,
+    for ArrowTransformer.
+    """
+
+    def __init__(
+        self,
+        schema: Dict[str, Dict[str, Any]],
+        output: Literal["pandas", "arrow"] = "pandas",
+    ):
+        self.output = output
+        fields = []
+        for column, dct in schema.items():
+            for source in dct.get("sources", [column]):
+                if source not in fields:
+                    fields.append(source)
+        self.fields = fields
+
+    def project(self, objs: List[Dict[str, Any]]) -> "pd.DataFrame | pa.Table":
+        columns = {f: [obj.get(f) for obj in objs] for f in self.fields}
+        if self.output == "arrow":
+            types = {"maindeck": BOARD_TYPE, "sideboard": BOARD_TYPE}
+            arrays = [pa.array(columns[f], type=types.get(f)) for f in self.fields]
+            return pa.Table.from_arrays(arrays, names=self.fields)
+        return pd.DataFrame(columns, columns=self.fields)
+
+    def decode(self, content: bytes) -> Any:
+        jsn = json_parser.loads(content)
+        if isinstance(jsn, dict) and isinstance(jsn.get("objects"), list):
+            jsn["objects"] = self.project(jsn["objects"])
+        return jsn
@@ -1,8 +1,13 @@
 from dataclasses import dataclass, field
-from typing import Dict, Any, List
+from typing import Callable, Dict, Any, List, Generator, Optional
 import logging
+import pandas as pd
+import pyarrow as pa
 
 from .paginator import Paginator
+from .decoder import ColumnarDecoder
+from .rate_limiter import RateLimiter
+from .checkpoint import CheckpointStore
 
 
 @dataclass
@@ -12,6 +17,12 @@ class Extractor:
     headers: Dict[str, Any] = field(default_factory=dict)
     params: Dict[str, Any] = field(default_factory=dict)
     test: bool = False
+    concurrency: int = 1
+    stop_condition: Optional[Callable[[List[Dict[str, Any]]], bool]] = None
+    adaptive: bool = False
+    decoder: Optional[ColumnarDecoder] = None
+    limiter: Optional[RateLimiter] = None
+    checkpoint: Optional[CheckpointStore] = None
 
     def __post_init__(self):
         self.paginator = Paginator(
@@ -20,14 +31,45 @@ class Extractor:
             headers=self.headers,
             params=self.params,
             test=self.test,
+            concurrency=self.concurrency,
+            stop_condition=self.stop_condition,
+            adaptive=self.adaptive,
+            decoder=self.decoder,
+            limiter=self.limiter,
+            checkpoint=self.checkpoint,
         )
 
-    def execute(self) -> List:
+    def execute(self) -> "List | pd.DataFrame | pa.Table":
+        objects = []
+        for batch in self.execute_batches():
+            objects.append(batch)
+        return self.combine(objects)
+
+    def clear_checkpoint(self) -> None:
+        self.paginator.clear_checkpoint()
+
+    @staticmethod
+    def combine(pages: list) -> "List | pd.DataFrame | pa.Table":
+        if pages and isinstance(pages[0], pd.DataFrame):
+            return pd.concat(pages, ignore_index=True)
+        if pages and isinstance(pages[0], pa.Table):
+            return pa.concat_tables(pages)
+        return [obj for page in pages for obj in page]
+
+    def execute_batches(
+        self, pages_per_batch: int = 1
+    ) -> Generator["List[Dict[str, Any]] | pd.DataFrame | pa.Table", None, None]:
+        assert pages_per_batch > 0, f"{pages_per_batch=} must be greater than 0"
         logging.info(
-            f"Start fetching data from {self.url} with {self.page_size=} and paras"
+            f"Start fetching data from {self.url} with {self.page_size=}, "
+            f"{self.concurrency=} and params"
         )
         logging.info(self.params)
-        objects = []
+        batch = []
         for res in self.paginator.execute():
-            objects.extend(res)
-        return objects
+            batch.append(res)
+            if len(batch) == pages_per_batch:
+                yield self.combine(batch)
+                batch = []
+        if batch:
+            yield self.combine(batch)
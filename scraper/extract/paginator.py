@@ -1,11 +1,21 @@
 import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
-from math import ceil, log10
-from typing import Any, Dict, List, Generator
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from math import ceil, gcd, log10
+from typing import Any, Callable, Dict, List, Generator, Optional
+import threading
 import time
 
 import logging
 
+from .rate_limiter import RateLimiter
+from .rate_controller import RateController
+from .decoder import ColumnarDecoder
+from .checkpoint import CheckpointStore
+
 WAIT_RESPONSE_CODES: List[int] = [429, 503, 504]
 
 
@@ -17,12 +27,31 @@ class Paginator:
     headers: Dict[str, Any] = field(default_factory=dict)
     params: Dict[str, Any] = field(default_factory=dict)
     test: bool = False
+    concurrency: int = 1
+    # called with each page, stops paginating once it returns True
+    stop_condition: Optional[Callable[[List[Dict[str, Any]]], bool]] = None
+    # tune request rate and page size from the responses, see RateController
+    adaptive: bool = False
+    # decodes pages into DataFrames of only the needed fields
+    decoder: Optional[ColumnarDecoder] = None
+    # pass one in to share the politeness budget with other paginators
+    limiter: Optional[RateLimiter] = None
+    # stores fetched pages so a rerun can resume where this one stopped
+    checkpoint: Optional[CheckpointStore] = None
 
     def __post_init__(self):
+        assert self.concurrency > 0, f"{self.concurrency=} must be greater than 0"
         if "page" in self.params:
             self.params.pop("page")
         if "pageSize" not in self.params:
             self.params["pageSize"] = self.page_size
+        if self.limiter is None:
+            self.limiter = RateLimiter(rate=1 / self.min_time_between_calls)
+        self.controller = RateController(self.limiter, adaptive=self.adaptive)
+        self._local = threading.local()
+        self._sessions: List[requests.Session] = []
+        self._sessions_lock = threading.Lock()
+        self.checkpoint_key = CheckpointStore.key(self.url, self.params)
 
     def get_or_retry(
         self,
@@ -35,7 +64,11 @@ class Paginator:
         assert backoff_factor > 1, f"{backoff_factor=} must be greater than 1"
         wait_time = self.min_time_between_calls
         for i in range(max_num_retries):
+            self.limiter.acquire()
+            start_time = time.perf_counter()
             response = session.get(self.url, headers=self.headers, params=params)
+            latency = time.perf_counter() - start_time
+            self.controller.record(response.status_code, latency)
             if response.status_code == 200:
                 return response
             logging.info(response.content.decode("utf-8").strip())
@@ -43,50 +76,243 @@ class Paginator:
                 return response
             if i == max_num_retries - 1:
                 break
-            time.sleep(wait_time)
+            retry_after = self.parse_retry_after(response)
+            self.limiter.backoff(max(wait_time, retry_after or 0))
             wait_time *= backoff_factor
         return response
 
+    @staticmethod
+    def parse_retry_after(response: requests.Response) -> Optional[float]:
+        value = response.headers.get("Retry-After")
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
     def print_debug_progress(self, i: int, total: int) -> None:
         s = str(i)
         num = ceil(log10(total + 1))
         s = " " * (num - len(s)) + s
         logging.info(f"Yielding object {s}/{total}")
 
+    def decode(self, response: requests.Response) -> Any:
+        if self.decoder is None:
+            return response.json()
+        return self.decoder.decode(response.content)
+
+    def should_stop(self, objs: List[Dict[str, Any]]) -> bool:
+        if self.stop_condition is None or not self.stop_condition(objs):
+            return False
+        logging.info("Stop condition met, no more pages will be fetched")
+        return True
+
+    def _worker_session(self) -> requests.Session:
+        # sessions aren't thread safe, so each worker gets its own
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+            with self._sessions_lock:
+                self._sessions.append(self._local.session)
+        return self._local.session
+
+    def fetch_page(
+        self, session: requests.Session, params: Dict[str, Any], page: int
+    ) -> List[Dict[str, Any]]:
+        response = self.get_or_retry(session, {**params, "page": page})
+        assert response.status_code == 200, response.content.decode()
+        objs = self.decode(response)["objects"]
+        self.controller.record_objects(len(objs))
+        return objs
+
+    def _fetch_page_in_worker(
+        self, params: Dict[str, Any], page: int
+    ) -> List[Dict[str, Any]]:
+        return self.fetch_page(self._worker_session(), params, page)
+
+    def _fetch_pages(
+        self, params: Dict[str, Any], pages: range
+    ) -> Generator[List[Dict[str, Any]], None, None]:
+        # keeps at most 2 * concurrency pages in flight, yielded in page order
+        max_in_flight = 2 * self.concurrency
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                futures = deque()
+                try:
+                    for page in pages:
+                        future = executor.submit(
+                            self._fetch_page_in_worker, params, page
+                        )
+                        futures.append(future)
+                        if len(futures) >= max_in_flight:
+                            yield futures.popleft().result()
+                    while futures:
+                        yield futures.popleft().result()
+                finally:
+                    for future in futures:
+                        future.cancel()
+        finally:
+            with self._sessions_lock:
+                for session in self._sessions:
+                    session.close()
+                self._sessions.clear()
+            self._local = threading.local()
+
+    def _fetch_pages_by_offset(
+        self,
+        session: requests.Session,
+        params: Dict[str, Any],
+        offset: int,
+        total: int,
+    ) -> Generator[List[Dict[str, Any]], None, None]:
+        # pages are addressed by offset so the page size can change midway
+        page_size = gcd(offset, params["pageSize"])
+        while offset < total:
+            page_size = self.controller.suggest_page_size(page_size, offset)
+            objs = self.fetch_page(
+                session, {**params, "pageSize": page_size}, offset // page_size
+            )
+            if len(objs) == 0:
+                return
+            if len(objs) < page_size and offset + len(objs) < total:
+                # the server capped the size, so the page came from
+                # page * cap instead of offset, fetch it again at the cap
+                logging.info(f"Server caps pageSize at {len(objs)}")
+                self.controller.accept_page_size(len(objs))
+                page_size = gcd(offset, len(objs))
+                continue
+            offset += len(objs)
+            yield objs
+
+    def _remaining_pages(
+        self,
+        session: requests.Session,
+        params: Dict[str, Any],
+        offset: int,
+        total: int,
+        page_length: int,
+    ) -> Generator[List[Dict[str, Any]], None, None]:
+        pages = range(offset // page_length, ceil(total / page_length))
+        if self.concurrency > 1 and offset % page_length == 0:
+            return self._fetch_pages(params, pages)
+        if "pageSize" in params:
+            return self._fetch_pages_by_offset(session, params, offset, total)
+        return (self.fetch_page(session, params, i) for i in pages)
+
+    def save_checkpoint(
+        self, page_number: int, objs: Any, cursor: Dict[str, Any]
+    ) -> None:
+        if self.checkpoint is not None:
+            self.checkpoint.save_page(self.checkpoint_key, page_number, objs, cursor)
+
+    def clear_checkpoint(self) -> None:
+        if self.checkpoint is not None:
+            self.checkpoint.clear(self.checkpoint_key)
+
     def execute(self) -> Generator[Dict[str, Any], None, None]:
         params = {**self.params}
         with requests.Session() as session:
-            response = self.get_or_retry(session, params)
-            if response.status_code != 200:
+            try:
+                yield from self._execute(session, params)
+            finally:
+                logging.info(f"Paginator stats: {self.controller.stats()}")
+
+    def _execute(
+        self, session: requests.Session, params: Dict[str, Any]
+    ) -> Generator[Dict[str, Any], None, None]:
+        cursor = None
+        if self.checkpoint is not None:
+            cursor = self.checkpoint.load_cursor(self.checkpoint_key)
+        if cursor is not None:
+            yield from self._resume(session, params, cursor)
+            return
+        response = self.get_or_retry(session, params)
+        while response.status_code != 200 and "pageSize" in params:
+            page_size = self.controller.shrink_page_size(params["pageSize"])
+            if page_size is None:
                 params.pop("pageSize")
-                response = self.get_or_retry(session, params)
-                assert response.status_code == 200, "\n" + response.content.decode()
-            jsn = response.json()
-            # expects a schema of
-            # {"page": int, "total": int, "objects": [...]}
-            check_type = isinstance(jsn, dict) and "total" in jsn and "objects" in jsn
-            if not check_type:
-                yield jsn
-                return
-            total = jsn["total"]
-            objs = jsn["objects"]
-            logging.info(f"{total} objects found")
-            total_pages = ceil(total / len(objs))
-            self.print_debug_progress(1, total_pages)
+            else:
+                logging.info(f"Retrying with pageSize={page_size}")
+                params["pageSize"] = page_size
+            response = self.get_or_retry(session, params)
+        assert response.status_code == 200, "\n" + response.content.decode()
+        jsn = self.decode(response)
+        # expects a schema of
+        # {"page": int, "total": int, "objects": [...]}
+        check_type = isinstance(jsn, dict) and "total" in jsn and "objects" in jsn
+        if not check_type:
+            yield jsn
+            return
+        total = jsn["total"]
+        objs = jsn["objects"]
+        self.controller.record_objects(len(objs))
+        logging.info(f"{total} objects found")
+        if "pageSize" in params and len(objs) < min(params["pageSize"], total):
+            # the server capped pageSize without telling us
+            params["pageSize"] = len(objs)
+            self.controller.accept_page_size(len(objs))
+        cursor = {
+            "total": total,
+            "offset": len(objs),
+            "pageSize": params.get("pageSize"),
+            "pageLength": params.get("pageSize", len(objs)),
+        }
+        self.save_checkpoint(0, objs, cursor)
+        self.print_debug_progress(1, ceil(total / len(objs)))
+        yield objs
+        if self.test or self.should_stop(objs):
+            return
+        yield from self._paginate(session, params, {**cursor, "pages": 1})
+
+    def _resume(
+        self,
+        session: requests.Session,
+        params: Dict[str, Any],
+        cursor: Dict[str, Any],
+    ) -> Generator[Dict[str, Any], None, None]:
+        logging.info(
+            f"Resuming from checkpoint after {cursor['pages']} pages, "
+            f"{cursor['offset']}/{cursor['total']} objects"
+        )
+        if cursor["pageSize"] is None:
+            params.pop("pageSize", None)
+        else:
+            params["pageSize"] = cursor["pageSize"]
+        stored_pages = self.checkpoint.load_pages(self.checkpoint_key, cursor["pages"])
+        for i, objs in enumerate(stored_pages, start=1):
+            self.controller.record_objects(len(objs))
+            self.print_debug_progress(i, cursor["pages"])
             yield objs
-            if self.test:
+            if self.should_stop(objs):
                 return
-            last_called = time.perf_counter()
-            for i in range(1, total_pages):
-                params["page"] = i
-                now = time.perf_counter()
-                diff = self.min_time_between_calls - (now - last_called)
-                if diff > 0:
-                    time.sleep(diff)
-                response = self.get_or_retry(session, params)
-                assert response.status_code == 200, response.content.decode()
-                jsn = response.json()
-                objs = jsn["objects"]
-                self.print_debug_progress(i + 1, total_pages)
+        yield from self._paginate(session, params, cursor)
+
+    def _paginate(
+        self,
+        session: requests.Session,
+        params: Dict[str, Any],
+        cursor: Dict[str, Any],
+    ) -> Generator[Dict[str, Any], None, None]:
+        total = cursor["total"]
+        offset = cursor["offset"]
+        num_pages = cursor["pages"]
+        pages = self._remaining_pages(
+            session, params, offset, total, cursor["pageLength"]
+        )
+        try:
+            for objs in pages:
+                offset += len(objs)
+                self.save_checkpoint(num_pages, objs, {**cursor, "offset": offset})
+                num_pages += 1
+                total_pages = num_pages + ceil((total - offset) / max(len(objs), 1))
+                self.print_debug_progress(num_pages, total_pages)
                 yield objs
-                last_called = time.perf_counter()
+                if self.should_stop(objs):
+                    return
+        finally:
+            pages.close()
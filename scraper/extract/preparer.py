@@ -1,13 +1,18 @@
 import json
 from dataclasses import dataclass, field
 import pandas as pd
-from datetime import datetime
+import pyarrow as pa
+import pyarrow.compute as pc
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List
 
 import logging
-from database import Database
+from database import Database, WatermarkStore
 from .extractor import Extractor
 
 SEASON_URL = "https://pennydreadfulmagic.com/api/seasoncodes"
+# leagues run for a month, decks in them are updated until it ends
+LEAGUE_LENGTH = timedelta(days=31)
 with open("headers.json") as f:
     HEADERS = json.load(f)
 
@@ -27,11 +32,46 @@ class Preparer:
     lastUpdated: datetime = field(
         init=False, default_factory=lambda: datetime.fromtimestamp(0)
     )
+    watermark_store: "WatermarkStore | None" = None
 
     @property
     def since(self) -> int:
         return int(self.lastUpdated.timestamp())
 
+    def incremental_params(self) -> Dict[str, Any]:
+        return {"sortBy": "date", "sortOrder": "DESC"}
+
+    def stop_condition(
+        self, margin: timedelta = LEAGUE_LENGTH
+    ) -> Callable[[Any], bool]:
+        """
+        Returns a check for pages sorted by date in descending order,
+        which is true once every deck on a page was created before
+        the watermark minus `margin`.
+        Pages are sorted by creation date, so the margin has to cover every
+        deck created before the watermark and updated after it,
+        e.g. league decks that keep playing matches for the whole league.
+
+        Args:
+            margin (timedelta): how far before the watermark to keep paging
+
+        Returns:
+            Callable: the check for each page, which can be a list of decks
+            or a DataFrame or Table from ColumnarDecoder
+        """
+        cutoff = self.since - int(margin.total_seconds())
+
+        def page_is_older(
+            objs: "List[Dict[str, Any]] | pd.DataFrame | pa.Table",
+        ) -> bool:
+            if isinstance(objs, pd.DataFrame):
+                return bool((objs["createdDate"] < cutoff).all())
+            if isinstance(objs, pa.Table):
+                return pc.all(pc.less(objs["createdDate"], cutoff)).as_py() is True
+            return all(obj["createdDate"] < cutoff for obj in objs)
+
+        return page_is_older
+
     def __post_init__(self):
         self.db = Database()
 
@@ -47,6 +87,23 @@ class Preparer:
         return len(season_codes)
 
     def get_last_updated(self) -> datetime:
+        last_updated = self.database_last_updated()
+        if self.watermark_store is None:
+            return last_updated
+        watermark = self.watermark_store.load(self.seasonId).max_updated
+        if watermark is None:
+            return last_updated
+        # the bucket can be ahead of the database, e.g. after a failed load
+        # or a restored database, and decks since then would never be fetched
+        if watermark > last_updated:
+            logging.warning(
+                f"Watermark of season {self.seasonId} at {watermark} is ahead of "
+                f"the database at {last_updated}, using the database"
+            )
+            return last_updated
+        return watermark
+
+    def database_last_updated(self) -> datetime:
         # first season was Eldritch moon, released on July 22, 2016
         query = """
             SELECT
@@ -0,0 +1,147 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+import threading
+import time
+
+from .rate_limiter import RateLimiter
+
+CONGESTION_RESPONSE_CODES: List[int] = [429, 503, 504]
+
+
+@dataclass
+class RateController:
+    """
+    Tunes the request rate of a RateLimiter with AIMD
+    (additive increase, multiplicative decrease), and picks page sizes.
+
+    The rate goes up by `additive_increase` calls per second after every fast
+    200 response, and is multiplied by `multiplicative_decrease` on
+    429/503/504 or when a response is `latency_tolerance` times slower than
+    the running average. Pages are halved when slower than `target_latency`
+    and doubled back towards the largest size the server accepted when
+    faster than half of it.
+
+    With `adaptive=False` nothing is tuned, but the stats are still recorded.
+    """
+
+    limiter: RateLimiter
+    adaptive: bool = False
+    # default to an eighth and twice the limiter's starting rate
+    min_rate: Optional[float] = None
+    max_rate: Optional[float] = None
+    additive_increase: float = 0.25
+    multiplicative_decrease: float = 0.5
+    latency_tolerance: float = 2.0
+    target_latency: float = 3.0
+    min_page_size: int = 50
+    smoothing: float = 0.2
+
+    def __post_init__(self):
+        assert 0 < self.multiplicative_decrease < 1
+        assert 0 < self.smoothing <= 1
+        if self.min_rate is None:
+            self.min_rate = self.limiter.rate / 8
+        if self.max_rate is None:
+            self.max_rate = self.limiter.rate * 2
+        self._lock = threading.Lock()
+        self._start_time = time.perf_counter()
+        self._latencies: List[float] = []
+        self._average_latency: Optional[float] = None
+        self._last_latency: Optional[float] = None
+        self._num_congested = 0
+        self._num_objects = 0
+        self.max_page_size: Optional[int] = None
+
+    def record(self, status_code: int, latency: float) -> None:
+        with self._lock:
+            self._latencies.append(latency)
+            self._last_latency = latency
+            congested = status_code in CONGESTION_RESPONSE_CODES
+            if status_code == 200 and self._average_latency is not None:
+                congested = latency > self.latency_tolerance * self._average_latency
+            if status_code == 200:
+                if self._average_latency is None:
+                    self._average_latency = latency
+                else:
+                    self._average_latency += self.smoothing * (
+                        latency - self._average_latency
+                    )
+            if congested:
+                self._num_congested += 1
+            if not self.adaptive:
+                return
+            if congested:
+                rate = self.limiter.rate * self.multiplicative_decrease
+            elif status_code == 200:
+                rate = self.limiter.rate + self.additive_increase
+            else:
+                return
+            self.limiter.set_rate(min(self.max_rate, max(self.min_rate, rate)))
+
+    def record_objects(self, num_objects: int) -> None:
+        with self._lock:
+            self._num_objects += num_objects
+
+    def shrink_page_size(self, page_size: int) -> Optional[int]:
+        """
+        Returns the page size to retry with after a failed request,
+        or None if pageSize should be dropped altogether.
+        """
+        if not self.adaptive or page_size // 2 < self.min_page_size:
+            return None
+        return page_size // 2
+
+    def accept_page_size(self, page_size: int) -> None:
+        if self.max_page_size is None or page_size < self.max_page_size:
+            self.max_page_size = page_size
+
+    def suggest_page_size(self, page_size: int, offset: int) -> int:
+        """
+        Returns the page size to fetch the objects starting at `offset` with.
+        Only sizes that `offset` is a multiple of are returned,
+        so the page number stays an integer.
+        """
+        with self._lock:
+            latency = self._last_latency
+        if not self.adaptive or latency is None:
+            return page_size
+        if latency > self.target_latency:
+            if page_size // 2 >= self.min_page_size:
+                self._reset_average_latency()
+                return page_size // 2
+            return page_size
+        bigger = page_size * 2
+        can_grow = self.max_page_size is None or bigger <= self.max_page_size
+        if latency < self.target_latency / 2 and can_grow and offset % bigger == 0:
+            self._reset_average_latency()
+            return bigger
+        return page_size
+
+    def _reset_average_latency(self) -> None:
+        # latency depends on page size, so the average has to start over
+        with self._lock:
+            self._average_latency = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            elapsed = time.perf_counter() - self._start_time
+            num_requests = len(latencies)
+
+            def percentile(q: float) -> Optional[float]:
+                if not latencies:
+                    return None
+                return latencies[min(num_requests - 1, int(q * num_requests))]
+
+            return {
+                "requests": num_requests,
+                "congested": self._num_congested,
+                "objects": self._num_objects,
+                "elapsed": elapsed,
+                "objectsPerSecond": self._num_objects / elapsed if elapsed else 0,
+                "latencyMean": sum(latencies) / num_requests if latencies else None,
+                "latencyP50": percentile(0.5),
+                "latencyP95": percentile(0.95),
+                "rate": self.limiter.rate,
+                "maxPageSize": self.max_page_size,
+            }
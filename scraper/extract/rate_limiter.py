@@ -0,0 +1,69 @@
+import multiprocessing
+import threading
+import time
+
+RATE, TOKENS, LAST_REFILL, BLOCKED_UNTIL = range(4)
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every worker of a Paginator.
+
+    Args:
+        rate (float): number of calls allowed per second
+        capacity (float): maximum number of calls that can burst at once
+        shared (bool): keep the bucket in shared memory, so that it can be
+            handed to worker processes and give them one budget between them
+    """
+
+    def __init__(self, rate: float, capacity: float = 1, shared: bool = False):
+        assert rate > 0, f"{rate=} must be greater than 0"
+        assert capacity >= 1, f"{capacity=} must be at least 1"
+        self.capacity = capacity
+        state = [rate, capacity, time.monotonic(), 0.0]
+        if shared:
+            self._state = multiprocessing.Array("d", state)
+            self._lock = self._state.get_lock()
+        else:
+            self._state = state
+            self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        return self._state[RATE]
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._state[LAST_REFILL]
+        tokens = self._state[TOKENS] + elapsed * self._state[RATE]
+        self._state[TOKENS] = min(self.capacity, tokens)
+        self._state[LAST_REFILL] = now
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                blocked_until = self._state[BLOCKED_UNTIL]
+                if now >= blocked_until and self._state[TOKENS] >= 1:
+                    self._state[TOKENS] -= 1
+                    return
+                wait_time = max(
+                    blocked_until - now,
+                    (1 - self._state[TOKENS]) / self._state[RATE],
+                )
+            time.sleep(wait_time)
+
+    def set_rate(self, rate: float) -> None:
+        assert rate > 0, f"{rate=} must be greater than 0"
+        with self._lock:
+            self._refill(time.monotonic())
+            self._state[RATE] = rate
+
+    def backoff(self, wait_time: float) -> None:
+        # blocks every worker, not just the one that got throttled
+        with self._lock:
+            now = time.monotonic()
+            if now + wait_time > self._state[BLOCKED_UNTIL]:
+                self._state[BLOCKED_UNTIL] = now + wait_time
+                self._state[TOKENS] = 0
+                self._state[LAST_REFILL] = now
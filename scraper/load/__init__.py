@@ -1,3 +1,6 @@
 from .parquet_writer import ParquetWriter
+from .deck_store import DeckStore
+from .partition_planner import PartitionPlan, PartitionPlanner
 from .writer import Writer
 from .load import Loader
+from .parallel_loader import ParallelLoader
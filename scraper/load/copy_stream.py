@@ -0,0 +1,182 @@
+from typing import Dict, Iterator, List, Optional
+import io
+import logging
+import struct
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+from sqlalchemy import BigInteger, Boolean, DateTime, Float, Integer, SmallInteger
+
+from database.models import Base
+
+# header of PostgreSQL's binary COPY format, followed by flags and extension length
+BINARY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+BINARY_TRAILER = struct.pack(">h", -1)
+NULL_FIELD = struct.pack(">i", -1)
+# postgres timestamps count microseconds from 2000-01-01
+POSTGRES_EPOCH_US = 946_684_800_000_000
+# numpy format of each binary type, "text" is encoded separately
+BINARY_FORMATS = {
+    "int2": ">i2",
+    "int4": ">i4",
+    "int8": ">i8",
+    "float8": ">f8",
+    "bool": "?",
+    "timestamp": ">i8",
+}
+
+
+class CopyStream(io.RawIOBase):
+    """
+    File-like object over an iterator of byte chunks, for cursor.copy_expert,
+    so only one chunk is rendered at a time.
+    Counts the bytes read through it.
+    """
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self.chunks = chunks
+        self.buffer = b""
+        self.bytes_sent = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self.buffer:
+            try:
+                self.buffer = next(self.chunks)
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self.buffer))
+        b[:n] = self.buffer[:n]
+        self.buffer = self.buffer[n:]
+        self.bytes_sent += n
+        return n
+
+
+def binary_types(table_name: str, columns: List[str]) -> Optional[Dict[str, str]]:
+    """
+    Returns the binary COPY type of each column from database/models.py,
+    or None if the table isn't a model.
+    """
+    if table_name not in Base.metadata.tables:
+        return None
+    table_columns = Base.metadata.tables[table_name].columns
+    types = {}
+    for c in columns:
+        sql_type = table_columns[c].type
+        # SmallInteger and BigInteger are subclasses of Integer
+        if isinstance(sql_type, SmallInteger):
+            types[c] = "int2"
+        elif isinstance(sql_type, BigInteger):
+            types[c] = "int8"
+        elif isinstance(sql_type, Integer):
+            types[c] = "int4"
+        elif isinstance(sql_type, Float):
+            types[c] = "float8"
+        elif isinstance(sql_type, Boolean):
+            types[c] = "bool"
+        elif isinstance(sql_type, DateTime):
+            types[c] = "timestamp"
+        else:
+            # String, and Enum as its label
+            types[c] = "text"
+    return types
+
+
+def _slices(
+    df: "pd.DataFrame | pa.Table", chunk_rows: int
+) -> Iterator["pd.DataFrame | pa.Table"]:
+    for start in range(0, len(df), chunk_rows):
+        if isinstance(df, pa.Table):
+            yield df.slice(start, chunk_rows)
+        else:
+            yield df.iloc[start : start + chunk_rows]
+
+
+def csv_chunks(df: "pd.DataFrame | pa.Table", chunk_rows: int) -> Iterator[bytes]:
+    for chunk in _slices(df, chunk_rows):
+        if isinstance(chunk, pd.DataFrame):
+            yield chunk.to_csv(header=False, index=False).encode("utf-8")
+            continue
+        # postgres timestamps only go down to microseconds
+        for i, field in enumerate(chunk.schema):
+            if pa.types.is_timestamp(field.type) and field.type.unit == "ns":
+                column = pc.cast(chunk[i], pa.timestamp("us"), safe=False)
+                chunk = chunk.set_column(i, field.name, column)
+        s = io.BytesIO()
+        pa_csv.write_csv(chunk, s, pa_csv.WriteOptions(include_header=False))
+        yield s.getvalue()
+
+
+def _encode_column(column: pd.Series, pg_type: str) -> List[bytes]:
+    """
+    Returns every value of the column as a binary COPY field,
+    its int32 length followed by its bytes.
+    """
+    isna = column.isna().to_numpy()
+    if pg_type == "text":
+        fields = []
+        for value, missing in zip(column.astype(object).to_numpy(), isna):
+            if missing:
+                fields.append(NULL_FIELD)
+                continue
+            data = str(value).encode("utf-8")
+            fields.append(struct.pack(">i", len(data)) + data)
+        return fields
+    if pg_type == "timestamp":
+        ns = column.to_numpy(dtype="datetime64[ns]").view(np.int64)
+        values = ns // 1000 - POSTGRES_EPOCH_US
+    else:
+        values = column.to_numpy(dtype=object)
+        values[isna] = 0
+    fmt = BINARY_FORMATS[pg_type]
+    arr = np.empty(len(column), dtype=[("length", ">i4"), ("value", fmt)])
+    arr["length"] = np.dtype(fmt).itemsize
+    arr["value"] = values
+    width = arr.dtype.itemsize
+    raw = arr.tobytes()
+    fields = [raw[i : i + width] for i in range(0, len(raw), width)]
+    for i in np.flatnonzero(isna):
+        fields[i] = NULL_FIELD
+    return fields
+
+
+def binary_chunks(
+    df: "pd.DataFrame | pa.Table", types: Dict[str, str], chunk_rows: int
+) -> Iterator[bytes]:
+    """
+    Renders rows in PostgreSQL's binary COPY format, so there's no quoting
+    or escaping of text and no parsing of numbers on the server.
+    """
+    columns = list(types.keys())
+    tuple_header = struct.pack(">h", len(columns))
+    yield BINARY_SIGNATURE
+    for chunk in _slices(df, chunk_rows):
+        if isinstance(chunk, pa.Table):
+            chunk = chunk.to_pandas()
+        encoded = [_encode_column(chunk[c], types[c]) for c in columns]
+        yield b"".join(tuple_header + b"".join(fields) for fields in zip(*encoded))
+    yield BINARY_TRAILER
+
+
+def copy_stream(
+    df: "pd.DataFrame | pa.Table",
+    table_name: str,
+    columns: List[str],
+    copy_format: str = "csv",
+    chunk_rows: int = 10000,
+) -> "tuple[CopyStream, str]":
+    """
+    Returns a stream of the rows to COPY and the format it's in,
+    which falls back to csv for tables that aren't in database/models.py.
+    """
+    if copy_format == "binary":
+        types = binary_types(table_name, columns)
+        if types is not None:
+            return CopyStream(binary_chunks(df, types, chunk_rows)), "binary"
+        logging.warning(f"No model for {table_name}, copying as csv")
+    return CopyStream(csv_chunks(df, chunk_rows)), "csv"
@@ -1,19 +1,38 @@
 import re
 import pandas as pd
+import pyarrow as pa
+import psycopg2
 import logging
-import io
-from typing import Literal
+import weakref
+from typing import Dict, Literal, Set, Tuple
 from time import perf_counter
 
 from database import Database
 from .writer import Writer
+from .copy_stream import CopyStream, copy_stream
+
+# temp tables already created on each connection, they last for its session
+_TEMP_TABLES: "weakref.WeakKeyDictionary[psycopg2.connection, Set[str]]" = (
+    weakref.WeakKeyDictionary()
+)
+# COPY and INSERT statements by table, columns, conflict mode and copy format
+_SQL_CACHE: Dict[tuple, Tuple[str, str]] = {}
 
 
 class DatabaseWriter(Writer):
-    def __init__(self, table_name: str, include_id: bool = True) -> None:
+    def __init__(
+        self,
+        table_name: str,
+        include_id: bool = True,
+        copy_format: Literal["csv", "binary"] = "csv",
+        chunk_rows: int = 10000,
+    ) -> None:
         self.table_name = table_name
         self.include_id = include_id
+        self.copy_format = copy_format
+        self.chunk_rows = chunk_rows
         self.database = Database()
+        self._stats: Dict[str, float] = {}
 
     @property
     def temp_table_name(self) -> str:
@@ -31,27 +50,39 @@ class DatabaseWriter(Writer):
         lines = sql.strip().split("\n")
         logging.info("\n" + "\n".join("\t" + l.strip() for l in lines))
 
-    def _pipe_to_io(self, df: pd.DataFrame) -> io.StringIO:
-        s = io.StringIO()
-        df.to_csv(s, header=False, index=False, encoding="utf-8")
-        s.seek(0)
-        return s
+    def _pipe_to_io(
+        self, df: "pd.DataFrame | pa.Table", columns: list[str]
+    ) -> "tuple[CopyStream, str]":
+        return copy_stream(
+            df, self.table_name, columns, self.copy_format, self.chunk_rows
+        )
 
-    def _generate_copy_sql(self, columns: list[str], table: str) -> str:
+    def stats(self) -> Dict[str, float]:
+        """
+        Rows, bytes and throughput of the last execute.
+        """
+        return dict(self._stats)
+
+    def _generate_copy_sql(
+        self, columns: list[str], table: str, copy_format: str = "csv"
+    ) -> str:
         fixed_columns = self.fix_columns(columns)
+        with_format = "(FORMAT binary)" if copy_format == "binary" else "CSV"
         sql = f"""
             COPY {table} 
             ({', '.join(fixed_columns)})
-            FROM STDIN WITH CSV;
+            FROM STDIN WITH {with_format};
             """
         return sql
 
-    def _generate_insert_sql(self, columns: list[str], on_conflict_update: bool) -> str:
+    def _generate_insert_sql(
+        self, columns: list[str], on_conflict_update: bool, source: "str | None" = None
+    ) -> str:
         fixed_all_columns = self.fix_columns(columns)
         fixed_all_cols_str = ", ".join(fixed_all_columns)
         insert_sql = f"""
             INSERT INTO {self.table_name}  ({fixed_all_cols_str})
-            SELECT {fixed_all_cols_str} FROM {self.temp_table_name}
+            SELECT {fixed_all_cols_str} FROM {source or self.temp_table_name}
             ON CONFLICT ("id") """
         if on_conflict_update:
             rest_columns = self.fix_columns([c for c in columns if c != "id"])
@@ -63,71 +94,206 @@ class DatabaseWriter(Writer):
         # insert_sql += "\nRETURNING id;"
         return insert_sql
 
-    def execute(
-        self,
-        df: pd.DataFrame,
-        *,
-        inside_transaction: bool = False,
-        on_conflict: Literal["error", "ignore", "update"] = "ignore",
-    ) -> bool:
-        logging.info(df.shape)
-        columns = df.columns.tolist()
-        if self.include_id:
-            assert "id" in columns, f'"id" not in {columns=}'
+    def _statements(
+        self, columns: list[str], on_conflict: str, copy_format: str
+    ) -> Tuple[str, str]:
+        key = (self.table_name, tuple(columns), on_conflict, copy_format)
+        if key not in _SQL_CACHE:
+            table = self.table_name if on_conflict == "error" else self.temp_table_name
+            _SQL_CACHE[key] = (
+                self._generate_copy_sql(columns, table, copy_format),
+                self._generate_insert_sql(columns, on_conflict == "update"),
+            )
+        return _SQL_CACHE[key]
 
-        # yugabyte db doesn't support ON COMMIT DROP >:(
-        create_temp_table_sql = f"""
-            DROP TABLE IF EXISTS {self.temp_table_name};
-            CREATE TEMP TABLE {self.temp_table_name}
-            (LIKE {self.table_name});
+    def _prepare_temp_table(self, conn, cursor) -> bool:
         """
+        Empties this table's temp table, creating it if it's new to `conn`.
+        Returns whether it was created.
+        """
+        # yugabyte db doesn't support ON COMMIT DROP >:(
+        # so the temp table is kept for the session and emptied before each use
+        if self.temp_table_name in _TEMP_TABLES.get(conn, set()):
+            sql = f"TRUNCATE {self.temp_table_name};"
+            created = False
+        else:
+            sql = f"""
+                CREATE TEMP TABLE IF NOT EXISTS {self.temp_table_name}
+                (LIKE {self.table_name});
+                TRUNCATE {self.temp_table_name};
+            """
+            created = True
+        self.print_sql(sql)
+        cursor.execute(sql)
+        return created
 
-        table = self.table_name if on_conflict == "error" else self.temp_table_name
-        copy_sql = self._generate_copy_sql(columns, table)
+    @staticmethod
+    def forget_temp_tables(conn) -> None:
+        # after a rollback, temp tables created in that transaction are gone
+        _TEMP_TABLES.pop(conn, None)
 
-        insert_sql = self._generate_insert_sql(columns, on_conflict == "update")
+    @staticmethod
+    def columns_of(df: "pd.DataFrame | pa.Table") -> list[str]:
+        if isinstance(df, pa.Table):
+            return df.column_names
+        return df.columns.tolist()
 
-        def main_logic(cursor):
-            # default executemany is just running loop under the hood
-            # so very slow
-            if on_conflict != "error":
-                self.print_sql(create_temp_table_sql)
-                cursor.execute(create_temp_table_sql)
+    def stage(
+        self,
+        conn: "psycopg2.connection",
+        df: "pd.DataFrame | pa.Table",
+        stage_table: str,
+    ) -> None:
+        """
+        Copies df into a new table shaped like this one, and commits,
+        so it can be merged into the real table later on another connection.
+        Unlike temp tables, the staging table outlives the connection.
+        """
+        columns = self.columns_of(df)
+        # LIKE would copy NOT NULL of columns that aren't copied, e.g. serial ids
+        create_sql = f"""
+            DROP TABLE IF EXISTS {stage_table};
+            CREATE TABLE {stage_table} AS
+            SELECT {', '.join(self.fix_columns(columns))} FROM {self.table_name}
+            WITH NO DATA;
+        """
+        s, copy_format = self._pipe_to_io(df, columns)
+        copy_sql = self._generate_copy_sql(columns, stage_table, copy_format)
+        self._stats = {}
+        start_time = perf_counter()
+        try:
+            with conn.cursor() as cursor:
+                self.print_sql(create_sql)
+                cursor.execute(create_sql)
                 self.print_sql(copy_sql)
-            s = self._pipe_to_io(df)
-            cursor.copy_expert(copy_sql, s)
-            if on_conflict == "error":
-                return
-            check_sql = f"""SELECT count(1) FROM {self.temp_table_name};"""
-            self.print_sql(check_sql)
-            cursor.execute(check_sql)
+                cursor.copy_expert(copy_sql, s)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise e
+        finally:
+            elapsed = perf_counter() - start_time or float("inf")
+            self._stats.update(
+                {
+                    "rows": len(df),
+                    "bytes": s.bytes_sent,
+                    "seconds": elapsed,
+                    "rowsPerSecond": len(df) / elapsed,
+                    "bytesPerSecond": s.bytes_sent / elapsed,
+                }
+            )
+            logging.info(
+                f"Staging {len(df)} rows of {self.table_name} in {stage_table} "
+                f"took {elapsed:.2f} seconds, sent {s.bytes_sent} bytes"
+            )
+
+    def _copy(
+        self, cursor, s: CopyStream, copy_sql: str, on_conflict: str, num_rows: int
+    ) -> None:
+        self.print_sql(copy_sql)
+        copy_start = perf_counter()
+        cursor.copy_expert(copy_sql, s)
+        self._stats["copySeconds"] = perf_counter() - copy_start
+        # COPY reports how many rows it wrote, older servers may not
+        num_copied_rows = cursor.rowcount
+        if num_copied_rows < 0 and on_conflict != "error":
+            cursor.execute(f"SELECT count(1) FROM {self.temp_table_name};")
             num_copied_rows = cursor.fetchone()[0]
-            if num_copied_rows != len(df):
-                raise ValueError(f"{num_copied_rows=} != {len(df)=}")
+        if num_copied_rows >= 0 and num_copied_rows != num_rows:
+            raise ValueError(f"{num_copied_rows=} != {num_rows=}")
+
+    def _write(
+        self,
+        conn,
+        cursor,
+        s: CopyStream,
+        statements: Tuple[str, str],
+        on_conflict: str,
+        num_rows: int,
+    ) -> bool:
+        """
+        Copies the rows straight into the table with on_conflict="error",
+        otherwise into the temp table and from there into the table.
+        Returns whether the temp table was created.
+        """
+        # default executemany is just running loop under the hood
+        # so very slow
+        copy_sql, insert_sql = statements
+        created = False
+        if on_conflict != "error":
+            created = self._prepare_temp_table(conn, cursor)
+        self._copy(cursor, s, copy_sql, on_conflict, num_rows)
+        if on_conflict != "error":
             self.print_sql(insert_sql)
             cursor.execute(insert_sql)
+        return created
+
+    def _remember_temp_table(self, conn, created: bool, committed: bool) -> None:
+        # only committed temp tables survive a later rollback
+        if created and committed:
+            _TEMP_TABLES.setdefault(conn, set()).add(self.temp_table_name)
 
+    def _log_stats(
+        self, num_rows: int, s: CopyStream, copy_format: str, start_time: float
+    ) -> None:
+        elapsed = perf_counter() - start_time
+        copy_seconds = self._stats.get("copySeconds", elapsed) or float("inf")
+        self._stats.update(
+            {
+                "rows": num_rows,
+                "bytes": s.bytes_sent,
+                "seconds": elapsed,
+                "rowsPerSecond": num_rows / copy_seconds,
+                "bytesPerSecond": s.bytes_sent / copy_seconds,
+            }
+        )
+        logging.info(
+            f"Writing {num_rows} rows to {self.table_name} "
+            f"took {elapsed:.2f} seconds, sent {s.bytes_sent} bytes as "
+            f"{copy_format} at {self._stats['rowsPerSecond']:.0f} rows/s"
+        )
+
+    def execute(
+        self,
+        df: "pd.DataFrame | pa.Table",
+        *,
+        inside_transaction: bool = False,
+        commit: bool = True,
+        on_conflict: Literal["error", "ignore", "update"] = "ignore",
+    ) -> bool:
+        logging.info(df.shape)
+        columns = self.columns_of(df)
+        if self.include_id:
+            assert "id" in columns, f'"id" not in {columns=}'
+
+        s, copy_format = self._pipe_to_io(df, columns)
+        statements = self._statements(columns, on_conflict, copy_format)
         conn = self.database.connection()
+        self._stats = {}
         start_time = perf_counter()
         try:
             if inside_transaction:
                 with conn.cursor() as cur:
-                    main_logic(cur)
+                    created = self._write(
+                        conn, cur, s, statements, on_conflict, len(df)
+                    )
+                # the caller may commit later, with more in the transaction
+                if commit:
                     conn.commit()
             else:
                 with conn:
                     with conn.cursor() as cur:
-                        main_logic(cur)
+                        created = self._write(
+                            conn, cur, s, statements, on_conflict, len(df)
+                        )
                         conn.commit()
+            self._remember_temp_table(conn, created, commit or not inside_transaction)
             return True
         except Exception as e:
             if inside_transaction:
                 conn.rollback()
-            logging.error(e.pgerror)
+            self.forget_temp_tables(conn)
+            logging.error(getattr(e, "pgerror", e))
             raise e
         finally:
-            end_time = perf_counter()
-            logging.info(
-                f"Writing {len(df)} rows to {self.table_name} "
-                f"took {end_time - start_time:.2f} seconds"
-            )
+            self._log_stats(len(df), s, copy_format, start_time)
@@ -0,0 +1,260 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterator, List, Literal, Optional
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+from fsspec import AbstractFileSystem
+from fsspec.implementations.local import LocalFileSystem
+from gcsfs import GCSFileSystem
+
+from transform.decklists import BOARDS
+from .manifest import STATS_COLUMN, Manifest, latest_per_id, partition_values
+from .partition_planner import BUCKET_COLUMN, bucket_of
+
+
+@dataclass
+class DeckStore:
+    """
+    Reads decks written by ParquetWriter back, locally or from a bucket.
+
+    Filters on season, archetype, source and creation date are pushed down:
+    files are picked from the manifest by partition folder, hash bucket and
+    updatedDatetime range without listing the bucket, and the rest is left to
+    the row group statistics of the files that are read.
+    The nested decklists are only read when asked for in `columns`.
+    Decks written by several runs are returned once, as their latest version.
+    """
+
+    bucket: str
+    target: Literal["local", "gcsfs"] = "local"
+    filename: str = "decks.parquet"
+    batch_size: int = 64 * 1024
+    # the filesystem the ParquetWriter was given, if any
+    fs: Optional[AbstractFileSystem] = None
+
+    def __post_init__(self):
+        if self.fs is None and self.target == "gcsfs":
+            self.fs = GCSFileSystem()
+        elif self.fs is None:
+            self.fs = LocalFileSystem()
+        if self.target == "local":
+            self.root = os.path.join(self.bucket, self.filename)
+        else:
+            self.root = self.fs.sep.join([self.bucket, self.filename])
+
+    def manifest(self) -> Optional[Manifest]:
+        path = "/".join([self.root, Manifest.FILENAME])
+        if not self.fs.exists(path):
+            return None
+        return Manifest.from_json(self.fs.cat_file(path))
+
+    @staticmethod
+    def _filters(
+        seasons: Optional[List[int]],
+        archetypes: Optional[List[int]],
+        sources: Optional[List[str]],
+    ) -> Dict[str, List]:
+        filters: Dict[str, List] = {}
+        if seasons is not None:
+            filters["seasonId"] = list(seasons)
+        if archetypes is not None:
+            filters["archetypeId"] = list(archetypes)
+        if sources is not None:
+            filters["sourceName"] = list(sources)
+        return filters
+
+    @staticmethod
+    def _expression(
+        filters: Dict[str, List],
+        since: Optional[datetime],
+        until: Optional[datetime],
+    ) -> Optional[ds.Expression]:
+        expression = None
+        parts = [ds.field(c).isin(values) for c, values in filters.items()]
+        if since is not None:
+            parts.append(ds.field("createdDatetime") >= pa.scalar(since))
+        if until is not None:
+            parts.append(ds.field("createdDatetime") < pa.scalar(until))
+        for part in parts:
+            expression = part if expression is None else expression & part
+        return expression
+
+    def files(
+        self,
+        manifest: Manifest,
+        filters: Dict[str, List],
+        since: Optional[datetime] = None,
+    ) -> List[str]:
+        """
+        Returns the files of the manifest that may have rows matching the
+        filters, relative to the dataset.
+        """
+        wanted = {c: {str(v) for v in values} for c, values in filters.items()}
+        bucket_col = (manifest.bucket_cols or [None])[0]
+        if bucket_col in filters:
+            frame = pd.DataFrame({bucket_col: filters[bucket_col]})
+            buckets = bucket_of(frame, [bucket_col], manifest.num_buckets)
+            wanted[BUCKET_COLUMN] = {str(b) for b in buckets}
+        # decks are created before they're updated,
+        # so files last updated before `since` only have older decks
+        since_string = None if since is None else since.isoformat()
+        paths = []
+        for partition, files in manifest.partitions.items():
+            values = partition_values(partition)
+            if any(values[c] not in wanted[c] for c in values if c in wanted):
+                continue
+            for f in files:
+                max_updated = f["maxUpdatedDatetime"]
+                if since_string and max_updated and max_updated < since_string:
+                    continue
+                paths.append(f["path"])
+        return paths
+
+    def dataset(
+        self, filters: Dict[str, List], since: Optional[datetime] = None
+    ) -> ds.Dataset:
+        manifest = self.manifest()
+        if manifest is None:
+            # pyarrow prunes partition folders itself, after listing them
+            return ds.dataset(
+                self.root, filesystem=self.fs, format="parquet", partitioning="hive"
+            )
+        paths = self.files(manifest, filters, since)
+        logging.info(
+            f"Reading {len(paths)} of {len(manifest.files())} files of {self.root}"
+        )
+        if not paths and manifest.partitions:
+            # one file for the schema, the filters leave none of its rows
+            paths = [manifest.files()[0]["path"]]
+        return ds.dataset(
+            ["/".join([self.root, p]) for p in paths],
+            filesystem=self.fs,
+            format="parquet",
+            partitioning="hive",
+            partition_base_dir=self.root,
+        )
+
+    def scanner(
+        self,
+        columns: Optional[List[str]] = None,
+        seasons: Optional[List[int]] = None,
+        archetypes: Optional[List[int]] = None,
+        sources: Optional[List[str]] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> ds.Scanner:
+        """
+        Plans a read of the decks matching every filter given.
+
+        Args:
+            columns (Optional[List[str]]): columns to read,
+                all but the decklists by default
+            seasons (Optional[List[int]]): seasonIds to read
+            archetypes (Optional[List[int]]): archetypeIds to read
+            sources (Optional[List[str]]): sourceNames to read
+            since (Optional[datetime]): earliest createdDatetime, inclusive
+            until (Optional[datetime]): latest createdDatetime, exclusive
+
+        Returns:
+            ds.Scanner: reads nothing until its batches are iterated
+        """
+        filters = self._filters(seasons, archetypes, sources)
+        dataset = self.dataset(filters, since)
+        if columns is None:
+            columns = [c for c in dataset.schema.names if c not in BOARDS]
+        # bucket folders are an artifact of the layout, not a column of decks
+        columns = [c for c in columns if c != BUCKET_COLUMN]
+        return dataset.scanner(
+            columns=columns,
+            filter=self._expression(filters, since, until),
+            batch_size=self.batch_size,
+        )
+
+    @staticmethod
+    def _with_versions(columns: Optional[List[str]]) -> Optional[List[str]]:
+        # id and updatedDatetime are needed to tell versions of a deck apart
+        if columns is None:
+            return None
+        return list(columns) + [c for c in ["id", STATS_COLUMN] if c not in columns]
+
+    @staticmethod
+    def _selected(
+        table: "pa.Table | pa.RecordBatch", columns: Optional[List[str]]
+    ) -> "pa.Table | pa.RecordBatch":
+        if columns is None:
+            return table
+        columns = [c for c in columns if c != BUCKET_COLUMN]
+        # RecordBatch.select is only in newer pyarrow
+        return type(table).from_arrays([table[c] for c in columns], names=columns)
+
+    def _latest_versions(self, **filters) -> Optional[pd.Series]:
+        """
+        Returns the updatedDatetime of the latest version of each deck, by id,
+        over the whole of the seasons asked for: a deck that moved to another
+        archetype has its old version left in the old archetype's files.
+        createdDatetime doesn't change between versions, so since and until
+        are kept.
+        """
+        season_filters = {
+            k: v for k, v in filters.items() if k not in ["archetypes", "sources"]
+        }
+        scanner = self.scanner(["id", STATS_COLUMN], **season_filters)
+        if "id" not in scanner.projected_schema.names:
+            return None
+        table = latest_per_id(scanner.to_table())
+        return pd.Series(
+            pc.cast(table[STATS_COLUMN], pa.int64()).to_numpy(),
+            index=table["id"].to_numpy(),
+        )
+
+    @staticmethod
+    def _keep_latest(
+        table: "pa.Table | pa.RecordBatch", latest: pd.Series, emitted: np.ndarray
+    ) -> "pa.Table | pa.RecordBatch":
+        # emitted marks the decks already returned, by position in latest
+        pos = latest.index.get_indexer(table["id"].to_numpy())
+        updated = pc.cast(table[STATS_COLUMN], pa.int64()).to_numpy()
+        is_latest = (pos >= 0) & (updated == latest.to_numpy()[pos])
+        keep = np.flatnonzero(is_latest & ~emitted[pos])
+        # the same version may have been written twice
+        _, first = np.unique(pos[keep], return_index=True)
+        keep = np.sort(keep[first])
+        emitted[pos[keep]] = True
+        return table.take(pa.array(keep))
+
+    def batches(
+        self, columns: Optional[List[str]] = None, as_pandas: bool = False, **filters
+    ) -> Iterator["pa.RecordBatch | pd.DataFrame"]:
+        """
+        Yields the decks matching `filters`, see scanner, `batch_size` rows
+        at a time as pyarrow RecordBatches, or DataFrames with `as_pandas`.
+        A first pass over ids and updatedDatetimes finds the latest version
+        of each deck, the second only yields those.
+        """
+        latest = self._latest_versions(**filters)
+        if latest is not None:
+            emitted = np.zeros(len(latest), dtype=bool)
+        for batch in self.scanner(self._with_versions(columns), **filters).to_batches():
+            if latest is not None and batch.num_rows > 0:
+                batch = self._keep_latest(batch, latest, emitted)
+            if batch.num_rows == 0:
+                continue
+            batch = self._selected(batch, columns)
+            yield batch.to_pandas() if as_pandas else batch
+
+    def to_table(self, columns: Optional[List[str]] = None, **filters) -> pa.Table:
+        latest = self._latest_versions(**filters)
+        table = self.scanner(self._with_versions(columns), **filters).to_table()
+        if latest is not None:
+            emitted = np.zeros(len(latest), dtype=bool)
+            table = self._keep_latest(table, latest, emitted)
+        return self._selected(table, columns)
+
+    def to_pandas(self, columns: Optional[List[str]] = None, **filters) -> pd.DataFrame:
+        return self.to_table(columns, **filters).to_pandas()
@@ -1,60 +1,384 @@
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 from database.database import Database
+from database.watermark import Watermark, WatermarkStore
+from transform.decklists import BOARDS, Decklists
 from .database_writer import DatabaseWriter
 import logging
+import uuid
+from time import perf_counter
+from typing import Literal
 
 
 class Loader:
-    def __init__(self) -> None:
-        pass
+    def __init__(
+        self,
+        watermark_store: "WatermarkStore | None" = None,
+        copy_format: Literal["csv", "binary"] = "csv",
+        server_delta: bool = False,
+        chunk_rows: "int | None" = None,
+    ) -> None:
+        # without a store, watermarks are rebuilt from the database
+        # once per season and kept for the lifetime of the loader
+        self.watermark_store = watermark_store
+        # with server_delta, changed decks are found by the database
+        # from the staged ids instead of from a watermark
+        self.server_delta = server_delta
+        self._watermarks: "dict[int, Watermark]" = {}
+        self.copy_format = copy_format
+        # stats of the last write to each table, see DatabaseWriter.stats
+        self.write_stats: "dict[str, dict[str, float]]" = {}
+        # with chunk_rows, decks and their cards are committed
+        # chunk_rows decks at a time, see write_chunked
+        self.chunk_rows = chunk_rows
+        self.chunk_stats: "list[dict[str, float]]" = []
+        # suffixed so concurrent runs, e.g. of backfill, don't share the ids
+        # they stage, it's a real table so ParallelLoader's connections see it,
+        # dropped at the end of every execute
+        self.deck_ids_table = f"temp_deck_ids_{uuid.uuid4().hex[:8]}"
 
-    def execute(self, df: pd.DataFrame) -> None:
+    def writer(self, table_name: str, include_id: bool = True) -> DatabaseWriter:
+        return DatabaseWriter(table_name, include_id, copy_format=self.copy_format)
+
+    def _record(self, writer: DatabaseWriter) -> None:
+        self.write_stats[writer.table_name] = writer.stats()
+
+    def execute(
+        self, df: "pd.DataFrame | pa.Table", decklists: "Decklists | None" = None
+    ) -> None:
+        try:
+            self._execute(df, decklists)
+        except Exception as e:
+            # so the staged ids can still be dropped on this connection
+            Database.common_connection().rollback()
+            raise e
+        finally:
+            # it's a real table, failed runs would leave theirs behind
+            self.drop_staged_deck_ids()
+
+    def _execute(
+        self, df: "pd.DataFrame | pa.Table", decklists: "Decklists | None"
+    ) -> None:
         print(f"Originally have {len(df)} rows")
-        df = self.pre_filter(df)
+        if decklists is None:
+            decklists = Decklists.build(df)
+        if self.server_delta:
+            keep = self.changed_rows_on_server(df)
+        else:
+            keep = self.changed_rows(df)
+        df = self._take(df, keep)
+        decklists = decklists.take(keep)
         print(f"Filtered to {len(df)} rows")
+        if len(df) == 0:
+            return
+        if not self.server_delta:
+            self.stage_deck_ids(df)
+        board_rows = self.changed_decklist_rows(df)
+        print(f"Rewriting the cards of {len(board_rows)} decks")
+        if isinstance(df, pa.Table):
+            df_dict = self.split_table(df, decklists, board_rows)
+        else:
+            df_dict = self.split_frame(df, decklists, board_rows)
+        self.write(df_dict)
+        if self.watermark_store is not None or not self.server_delta:
+            self.update_watermark(df)
 
+    @staticmethod
+    def split_frame(
+        df: pd.DataFrame,
+        decklists: Decklists,
+        board_rows: "np.ndarray | None" = None,
+    ) -> "dict[str, pd.DataFrame]":
+        df_dict = {}
         people_df = df[["personId", "person"]].drop_duplicates()
         people_df.columns = ["id", "name"]
+        df_dict["people"] = people_df
         archetypes_df = df[["archetypeId", "archetypeName"]].drop_duplicates()
         archetypes_df.columns = ["id", "archetype"]
-        DatabaseWriter("people").execute(people_df)
-        DatabaseWriter("archetypes").execute(archetypes_df)
+        df_dict["archetypes"] = archetypes_df
 
-        decks_df = df.drop(columns=["maindeck", "sideboard", "person", "archetypeName"])
+        decks_df = df.drop(columns=["person", "archetypeName"])
+        decks_df = decks_df.drop(columns=[c for c in BOARDS if c in df.columns])
         decks_df.to_csv("decks.csv", index=False)
+        df_dict["decks"] = decks_df
+
+        # only the cards of board_rows are written, all of them by default
+        if board_rows is not None:
+            decklists = decklists.take(board_rows)
+        else:
+            board_rows = np.arange(len(df))
+        deck_ids = df["id"].to_numpy()[board_rows]
+        for board in BOARDS:
+            df_dict[f"{board}s"] = decklists.to_frame(board, deck_ids)
+        return df_dict
 
+    @staticmethod
+    def split_table(
+        table: pa.Table,
+        decklists: Decklists,
+        board_rows: "np.ndarray | None" = None,
+    ) -> "dict[str, pa.Table]":
+        # same tables as split_frame, without leaving arrow
         df_dict = {}
-        for board in ["maindeck", "sideboard"]:
-            cards_df = df[["id", board]].explode(board)
-            # [] explodes to nan, so have to drop them
-            cards_df = cards_df.dropna(subset=[board]).reset_index(drop=True)
-            board_df = pd.DataFrame(cards_df[board].values.tolist())
-            cards_df = pd.concat([cards_df, board_df], axis=1)
-            df_dict[f"{board}s"] = cards_df.drop(columns=board)
-            df_dict[f"{board}s"].columns = ["deckId", "n", "name"]
+        for name, columns, new_columns in [
+            ("people", ["personId", "person"], ["id", "name"]),
+            ("archetypes", ["archetypeId", "archetypeName"], ["id", "archetype"]),
+        ]:
+            _table = table.select(columns)
+            for i, field in enumerate(_table.schema):
+                if pa.types.is_dictionary(field.type):
+                    column = pc.cast(_table[i], pa.string())
+                    _table = _table.set_column(i, field.name, column)
+            _table = _table.group_by(columns).aggregate([]).select(columns)
+            df_dict[name] = _table.rename_columns(new_columns)
+        dropped = ["person", "archetypeName"]
+        dropped += [c for c in BOARDS if c in table.column_names]
+        df_dict["decks"] = table.drop(dropped)
+        # only the cards of board_rows are written, all of them by default
+        if board_rows is not None:
+            decklists = decklists.take(board_rows)
+        else:
+            board_rows = np.arange(len(table))
+        deck_ids = table["id"].to_numpy()[board_rows]
+        for board in BOARDS:
+            df_dict[f"{board}s"] = decklists.to_table(board, deck_ids)
+        return df_dict
 
+    def stage_deck_ids(self, df: "pd.DataFrame | pa.Table") -> None:
+        """
+        Copies the ids, updatedDatetimes and decklistHashes of the decks
+        about to be loaded into deck_ids_table.
+        """
         common_connection = Database.common_connection()
-        with common_connection:
-            with common_connection.cursor() as cursor:
-                cursor.execute(
-                    """
-                    DROP TABLE IF EXISTS temp_deck_ids;
-                    CREATE TABLE temp_deck_ids (id INTEGER PRIMARY KEY);
-                    """
+        with common_connection.cursor() as cursor:
+            cursor.execute(f"""
+                DROP TABLE IF EXISTS {self.deck_ids_table};
+                CREATE TABLE {self.deck_ids_table} (
+                    id INTEGER PRIMARY KEY,
+                    "updatedDatetime" TIMESTAMP,
+                    "decklistHash" VARCHAR(64)
+                );
+                """)
+            common_connection.commit()
+        ids, updated = self._watermark_arrays(df)
+        staged_df = pd.DataFrame(
+            {"id": ids, "updatedDatetime": updated.astype("datetime64[ns]")}
+        )
+        if "decklistHash" in DatabaseWriter.columns_of(df):
+            staged_df["decklistHash"] = df["decklistHash"].to_numpy()
+        writer = DatabaseWriter(self.deck_ids_table)
+        writer.execute(staged_df, inside_transaction=True, on_conflict="error")
+        # under one name, whatever the run's suffix
+        self.write_stats["temp_deck_ids"] = writer.stats()
+
+    def drop_staged_deck_ids(self) -> None:
+        common_connection = Database.common_connection()
+        with common_connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {self.deck_ids_table};")
+        common_connection.commit()
+
+    def changed_decklist_rows(self, df: "pd.DataFrame | pa.Table") -> np.ndarray:
+        """
+        Returns the positions of the staged decks whose cards need rewriting,
+        i.e. new decks and decks whose decklistHash changed,
+        and leaves only those in deck_ids_table.
+        Other updates, like league results, only touch the decks table.
+        """
+        if "decklistHash" not in DatabaseWriter.columns_of(df):
+            return np.arange(len(df))
+        common_connection = Database.common_connection()
+        sql = f"""
+            DELETE FROM {self.deck_ids_table} AS t USING decks AS d
+            WHERE d.id = t.id AND d."decklistHash" = t."decklistHash"
+            RETURNING t.id;
+            """
+        with common_connection.cursor() as cursor:
+            cursor.execute(sql)
+            unchanged = np.array([r[0] for r in cursor.fetchall()], dtype=np.int64)
+        common_connection.commit()
+        ids = df["id"].to_numpy()
+        return np.flatnonzero(~np.isin(ids, unchanged))
+
+    @staticmethod
+    def progress_key(table_name: str, seasonId: int, chunk_rows: int) -> str:
+        # the same for every attempt at a season, whichever decks it fetched
+        return f"{table_name}:{seasonId}:{chunk_rows}"
+
+    def loaded_rows(self, df: "pd.DataFrame | pa.Table") -> np.ndarray:
+        """
+        Returns a mask of the decks that are already in the database
+        at this version or a later one, e.g. committed by an interrupted load.
+        """
+        ids, updated = self._watermark_arrays(df)
+        common_connection = Database.common_connection()
+        with common_connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT id, "updatedDatetime" FROM decks WHERE id = ANY(%s);',
+                (ids.tolist(),),
+            )
+            res = cursor.fetchall()
+        common_connection.commit()
+        loaded = Watermark(int(df["seasonId"].to_numpy().min()))
+        if res:
+            loaded_ids, loaded_updated = zip(*res)
+            loaded_updated = np.array(loaded_updated, dtype="datetime64[ns]")
+            loaded.update(np.array(loaded_ids), loaded_updated.view(np.int64))
+        return ~loaded.changed(ids, updated)
+
+    @staticmethod
+    def load_progress(key: str) -> int:
+        """
+        Returns how many chunks of `key` are already committed.
+        """
+        common_connection = Database.common_connection()
+        with common_connection.cursor() as cursor:
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS load_progress (
+                    key VARCHAR(128) PRIMARY KEY,
+                    chunks INTEGER NOT NULL,
+                    rows INTEGER NOT NULL,
+                    "updatedAt" TIMESTAMP
+                );
+                SELECT chunks FROM load_progress WHERE key = %s;
+                """,
+                (key,),
+            )
+            res = cursor.fetchone()
+        common_connection.commit()
+        return 0 if res is None else res[0]
+
+    @staticmethod
+    def _chunk_rows_of(
+        deck_ids: np.ndarray, board_ids: np.ndarray, chunk_rows: int
+    ) -> "list[np.ndarray]":
+        # cards of each chunk of decks, in order, cards of decks that
+        # aren't in deck_ids, e.g. skipped on resume, are in chunk -1
+        deck_pos = pd.Index(deck_ids).get_indexer(board_ids)
+        chunk_of = deck_pos // chunk_rows
+        order = np.argsort(chunk_of, kind="stable")
+        num_chunks = -(-len(deck_ids) // chunk_rows)
+        bounds = np.searchsorted(chunk_of[order], np.arange(num_chunks + 1))
+        return [order[bounds[i] : bounds[i + 1]] for i in range(num_chunks)]
+
+    def write_chunked(self, df_dict: "dict[str, pd.DataFrame | pa.Table]") -> None:
+        """
+        Writes decks, and their cards, chunk_rows decks at a time.
+        Each chunk is upserted, has the cards of its decks in deck_ids_table
+        replaced, and is counted in load_progress in one transaction.
+        A rerun of the season finds the progress of the interrupted load
+        and skips the decks its chunks committed, even if it fetched more
+        decks since. The progress is deleted once every chunk is committed.
+        """
+        decks_df = df_dict["decks"]
+        seasonId = int(decks_df["seasonId"].to_numpy().min())
+        key = self.progress_key("decks", seasonId, self.chunk_rows)
+        done = self.load_progress(key)
+        if done:
+            # decks of other chunks aren't in this one, so they aren't written
+            loaded = self.loaded_rows(decks_df)
+            logging.info(
+                f"Resuming {key} after {done} chunks, "
+                f"{loaded.sum()} of {len(loaded)} decks are already loaded"
+            )
+            decks_df = self._take(decks_df, np.flatnonzero(~loaded))
+        deck_ids = decks_df["id"].to_numpy()
+        board_chunks = {
+            t: self._chunk_rows_of(
+                deck_ids, df_dict[t]["deckId"].to_numpy(), self.chunk_rows
+            )
+            for t in ["maindecks", "sideboards"]
+        }
+        num_chunks = len(board_chunks["maindecks"])
+        self.chunk_stats = []
+        common_connection = Database.common_connection()
+        for i in range(num_chunks):
+            start_time = perf_counter()
+            rows = np.arange(
+                i * self.chunk_rows, min((i + 1) * self.chunk_rows, len(deck_ids))
+            )
+            chunk_df = self._take(decks_df, rows)
+            num_rows = len(chunk_df)
+            try:
+                writer = self.writer("decks")
+                writer.execute(
+                    chunk_df,
+                    inside_transaction=True,
+                    on_conflict="update",
+                    commit=False,
                 )
+                with common_connection.cursor() as cursor:
+                    for table_name in ["maindecks", "sideboards"]:
+                        cursor.execute(
+                            f"""
+                            DELETE FROM {table_name} WHERE "deckId" = ANY(%s)
+                            AND "deckId" IN (SELECT id FROM {self.deck_ids_table});
+                            """,
+                            (deck_ids[rows].tolist(),),
+                        )
+                for table_name in ["maindecks", "sideboards"]:
+                    cards_df = self._take(
+                        df_dict[table_name], board_chunks[table_name][i]
+                    )
+                    num_rows += len(cards_df)
+                    writer = self.writer(table_name, include_id=False)
+                    writer.execute(
+                        cards_df,
+                        inside_transaction=True,
+                        on_conflict="error",
+                        commit=False,
+                    )
+                with common_connection.cursor() as cursor:
+                    cursor.execute(
+                        """
+                        INSERT INTO load_progress (key, chunks, rows, "updatedAt")
+                        VALUES (%s, %s, %s, now())
+                        ON CONFLICT (key) DO UPDATE SET
+                        (chunks, rows, "updatedAt") =
+                        (EXCLUDED.chunks, load_progress.rows + EXCLUDED.rows, now());
+                        """,
+                        (key, done + i + 1, num_rows),
+                    )
                 common_connection.commit()
-            DatabaseWriter("temp_deck_ids").execute(
-                decks_df[["id"]].drop_duplicates(),
-                inside_transaction=True,
-                on_conflict="error",
+            except Exception as e:
+                common_connection.rollback()
+                raise e
+            elapsed = perf_counter() - start_time
+            self.chunk_stats.append(
+                {
+                    "chunk": i,
+                    "rows": num_rows,
+                    "seconds": elapsed,
+                    "rowsPerSecond": num_rows / elapsed,
+                }
+            )
+            logging.info(
+                f"Chunk {i + 1}/{num_chunks} of {key}: {num_rows} rows "
+                f"in {elapsed:.2f} seconds, {num_rows / elapsed:.0f} rows/s"
             )
+        with common_connection.cursor() as cursor:
+            cursor.execute("DELETE FROM load_progress WHERE key = %s;", (key,))
+        common_connection.commit()
+
+    def write(self, df_dict: "dict[str, pd.DataFrame | pa.Table]") -> None:
+        for table_name in ["people", "archetypes"]:
+            writer = self.writer(table_name)
+            writer.execute(df_dict[table_name])
+            self._record(writer)
+        if self.chunk_rows:
+            self.write_chunked(df_dict)
+            return
+        decks_df = df_dict["decks"]
+
+        common_connection = Database.common_connection()
+        with common_connection:
             with common_connection.cursor() as cursor:
-                cursor.execute(
-                    """
+                cursor.execute(f"""
                     SELECT count(1) FROM decks
-                    WHERE id IN (SELECT id FROM temp_deck_ids);
-                    """
-                )
+                    WHERE id IN (SELECT id FROM {self.deck_ids_table});
+                    """)
                 res = cursor.fetchone()
             if res is None:
                 raise ValueError(f"Failed to load decks")
@@ -66,41 +390,105 @@ class Loader:
                 for table_name in ["maindecks", "sideboards"]:
                     delete_sql = f"""
                         DELETE FROM {table_name} WHERE "deckId" IN
-                        (SELECT id FROM temp_deck_ids);
+                        (SELECT id FROM {self.deck_ids_table});
                         """
                     logging.info(delete_sql)
                     with common_connection.cursor() as cursor:
                         cursor.execute(delete_sql)
                 common_connection.commit()
-            DatabaseWriter("decks").execute(
-                decks_df, inside_transaction=True, on_conflict="update"
-            )
+            writer = self.writer("decks")
+            writer.execute(decks_df, inside_transaction=True, on_conflict="update")
+            self._record(writer)
             for table_name in ["maindecks", "sideboards"]:
-                DatabaseWriter(table_name, include_id=False).execute(
+                writer = self.writer(table_name, include_id=False)
+                writer.execute(
                     df_dict[table_name],
                     inside_transaction=True,
                     on_conflict="error",
                 )
-            common_connection.commit()
-            with common_connection.cursor() as cursor:
-                cursor.execute("DROP TABLE IF EXISTS temp_deck_ids;")
+                self._record(writer)
             common_connection.commit()
 
-    def pre_filter(self, df: pd.DataFrame) -> pd.DataFrame:
-        seasonId = int(df["seasonId"].min())
-        with Database.common_connection() as conn:
-            with conn.cursor() as cur:
-                sql = """
-                SELECT id, "updatedDatetime"
-                from decks
-                where "seasonId" = %s
-                """
-                cur.execute(sql, (seasonId,))
-                res = cur.fetchall()
-        last_updated_df = pd.DataFrame(res, columns=["id", "lastUpdated"])
-        df = df.merge(last_updated_df, on="id", how="left")
-        df = df[
-            (df["lastUpdated"].isna()) | (df["lastUpdated"] < df["updatedDatetime"])
-        ]
-        df = df.drop(columns=["lastUpdated"])
-        return df
+    def get_watermark(self, seasonId: int) -> Watermark:
+        if self.watermark_store is not None:
+            return self.watermark_store.load(seasonId)
+        if seasonId not in self._watermarks:
+            self._watermarks[seasonId] = Watermark.from_database(seasonId)
+        return self._watermarks[seasonId]
+
+    def _watermark_arrays(
+        self, df: "pd.DataFrame | pa.Table"
+    ) -> "tuple[np.ndarray, np.ndarray]":
+        ids = df["id"].to_numpy().astype(np.int64)
+        updated = df["updatedDatetime"].to_numpy().astype("datetime64[ns]")
+        return ids, updated.view(np.int64)
+
+    def update_watermark(self, df: "pd.DataFrame | pa.Table") -> None:
+        ids, updated = self._watermark_arrays(df)
+        seasons = df["seasonId"].to_numpy()
+        for seasonId in np.unique(seasons):
+            watermark = self.get_watermark(int(seasonId))
+            in_season = seasons == seasonId
+            watermark.update(ids[in_season], updated[in_season])
+            if self.watermark_store is not None:
+                self.watermark_store.save(watermark)
+
+    def latest_rows(self, df: "pd.DataFrame | pa.Table") -> np.ndarray:
+        """
+        Returns the positions of the latest row of each deck.
+        """
+        if len(df) == 0:
+            return np.empty(0, dtype=np.int64)
+        ids, updated = self._watermark_arrays(df)
+        # pages can shift while paginating, so the same deck may appear twice
+        latest_first = np.argsort(updated, kind="stable")[::-1]
+        _, first = np.unique(ids[latest_first], return_index=True)
+        return np.sort(latest_first[first])
+
+    def changed_rows(self, df: "pd.DataFrame | pa.Table") -> np.ndarray:
+        """
+        Returns the positions of the rows that are new or updated
+        since the watermark, keeping only the latest row of each deck.
+        """
+        keep = self.latest_rows(df)
+        if len(keep) == 0:
+            return keep
+        ids, updated = self._watermark_arrays(df)
+        seasonId = int(df["seasonId"].to_numpy().min())
+        watermark = self.get_watermark(seasonId)
+        return keep[watermark.changed(ids[keep], updated[keep])]
+
+    def changed_rows_on_server(self, df: "pd.DataFrame | pa.Table") -> np.ndarray:
+        """
+        Like changed_rows, but stages the latest row of each deck
+        in deck_ids_table and lets the database drop the unchanged ones,
+        so only this batch's ids go over the network.
+        deck_ids_table is left holding the changed ids for write.
+        """
+        keep = self.latest_rows(df)
+        if len(keep) == 0:
+            return keep
+        ids, updated = self._watermark_arrays(df)
+        self.stage_deck_ids(self._take(df, keep))
+        common_connection = Database.common_connection()
+        sql = f"""
+            DELETE FROM {self.deck_ids_table} AS t USING decks AS d
+            WHERE d.id = t.id AND d."updatedDatetime" >= t."updatedDatetime";
+            SELECT id FROM {self.deck_ids_table};
+            """
+        with common_connection.cursor() as cursor:
+            cursor.execute(sql)
+            changed = np.array([r[0] for r in cursor.fetchall()], dtype=np.int64)
+        common_connection.commit()
+        return keep[np.isin(ids[keep], changed)]
+
+    @staticmethod
+    def _take(
+        df: "pd.DataFrame | pa.Table", rows: np.ndarray
+    ) -> "pd.DataFrame | pa.Table":
+        if isinstance(df, pa.Table):
+            return df.take(rows)
+        return df.iloc[rows].reset_index(drop=True)
+
+    def pre_filter(self, df: "pd.DataFrame | pa.Table") -> "pd.DataFrame | pa.Table":
+        return self._take(df, self.changed_rows(df))
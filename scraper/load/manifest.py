@@ -0,0 +1,161 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import json
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# readers plan by the range of this column without opening any file
+STATS_COLUMN = "updatedDatetime"
+
+
+def partition_of(relative_path: str) -> str:
+    """
+    e.g. "seasonId=30/archetypeId=1/archetypeName=Burn" of
+    "seasonId=30/archetypeId=1/archetypeName=Burn/0a1b-0.parquet"
+    """
+    return relative_path.rpartition("/")[0]
+
+
+def partition_values(partition: str) -> Dict[str, str]:
+    return dict(part.split("=", 1) for part in partition.split("/") if part)
+
+
+def has_versions(column_names: List[str]) -> bool:
+    """
+    Whether rows are versions of decks, which are appended and deduplicated
+    by id, rather than results that are recomputed whole on every write.
+    """
+    return "id" in column_names and STATS_COLUMN in column_names
+
+
+def latest_per_id(table: pa.Table) -> pa.Table:
+    """
+    Keeps the latest version of each deck written by several runs,
+    sorted by STATS_COLUMN. Tables without versions are returned as they are.
+    """
+    if not has_versions(table.column_names):
+        return table
+    ids = table["id"].to_numpy()
+    updated = pc.cast(table[STATS_COLUMN], pa.int64()).to_numpy()
+    keep = latest_rows(ids, updated)
+    return table.take(keep[np.argsort(updated[keep], kind="stable")])
+
+
+def latest_rows(ids: np.ndarray, updated: np.ndarray) -> np.ndarray:
+    """
+    Returns the position of the latest version of each id,
+    one of them if it was written more than once.
+    """
+    if not len(ids):
+        return np.empty(0, dtype=np.int64)
+    latest_first = np.lexsort((-updated, ids))
+    is_first = np.append(True, ids[latest_first][1:] != ids[latest_first][:-1])
+    return latest_first[is_first]
+
+
+def file_entry(
+    relative_path: str, metadata: pq.FileMetaData, num_bytes: int
+) -> Dict[str, "int | str | None"]:
+    """
+    Rows, bytes and the range of STATS_COLUMN of a written parquet file,
+    from its footer.
+    """
+    entry: Dict[str, "int | str | None"] = {
+        "path": relative_path,
+        "rows": metadata.num_rows,
+        "bytes": num_bytes,
+        "minUpdatedDatetime": None,
+        "maxUpdatedDatetime": None,
+    }
+    names = [metadata.schema.column(i).name for i in range(metadata.num_columns)]
+    if STATS_COLUMN not in names:
+        return entry
+    j = names.index(STATS_COLUMN)
+    mins, maxs = [], []
+    for i in range(metadata.num_row_groups):
+        stats = metadata.row_group(i).column(j).statistics
+        if stats is None or not stats.has_min_max:
+            # a row group without statistics means the range is unknown
+            return entry
+        mins.append(stats.min)
+        maxs.append(stats.max)
+    if mins:
+        entry["minUpdatedDatetime"] = min(mins).isoformat()
+        entry["maxUpdatedDatetime"] = max(maxs).isoformat()
+    return entry
+
+
+@dataclass
+class Manifest:
+    """
+    Every file of a partitioned parquet dataset, by partition,
+    with its rows, bytes and range of updatedDatetime,
+    kept next to the dataset as _manifest.json so readers don't list the bucket.
+    """
+
+    partition_cols: List[str]
+    partitions: Dict[str, List[Dict]] = field(default_factory=dict)
+    # keys hashed into partitionBucket folders, see PartitionPlan
+    bucket_cols: List[str] = field(default_factory=list)
+    num_buckets: int = 1
+
+    FILENAME = "_manifest.json"
+
+    @classmethod
+    def from_json(cls, data: bytes) -> "Manifest":
+        dct = json.loads(data)
+        partitions = {p: dct["partitions"][p]["files"] for p in dct["partitions"]}
+        return cls(
+            dct["partitionCols"],
+            partitions,
+            dct.get("bucketCols", []),
+            dct.get("numBuckets", 1),
+        )
+
+    def to_json(self) -> bytes:
+        partitions = {
+            p: {**self.summary(p), "files": files}
+            for p, files in sorted(self.partitions.items())
+        }
+        dct = {
+            "partitionCols": self.partition_cols,
+            "bucketCols": self.bucket_cols,
+            "numBuckets": self.num_buckets,
+            "partitions": partitions,
+        }
+        return json.dumps(dct, indent=1).encode("utf-8")
+
+    def add(self, entry: Dict) -> None:
+        files = self.partitions.setdefault(partition_of(entry["path"]), [])
+        # a file written again under the same name replaces its entry
+        files[:] = [f for f in files if f["path"] != entry["path"]]
+        files.append(entry)
+
+    def remove(self, paths: List[str]) -> None:
+        paths = set(paths)
+        for partition in list(self.partitions):
+            files = [f for f in self.partitions[partition] if f["path"] not in paths]
+            if files:
+                self.partitions[partition] = files
+            else:
+                del self.partitions[partition]
+
+    def files(self, partition: Optional[str] = None) -> List[Dict]:
+        if partition is not None:
+            return self.partitions.get(partition, [])
+        return [f for files in self.partitions.values() for f in files]
+
+    def summary(self, partition: str) -> Dict[str, "int | str | None"]:
+        files = self.partitions[partition]
+        mins = [f["minUpdatedDatetime"] for f in files]
+        maxs = [f["maxUpdatedDatetime"] for f in files]
+        # iso strings of the same format sort like the datetimes
+        return {
+            "rows": sum(f["rows"] for f in files),
+            "bytes": sum(f["bytes"] for f in files),
+            "minUpdatedDatetime": None if None in mins else min(mins, default=None),
+            "maxUpdatedDatetime": None if None in maxs else max(maxs, default=None),
+        }
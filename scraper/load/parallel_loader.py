@@ -0,0 +1,152 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Literal
+import logging
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+
+from database import Database, WatermarkStore
+from database.models import Base
+from .database_writer import DatabaseWriter
+from .load import Loader
+
+# how each table's staged rows are merged into it
+MERGE_MODES: Dict[str, Literal["ignore", "update", "replace"]] = {
+    "people": "ignore",
+    "archetypes": "ignore",
+    "decks": "update",
+    # boards of decks in the loader's deck_ids_table are deleted,
+    # then inserted again
+    "maindecks": "replace",
+    "sideboards": "replace",
+}
+
+
+def dependency_levels(table_names: List[str]) -> List[List[str]]:
+    """
+    Groups tables by the foreign keys in database/models.py, so every table
+    only references tables in earlier levels.
+    e.g. [["people", "archetypes"], ["decks"], ["maindecks", "sideboards"]]
+    """
+    tables = Base.metadata.tables
+    depends = {
+        t: {fk.column.table.name for fk in tables[t].foreign_keys} & set(table_names)
+        for t in table_names
+    }
+    levels = []
+    done = set()
+    while len(done) < len(table_names):
+        level = [t for t in table_names if t not in done and depends[t] <= done]
+        if not level:
+            raise ValueError(f"Foreign keys of {set(table_names) - done} form a cycle")
+        levels.append(level)
+        done.update(level)
+    return levels
+
+
+class ParallelLoader(Loader):
+    """
+    Loader that copies every table into its own staging table at once,
+    each on a pooled connection, then merges the staging tables into the real
+    tables level by level of `dependency_levels` in one transaction.
+    Staging tables have no foreign keys, so only the merge needs ordering,
+    and a failure anywhere leaves the real tables untouched.
+    """
+
+    def __init__(
+        self,
+        watermark_store: "WatermarkStore | None" = None,
+        copy_format: Literal["csv", "binary"] = "csv",
+        server_delta: bool = False,
+        max_workers: int = 4,
+    ) -> None:
+        super().__init__(watermark_store, copy_format, server_delta)
+        self.max_workers = max_workers
+        self.levels = dependency_levels(list(MERGE_MODES))
+
+    def writer(self, table_name: str, include_id: bool = True) -> DatabaseWriter:
+        include_id = include_id and MERGE_MODES.get(table_name) != "replace"
+        return super().writer(table_name, include_id)
+
+    def _stage(
+        self, table_name: str, df: "pd.DataFrame | pa.Table", stage_table: str
+    ) -> None:
+        pool = Database.pool(self.max_workers)
+        conn = pool.getconn()
+        try:
+            writer = self.writer(table_name)
+            writer.stage(conn, df, stage_table)
+            self._record(writer)
+        finally:
+            pool.putconn(conn)
+
+    def merge_sql(
+        self, table_name: str, columns: List[str], stage_tables: Dict[str, str]
+    ) -> List[str]:
+        writer = self.writer(table_name)
+        stage_table = stage_tables[table_name]
+        mode = MERGE_MODES[table_name]
+        if mode != "replace":
+            return [writer._generate_insert_sql(columns, mode == "update", stage_table)]
+        fixed_columns = ", ".join(writer.fix_columns(columns))
+        return [
+            f"""
+            DELETE FROM {table_name} WHERE "deckId" IN
+            (SELECT id FROM {self.deck_ids_table});
+            """,
+            f"""
+            INSERT INTO {table_name} ({fixed_columns})
+            SELECT {fixed_columns} FROM {stage_table};
+            """,
+        ]
+
+    def _merge(
+        self,
+        df_dict: "dict[str, pd.DataFrame | pa.Table]",
+        stage_tables: Dict[str, str],
+    ) -> None:
+        pool = Database.pool(self.max_workers)
+        conn = pool.getconn()
+        try:
+            with conn.cursor() as cursor:
+                for level in self.levels:
+                    for table_name in level:
+                        columns = DatabaseWriter.columns_of(df_dict[table_name])
+                        for sql in self.merge_sql(table_name, columns, stage_tables):
+                            DatabaseWriter.print_sql(sql)
+                            cursor.execute(sql)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise e
+        finally:
+            pool.putconn(conn)
+
+    def _drop(self, stage_tables: Dict[str, str]) -> None:
+        pool = Database.pool(self.max_workers)
+        conn = pool.getconn()
+        try:
+            drop_sql = f"DROP TABLE IF EXISTS {', '.join(stage_tables.values())};"
+            with conn.cursor() as cursor:
+                cursor.execute(drop_sql)
+            conn.commit()
+        finally:
+            pool.putconn(conn)
+
+    def write(self, df_dict: "dict[str, pd.DataFrame | pa.Table]") -> None:
+        # suffixed so concurrent runs don't share staging tables
+        run = uuid.uuid4().hex[:8]
+        stage_tables = {t: f"stage_{t}_{run}" for t in MERGE_MODES}
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [
+                    executor.submit(self._stage, t, df_dict[t], stage_tables[t])
+                    for t in MERGE_MODES
+                ]
+                for future in futures:
+                    future.result()
+            logging.info(f"Staged {list(MERGE_MODES)}, merging in order {self.levels}")
+            self._merge(df_dict, stage_tables)
+        finally:
+            self._drop(stage_tables)
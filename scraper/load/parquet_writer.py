@@ -1,37 +1,78 @@
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import numpy as np
 import pandas as pd
-from typing import Literal, List
+from typing import Dict, Literal, List, Optional
+from fsspec import AbstractFileSystem
+from fsspec.implementations.local import LocalFileSystem
 from gcsfs import GCSFileSystem
 import os
 from pandas.api.types import is_integer_dtype
 import logging
 import pyarrow as pa
-import re
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import tempfile
+import time
+import uuid
 
+from .manifest import (
+    STATS_COLUMN,
+    Manifest,
+    file_entry,
+    has_versions,
+    latest_per_id,
+    latest_rows,
+    partition_of,
+)
+from .partition_planner import PartitionPlan, PartitionPlanner
 from .writer import Writer
 
+# files of a partition below half this size are merged by compact
+TARGET_FILE_BYTES = 128 * 1024 * 1024
+
+
+@dataclass
+class UploadedFile:
+    """
+    What file visitors are given for a file uploaded by ParquetWriter,
+    like pyarrow's WrittenFile.
+    """
+
+    path: str
+    metadata: pq.FileMetaData
+
 
 @dataclass
 class ParquetWriter(Writer):
     bucket: str
     target: Literal["local", "gcsfs"] = "local"
+    planner: PartitionPlanner = field(default_factory=PartitionPlanner)
+    # any fsspec filesystem for the gcsfs target, e.g. a memory one in tests
+    fs: Optional[AbstractFileSystem] = None
+    max_uploads: int = 8
+    max_upload_retries: int = 3
+    backoff_seconds: float = 1.0
 
     def __post_init__(self):
-        if self.target == "gcsfs":
+        if self.fs is None and self.target == "gcsfs":
             self.fs = GCSFileSystem()
-        self.max_shard_limit: int = 4096
+        elif self.fs is None:
+            self.fs = LocalFileSystem(auto_mkdir=True)
         self.write_kwargs = {
             "index": False,
             "compression": "snappy",
+            # replaced with a unique prefix on every write, see execute
             "basename_template": "guid-{i}.parquet",
             "existing_data_behavior": "overwrite_or_ignore",
             "coerce_timestamps": "us",
             "allow_truncated_timestamps": True,
-            "max_partitions": self.max_shard_limit,
+            # partitioned writes set their own from a PartitionPlan
+            "max_partitions": 4096,
         }
 
     def _local_write(
-        self, df: pd.DataFrame, filename: str, partition_cols: List[str]
+        self, df: "pd.DataFrame | pa.Table", filename: str, partition_cols: List[str]
     ) -> None:
         path = os.path.join(self.bucket, filename)
         folder = os.path.dirname(path)
@@ -40,19 +81,310 @@ class ParquetWriter(Writer):
         kwargs = {**self.write_kwargs, "partition_cols": partition_cols}
         if partition_cols:
             kwargs["partition_cols"] = partition_cols
+        if isinstance(df, pa.Table):
+            self._write_table(df, path, kwargs)
+            return
         df.to_parquet(path, **kwargs)
 
+    def _upload(self, local_path: str, path: str) -> None:
+        wait_time = self.backoff_seconds
+        for i in range(self.max_upload_retries):
+            try:
+                # gcsfs sends files over its chunk size as resumable uploads
+                self.fs.put_file(local_path, path)
+                return
+            except Exception as e:
+                if i == self.max_upload_retries - 1:
+                    raise
+                logging.warning(f"Retrying upload of {path} in {wait_time}s: {e}")
+                time.sleep(wait_time)
+                wait_time *= 2
+
     def _gcsfs_write(
-        self, df: pd.DataFrame, filename: str, partition_cols: List[str]
+        self, df: "pd.DataFrame | pa.Table", filename: str, partition_cols: List[str]
     ) -> None:
-        path = self.fs.sep.join([self.bucket, filename])
-        kwargs = {**self.write_kwargs, "partition_cols": partition_cols}
-        if partition_cols:
-            kwargs["partition_cols"] = partition_cols
-        df.to_parquet("gs://" + path, **kwargs)
+        """
+        Encodes the files into a temporary folder, then uploads them
+        `max_uploads` at a time.
+        """
+        root = self._root(filename)
+        file_visitor = self.write_kwargs.get("file_visitor")
+        with tempfile.TemporaryDirectory() as folder:
+            staged = []
+            kwargs = {
+                **self.write_kwargs,
+                "partition_cols": partition_cols,
+                "file_visitor": lambda w: staged.append((w.path, w.metadata)),
+            }
+            if isinstance(df, pa.Table):
+                self._write_table(df, folder, kwargs)
+            else:
+                df.to_parquet(folder, **kwargs)
+            uploads = [
+                (local_path, "/".join([root, os.path.relpath(local_path, folder)]))
+                for local_path, _ in staged
+            ]
+            start_time = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=self.max_uploads) as pool:
+                for _ in pool.map(lambda u: self._upload(*u), uploads):
+                    pass
+            num_bytes = sum(os.path.getsize(local_path) for local_path, _ in uploads)
+            logging.info(
+                f"Uploaded {len(uploads)} files, {num_bytes} bytes, to {root} "
+                f"in {time.perf_counter() - start_time:.2f}s"
+            )
+        if file_visitor is not None:
+            for (_, path), (_, metadata) in zip(uploads, staged):
+                file_visitor(UploadedFile(path, metadata))
+
+    @staticmethod
+    def _write_table(table: pa.Table, path: str, kwargs: dict, filesystem=None) -> None:
+        # the table has no index, so there's nothing for "index" to drop
+        kwargs = {k: v for k, v in kwargs.items() if k != "index"}
+        pq.write_to_dataset(table, path, filesystem=filesystem, **kwargs)
+
+    @staticmethod
+    def _fill_partition_nulls(table: pa.Table, partition_cols: List[str]) -> pa.Table:
+        for c in partition_cols:
+            i = table.schema.get_field_index(c)
+            column = table[c]
+            if pa.types.is_dictionary(column.type):
+                column = pc.cast(column, pa.string())
+            if pa.types.is_integer(column.type):
+                column = pc.fill_null(column, -1)
+            else:
+                column = pc.fill_null(pc.cast(column, pa.string()), "<null>")
+            table = table.set_column(i, c, column)
+        return table
+
+    def _root(self, filename: str) -> str:
+        if self.target == "local":
+            return os.path.join(self.bucket, filename)
+        return self.fs.sep.join([self.bucket, filename])
+
+    def _relative(self, filename: str, path: str) -> str:
+        # paths may come back absolute, or without the gs:// of the root
+        for root in [
+            self._root(filename),
+            self.fs._strip_protocol(self._root(filename)),
+        ]:
+            if path.startswith(root + "/"):
+                return path[len(root) + 1 :]
+        raise ValueError(f"{path} is not in {self._root(filename)}")
+
+    def load_manifest(self, filename: str) -> Optional[Manifest]:
+        path = "/".join([self._root(filename), Manifest.FILENAME])
+        if not self.fs.exists(path):
+            return None
+        return Manifest.from_json(self.fs.cat_file(path))
+
+    def save_manifest(self, filename: str, manifest: Manifest) -> None:
+        path = "/".join([self._root(filename), Manifest.FILENAME])
+        self.fs.pipe_file(path, manifest.to_json())
+
+    def rebuild_manifest(
+        self,
+        filename: str,
+        partition_cols: List[str],
+        plan: Optional[PartitionPlan] = None,
+    ) -> Manifest:
+        """
+        Lists the dataset and reads every file's footer,
+        for datasets written before manifests were kept.
+        """
+        manifest = Manifest(partition_cols)
+        if plan is not None:
+            manifest = Manifest(
+                plan.partition_cols, {}, plan.bucket_cols, plan.num_buckets
+            )
+        for path in self.fs.find(self._root(filename)):
+            if not path.endswith(".parquet"):
+                continue
+            with self.fs.open(path, "rb") as f:
+                metadata = pq.read_metadata(f)
+            relative_path = self._relative(filename, path)
+            manifest.add(file_entry(relative_path, metadata, self.fs.size(path)))
+        self.save_manifest(filename, manifest)
+        return manifest
+
+    def _update_manifest(
+        self,
+        filename: str,
+        plan: PartitionPlan,
+        written: "List[tuple[str, pq.FileMetaData]]",
+        replace: bool = False,
+    ) -> None:
+        """
+        Adds the written files to the manifest. With `replace`, they replace
+        the other files of the partitions they were written to,
+        which are removed once the manifest is saved.
+        """
+        new_paths = [self._relative(filename, path) for path, _ in written]
+        manifest = self.load_manifest(filename)
+        if manifest is None:
+            # also picks up the files just written
+            manifest = self.rebuild_manifest(filename, plan.partition_cols, plan)
+        else:
+            for relative_path, (path, metadata) in zip(new_paths, written):
+                manifest.add(file_entry(relative_path, metadata, self.fs.size(path)))
+        old_paths = []
+        if replace:
+            new_set = set(new_paths)
+            for partition in {partition_of(p) for p in new_paths}:
+                files = manifest.files(partition)
+                old_paths += [f["path"] for f in files if f["path"] not in new_set]
+            manifest.remove(old_paths)
+        self.save_manifest(filename, manifest)
+        if old_paths:
+            root = self._root(filename)
+            self.fs.rm(["/".join([root, p]) for p in old_paths])
+
+    def _latest_rows_by_file(
+        self, filename: str, manifest: Manifest
+    ) -> Optional[Dict[str, np.ndarray]]:
+        """
+        Returns a mask of the rows of every file that are the latest version
+        of their deck across the whole dataset, as a deck's new version can
+        be written to another partition than its old one, e.g. once its
+        archetype is known. None for datasets without versions.
+        """
+        root = self._root(filename)
+        versions = []
+        for f in manifest.files():
+            with self.fs.open("/".join([root, f["path"]]), "rb") as fp:
+                parquet_file = pq.ParquetFile(fp)
+                if not has_versions(parquet_file.schema_arrow.names):
+                    return None
+                versions.append(parquet_file.read(columns=["id", STATS_COLUMN]))
+        if not versions:
+            return None
+        ids = np.concatenate([t["id"].to_numpy() for t in versions])
+        updated = np.concatenate(
+            [pc.cast(t[STATS_COLUMN], pa.int64()).to_numpy() for t in versions]
+        )
+        is_latest = np.zeros(len(ids), dtype=bool)
+        is_latest[latest_rows(ids, updated)] = True
+        offsets = np.cumsum([0] + [t.num_rows for t in versions])
+        return {
+            f["path"]: is_latest[start:end]
+            for f, start, end in zip(manifest.files(), offsets[:-1], offsets[1:])
+        }
+
+    def _compact_partition(
+        self,
+        filename: str,
+        partition: str,
+        files: List[Dict],
+        target_file_bytes: int,
+        is_latest: Optional[Dict[str, np.ndarray]] = None,
+    ) -> List[Dict]:
+        root = self._root(filename)
+        tables = []
+        for f in files:
+            with self.fs.open("/".join([root, f["path"]]), "rb") as fp:
+                table = pq.read_table(fp)
+            if is_latest is not None:
+                table = table.filter(pa.array(is_latest[f["path"]]))
+            tables.append(table)
+        table = latest_per_id(pa.concat_tables(tables, promote=True))
+        num_bytes = sum(f["bytes"] for f in files)
+        num_files = max(1, round(num_bytes / target_file_bytes))
+        rows_per_file = max(1, -(-len(table) // num_files))
+        prefix = uuid.uuid4().hex
+        entries = []
+        for i, start in enumerate(range(0, len(table), rows_per_file)):
+            relative_path = f"{partition}/{prefix}-{i}.parquet"
+            path = "/".join([root, relative_path])
+            with self.fs.open(path, "wb") as fp:
+                pq.write_table(
+                    table.slice(start, rows_per_file),
+                    fp,
+                    compression=self.write_kwargs["compression"],
+                    coerce_timestamps="us",
+                    allow_truncated_timestamps=True,
+                )
+            with self.fs.open(path, "rb") as fp:
+                metadata = pq.read_metadata(fp)
+            entries.append(file_entry(relative_path, metadata, self.fs.size(path)))
+        return entries
+
+    @staticmethod
+    def _needs_compaction(
+        files: List[Dict],
+        target_file_bytes: int,
+        is_latest: Optional[Dict[str, np.ndarray]],
+    ) -> bool:
+        small = [f for f in files if f["bytes"] < target_file_bytes // 2]
+        if len(small) >= 2:
+            return True
+        # superseded by rows of other files
+        return is_latest is not None and any(
+            not is_latest[f["path"]].all() for f in files
+        )
+
+    def compact(
+        self,
+        filename: str,
+        partition_cols: List[str] = [],
+        target_file_bytes: int = TARGET_FILE_BYTES,
+    ) -> Dict[str, int]:
+        """
+        Rewrites every partition with more than one file under half of
+        `target_file_bytes` into files of about that size, sorted by
+        updatedDatetime and with only the latest row of each deck.
+        Partitions holding decks whose latest row is in another partition
+        are rewritten without them, leaving one row per deck in the dataset.
+        The manifest is saved before the old files are removed,
+        so readers going by it never see a partition twice or not at all.
+
+        Returns:
+            Dict[str, int]: partitions compacted, files before and after
+        """
+        manifest = self.load_manifest(filename)
+        if manifest is None:
+            manifest = self.rebuild_manifest(filename, partition_cols)
+        is_latest = self._latest_rows_by_file(filename, manifest)
+        stats = {"partitions": 0, "filesBefore": 0, "filesAfter": 0}
+        for partition in list(manifest.partitions):
+            files = manifest.files(partition)
+            if not self._needs_compaction(files, target_file_bytes, is_latest):
+                continue
+            entries = self._compact_partition(
+                filename, partition, files, target_file_bytes, is_latest
+            )
+            old_paths = [f["path"] for f in files]
+            manifest.remove(old_paths)
+            for entry in entries:
+                manifest.add(entry)
+            self.save_manifest(filename, manifest)
+            root = self._root(filename)
+            self.fs.rm(["/".join([root, p]) for p in old_paths])
+            stats["partitions"] += 1
+            stats["filesBefore"] += len(files)
+            stats["filesAfter"] += len(entries)
+        logging.info(f"Compacted {self._root(filename)}: {stats}")
+        return stats
+
+    def plan(
+        self, df: "pd.DataFrame | pa.Table", filename: str, partition_cols: List[str]
+    ) -> PartitionPlan:
+        """
+        Plans the layout of a new dataset from its first write,
+        later writes keep the layout in its manifest.
+        """
+        manifest = self.load_manifest(filename)
+        if manifest is not None:
+            layout = PartitionPlan(
+                manifest.partition_cols, manifest.bucket_cols, manifest.num_buckets
+            )
+            return self.planner.keep(df, layout)
+        if self.fs.exists(self._root(filename)):
+            # written before plans, keep its folders
+            return self.planner.keep(df, PartitionPlan(partition_cols))
+        return self.planner.plan(df, partition_cols)
 
     def _write(
-        self, df: pd.DataFrame, filename: str, partition_cols: List[str]
+        self, df: "pd.DataFrame | pa.Table", filename: str, partition_cols: List[str]
     ) -> None:
         if self.target == "local":
             self._local_write(df, filename, partition_cols)
@@ -60,30 +392,46 @@ class ParquetWriter(Writer):
             self._gcsfs_write(df, filename, partition_cols)
 
     def execute(
-        self, df: pd.DataFrame, filename: str, partition_cols: List[str] = []
+        self,
+        df: "pd.DataFrame | pa.Table",
+        filename: str,
+        partition_cols: List[str] = [],
     ) -> None:
         log_string = f"Start writing dataframe to {self.target} "
         log_string += "bucket" if self.target == "gcsfs" else "folder"
         log_string += f" {self.bucket}/{filename}"
         logging.info(log_string)
-        for c in partition_cols:
-            if is_integer_dtype(df[c]):
-                df[c] = df[c].fillna(-1)
-            else:
-                df[c] = df[c].fillna("<null>")
+        if isinstance(df, pa.Table):
+            df = self._fill_partition_nulls(df, partition_cols)
+        else:
+            for c in partition_cols:
+                if is_integer_dtype(df[c]):
+                    df[c] = df[c].fillna(-1)
+                else:
+                    df[c] = df[c].fillna("<null>")
+        written = []
+        default_kwargs = dict(self.write_kwargs)
+        plan = None
+        if partition_cols:
+            # high-cardinality keys go into hash buckets, so the number of
+            # files is known before writing and max_partitions is never hit
+            plan = self.plan(df, filename, partition_cols)
+            logging.info(f"Writing {filename} with {plan}")
+            df = plan.apply(df)
+            partition_cols = plan.folder_cols
+            self.write_kwargs.update(plan.write_kwargs())
+            # every write adds its own files, see _update_manifest
+            self.write_kwargs["basename_template"] = f"{uuid.uuid4().hex}-{{i}}.parquet"
+            self.write_kwargs["file_visitor"] = lambda w: written.append(
+                (w.path, w.metadata)
+            )
         try:
             self._write(df, filename, partition_cols)
-        except pa.lib.ArrowInvalid as e:
-            error_message = str(e)
-            limits = re.findall("[0-9]+", error_message)
-            if len(limits) != 2:
-                raise e
-            new_limit, old_limit = list(map(int, limits))
-            logging.warning(f"Temporarily setting max_partitions to {new_limit}")
-            self.max_shard_limit = new_limit
-            self.write_kwargs["max_partitions"] = new_limit
-            self._write(df, filename, partition_cols)
-            self.max_shard_limit = old_limit
-            self.write_kwargs["max_partitions"] = old_limit
         finally:
-            return
+            self.write_kwargs = default_kwargs
+        if plan is not None and written:
+            # versions of decks are appended, for readers and compact to
+            # deduplicate, anything else is recomputed whole on every write
+            columns = df.column_names if isinstance(df, pa.Table) else df.columns
+            replace = not has_versions(list(columns))
+            self._update_manifest(filename, plan, written, replace=replace)
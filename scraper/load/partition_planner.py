@@ -0,0 +1,161 @@
+from dataclasses import dataclass, field
+from typing import List
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# the column high-cardinality partition keys are hashed into
+BUCKET_COLUMN = "partitionBucket"
+# parquet files are usually several times smaller than the data in memory
+COMPRESSION_RATIO = 0.25
+# rows the size of a row is estimated from
+SAMPLE_ROWS = 10_000
+
+
+def bucket_of(
+    df: "pd.DataFrame | pa.Table", columns: List[str], num_buckets: int
+) -> np.ndarray:
+    """
+    Returns the bucket of every row, from the values of `columns` as strings,
+    so readers can find the bucket of a value whatever its dtype.
+    """
+    if isinstance(df, pa.Table):
+        df = df.select(columns).to_pandas()
+    keys = df[columns].astype(str)
+    hashes = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+    return (hashes % np.uint64(num_buckets)).astype(np.int32)
+
+
+@dataclass
+class PartitionPlan:
+    """
+    How a dataset is laid out: the folders it's partitioned by,
+    the keys hashed into BUCKET_COLUMN folders instead, and the rows per file
+    and per row group that make files about the target size.
+    """
+
+    partition_cols: List[str]
+    bucket_cols: List[str] = field(default_factory=list)
+    num_buckets: int = 1
+    num_partitions: int = 1
+    max_rows_per_file: int = 1_000_000
+    max_rows_per_group: int = 100_000
+
+    @property
+    def folder_cols(self) -> List[str]:
+        if self.num_buckets > 1:
+            return self.partition_cols + [BUCKET_COLUMN]
+        return self.partition_cols
+
+    def apply(self, df: "pd.DataFrame | pa.Table") -> "pd.DataFrame | pa.Table":
+        if self.num_buckets <= 1:
+            return df
+        buckets = bucket_of(df, self.bucket_cols, self.num_buckets)
+        if isinstance(df, pa.Table):
+            return df.append_column(BUCKET_COLUMN, pa.array(buckets))
+        return df.assign(**{BUCKET_COLUMN: buckets})
+
+    def write_kwargs(self) -> dict:
+        return {
+            "max_partitions": max(self.num_partitions, 1),
+            "max_rows_per_file": self.max_rows_per_file,
+            # write_to_dataset passes this on as max_rows_per_group
+            "row_group_size": self.max_rows_per_group,
+        }
+
+
+@dataclass
+class PartitionPlanner:
+    """
+    Picks the partition folders of a dataset from the cardinality of the
+    requested keys: after the first, keys are kept in order while every folder
+    would still get a file of at least `min_file_bytes`, and at most
+    `max_partitions` folders are made. The rest are hashed into buckets
+    of about that size.
+    """
+
+    target_file_bytes: int = 64 * 1024 * 1024
+    min_file_bytes: int = 1024 * 1024
+    row_group_bytes: int = 16 * 1024 * 1024
+    max_partitions: int = 1024
+
+    @staticmethod
+    def _bytes_per_row(df: "pd.DataFrame | pa.Table") -> float:
+        # measured as arrow, so frames and tables of the same rows plan alike
+        sample = df.slice(0, SAMPLE_ROWS) if isinstance(df, pa.Table) else None
+        if sample is None:
+            sample = pa.Table.from_pandas(df.iloc[:SAMPLE_ROWS], preserve_index=False)
+        num_bytes = sample.combine_chunks().nbytes * COMPRESSION_RATIO
+        return max(num_bytes / max(len(sample), 1), 1.0)
+
+    @staticmethod
+    def _cardinality(df: "pd.DataFrame | pa.Table", columns: List[str]) -> int:
+        if not columns:
+            return 1
+        if isinstance(df, pa.Table):
+            return df.select(columns).group_by(columns).aggregate([]).num_rows
+        return len(df[columns].drop_duplicates())
+
+    def _row_sizes(self, bytes_per_row: float) -> "tuple[int, int]":
+        max_rows_per_file = max(int(self.target_file_bytes / bytes_per_row), 1)
+        max_rows_per_group = max(int(self.row_group_bytes / bytes_per_row), 1)
+        return max_rows_per_file, min(max_rows_per_group, max_rows_per_file)
+
+    def keep(
+        self, df: "pd.DataFrame | pa.Table", layout: PartitionPlan
+    ) -> PartitionPlan:
+        """
+        Plans rows per file for the folders of an existing dataset,
+        so every write to it has the same layout.
+        """
+        num_partitions = self._cardinality(df, layout.partition_cols)
+        max_rows_per_file, max_rows_per_group = self._row_sizes(self._bytes_per_row(df))
+        return PartitionPlan(
+            partition_cols=layout.partition_cols,
+            bucket_cols=layout.bucket_cols,
+            num_buckets=layout.num_buckets,
+            num_partitions=num_partitions * layout.num_buckets,
+            max_rows_per_file=max_rows_per_file,
+            max_rows_per_group=max_rows_per_group,
+        )
+
+    def plan(
+        self, df: "pd.DataFrame | pa.Table", partition_cols: List[str]
+    ) -> PartitionPlan:
+        bytes_per_row = self._bytes_per_row(df)
+        total_bytes = bytes_per_row * len(df)
+        kept: List[str] = []
+        num_partitions = 1
+        for c in partition_cols:
+            n = self._cardinality(df, kept + [c])
+            # the first key, seasonId here, is kept as each run writes a season
+            too_small = kept and total_bytes / n < self.min_file_bytes
+            if n > self.max_partitions or too_small:
+                break
+            kept.append(c)
+            num_partitions = n
+        # only the next key is hashed, so readers filtering on it alone can
+        # find its bucket, later keys usually depend on it (archetypeName)
+        bucket_cols = partition_cols[len(kept) : len(kept) + 1]
+        num_buckets = 1
+        if bucket_cols:
+            # as many buckets as keep files over min_file_bytes
+            num_buckets = int(
+                min(
+                    self.max_partitions // num_partitions,
+                    total_bytes // (num_partitions * self.min_file_bytes),
+                    self._cardinality(df, kept + bucket_cols) // num_partitions,
+                )
+            )
+        if num_buckets <= 1:
+            bucket_cols, num_buckets = [], 1
+        max_rows_per_file, max_rows_per_group = self._row_sizes(bytes_per_row)
+        return PartitionPlan(
+            partition_cols=kept,
+            bucket_cols=bucket_cols,
+            num_buckets=num_buckets,
+            num_partitions=num_partitions * num_buckets,
+            max_rows_per_file=max_rows_per_file,
+            max_rows_per_group=max_rows_per_group,
+        )
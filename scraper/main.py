@@ -2,11 +2,20 @@ import json
 import base64
 import os
 import pandas as pd
+import pyarrow as pa
 import logging
 
-from extract import Extractor, Preparer
-from transform import Transformer
-from load import Loader
+from extract import (
+    Extractor,
+    Preparer,
+    ColumnarDecoder,
+    RateLimiter,
+    CheckpointStore,
+)
+from transform import Transformer, ArrowTransformer, Decklists, SeasonCache
+from transform.decklists import BOARDS
+from load import Loader, ParallelLoader
+from database import Database, WatermarkStore
 from aggregate import AggregateManager
 
 
@@ -26,39 +35,170 @@ with open("transform/schema.json") as f:
 TARGET = os.environ["TARGET"]
 BUCKET = os.environ["BUCKET"]
 PARTITION_COLS = ["seasonId", "archetypeId", "archetypeName"]
+# transformed seasons, see SeasonCache
+CACHE_FOLDER = os.environ.get("CACHE_FOLDER", "cache")
 
 # notifier = Notifier(os.environ["EMAIL"])
 
 
+def split_decklists(
+    df: "pd.DataFrame | pa.Table",
+) -> "tuple[pd.DataFrame | pa.Table, Decklists]":
+    # boards are only needed as Decklists from here on,
+    # so drop the lists of dicts to free their memory
+    decklists = Decklists.build(df)
+    if isinstance(df, pa.Table):
+        return df.drop(BOARDS), decklists
+    return df.drop(columns=BOARDS), decklists
+
+
+def make_loader(
+    watermark_store: "WatermarkStore | None",
+    binary_copy: bool = False,
+    server_delta: bool = False,
+    parallel_load: int = 0,
+    chunk_rows: "int | None" = None,
+) -> Loader:
+    loader_kwargs = {
+        "copy_format": ("binary" if binary_copy else "csv"),
+        "server_delta": server_delta,
+    }
+    if parallel_load > 0 and chunk_rows:
+        # ParallelLoader merges every table in one transaction, not in chunks
+        raise ValueError(f"{chunk_rows=} can't be used with {parallel_load=}")
+    if parallel_load > 0:
+        # tables are staged on separate connections, then merged at once
+        return ParallelLoader(
+            watermark_store, max_workers=parallel_load, **loader_kwargs
+        )
+    # with chunk_rows, an interrupted load resumes from its last chunk
+    return Loader(watermark_store, chunk_rows=chunk_rows, **loader_kwargs)
+
+
+def make_decoder(arrow: bool, full_decode: bool) -> "ColumnarDecoder | None":
+    if full_decode:
+        # pages are parsed whole with response.json(), as before ColumnarDecoder
+        return None
+    return ColumnarDecoder(SCHEMA, output=("arrow" if arrow else "pandas"))
+
+
+def load_batches(
+    extractor: Extractor,
+    transformer: "Transformer | ArrowTransformer",
+    loader: Loader,
+    batch_pages: int,
+    season_cache: "SeasonCache | None",
+    seasonId: int,
+) -> int:
+    # stream each batch of pages through transform and load,
+    # so memory doesn't grow with the size of the season
+    num_rows = 0
+    for i, objects in enumerate(extractor.execute_batches(batch_pages)):
+        df = transformer.execute(objects)
+        if season_cache is not None:
+            season_cache.append(seasonId, df)
+        df, decklists = split_decklists(df)
+        logging.info(f"Batch {i}: {df.shape=}")
+        loader.execute(df, decklists)
+        num_rows += len(df)
+    if season_cache is not None:
+        # one write of the season, rather than rewriting it after every batch
+        season_cache.finish(seasonId)
+    return num_rows
+
+
 @error_wrapper
-def main(seasonId: "int | None" = None, test: bool = False):
+def main(
+    seasonId: "int | None" = None,
+    test: bool = False,
+    concurrency: int = 1,
+    batch_pages: "int | None" = None,
+    incremental: bool = False,
+    adaptive: bool = False,
+    limiter: "RateLimiter | None" = None,
+    checkpoint: bool = False,
+    arrow: bool = False,
+    binary_copy: bool = False,
+    server_delta: bool = False,
+    parallel_load: int = 0,
+    chunk_rows: "int | None" = None,
+    cache: bool = False,
+    full_decode: bool = False,
+) -> "dict[str, int]":
     if test:
         logging.getLogger().setLevel(logging.DEBUG)
-    prep = Preparer(seasonId=seasonId)
+    # warm invocations reuse the connection, renew it before anything holds it
+    Database().recycle()
+    # with server_delta, the database finds changed decks from the staged ids,
+    # so no watermark is kept. Preparer checks any watermark against max()
+    watermark_store = None
+    if not server_delta:
+        watermark_store = WatermarkStore(bucket=BUCKET, target=TARGET)
+    loader = make_loader(
+        watermark_store, binary_copy, server_delta, parallel_load, chunk_rows
+    )
+    prep = Preparer(seasonId=seasonId, watermark_store=watermark_store)
     prep.execute()
     seasonId = prep.seasonId
     sinceAsString = prep.lastUpdated.strftime("%Y%m%d %H:%M:%S")
-    logging.info(f"Running with {seasonId=}, since={sinceAsString}, {test=}")
+    logging.info(
+        f"Running with {seasonId=}, since={sinceAsString}, {test=}, "
+        f"{concurrency=}, {batch_pages=}, {incremental=}, {adaptive=}, "
+        f"{checkpoint=}, {arrow=}, {binary_copy=}, {server_delta=}, "
+        f"{parallel_load=}, {chunk_rows=}, {cache=}, {full_decode=}"
+    )
     params = {"seasonId": seasonId, "since": prep.since}
+    stop_condition = None
+    if incremental:
+        # since doesn't filter upstream, so newest first and stop early instead
+        params.update(prep.incremental_params())
+        stop_condition = prep.stop_condition()
+    checkpoint_store = None
+    if checkpoint:
+        checkpoint_store = CheckpointStore(bucket=BUCKET, target=TARGET)
     extractor = Extractor(
         url=URL,
         headers=HEADERS,
         params=params,
         page_size=(10 if test else 500),
         test=test,
+        concurrency=concurrency,
+        stop_condition=stop_condition,
+        adaptive=adaptive,
+        decoder=make_decoder(arrow, full_decode),
+        limiter=limiter,
+        checkpoint=checkpoint_store,
     )
-    objects = extractor.execute()
-    df = pd.DataFrame(objects)
+    if arrow:
+        # decks stay as pyarrow Tables all the way to the writers
+        transformer = ArrowTransformer(schema=SCHEMA)
+    else:
+        transformer = Transformer(schema=SCHEMA)
+    # later runs and analysis can reopen the season memory-mapped
+    season_cache = SeasonCache(CACHE_FOLDER) if cache else None
+    if batch_pages is not None:
+        num_rows = load_batches(
+            extractor, transformer, loader, batch_pages, season_cache, seasonId
+        )
+        extractor.clear_checkpoint()
+        logging.info("Streaming extract, transform and load done")
+        logging.info(f"Database connections: {Database().stats()}")
+        return {"seasonId": seasonId, "rows": num_rows}
+
+    df = extractor.execute()
     logging.info("Extractor done")
 
-    transformer = Transformer(schema=SCHEMA)
     df = transformer.execute(df)
+    if season_cache is not None:
+        season_cache.save(seasonId, df)
+    df, decklists = split_decklists(df)
     logging.info("Transformer done")
     logging.info(f"{df.shape=}")
 
-    loader = Loader()
-    loader.execute(df)
+    loader.execute(df, decklists)
+    extractor.clear_checkpoint()
     logging.info("Loader done")
+    logging.info(f"Database connections: {Database().stats()}")
 
     # writer = ParquetWriter(
     #     target=TARGET,
@@ -72,10 +212,10 @@ def main(seasonId: "int | None" = None, test: bool = False):
     # logging.info("Writer done")
 
     # agg_manager = AggregateManager(writer)
-    # agg_manager.execute(df)
+    # agg_manager.execute(df, decklists)
     # logging.info("Aggregations done")
     # logging.info("All done")
-    return
+    return {"seasonId": seasonId, "rows": len(df)}
 
 
 def entry_point(event, context):
@@ -93,7 +233,34 @@ def entry_point(event, context):
         return {"status": "fail", "reason": "unable to decode data as json"}, 500
     seasonId = message_dict.get("seasonId")
     test = "test" in message_dict and message_dict["test"] is True
-    main(seasonId, test)
+    concurrency = int(message_dict.get("concurrency", 1))
+    batch_pages = message_dict.get("batchPages")
+    incremental = message_dict.get("incremental") is True
+    adaptive = message_dict.get("adaptive") is True
+    checkpoint = message_dict.get("checkpoint") is True
+    arrow = message_dict.get("arrow") is True
+    binary_copy = message_dict.get("binaryCopy") is True
+    server_delta = message_dict.get("serverDelta") is True
+    parallel_load = int(message_dict.get("parallelLoad", 0))
+    chunk_rows = message_dict.get("chunkRows")
+    cache = message_dict.get("cache") is True
+    full_decode = message_dict.get("fullDecode") is True
+    main(
+        seasonId,
+        test,
+        concurrency,
+        batch_pages,
+        incremental,
+        adaptive,
+        checkpoint=checkpoint,
+        arrow=arrow,
+        binary_copy=binary_copy,
+        server_delta=server_delta,
+        parallel_load=parallel_load,
+        chunk_rows=chunk_rows,
+        cache=cache,
+        full_decode=full_decode,
+    )
 
 
 if __name__ == "__main__":
@@ -116,9 +283,101 @@ if __name__ == "__main__":
         default=False,
         help="Run in test mode",
     )
+    p.add_argument(
+        "--concurrency",
+        dest="concurrency",
+        type=int,
+        default=1,
+        help="Number of pages to fetch in parallel, sharing one rate limit",
+    )
+    p.add_argument(
+        "--batch-pages",
+        dest="batch_pages",
+        type=int,
+        default=None,
+        help="Stream every N pages through transform and load instead of "
+        "loading the whole season at once",
+    )
+    p.add_argument(
+        "--incremental",
+        dest="incremental",
+        action="store_true",
+        default=False,
+        help="Fetch newest decks first and stop once pages are older than "
+        "the last update",
+    )
+    p.add_argument(
+        "--adaptive",
+        dest="adaptive",
+        action="store_true",
+        default=False,
+        help="Tune the request rate and page size from response latencies",
+    )
+    p.add_argument(
+        "--checkpoint",
+        dest="checkpoint",
+        action="store_true",
+        default=False,
+        help="Store fetched pages in BUCKET so a failed run can resume",
+    )
+    p.add_argument(
+        "--arrow",
+        dest="arrow",
+        action="store_true",
+        default=False,
+        help="Decode, transform and load decks as pyarrow Tables",
+    )
+    p.add_argument(
+        "--binary-copy",
+        dest="binary_copy",
+        action="store_true",
+        default=False,
+        help="COPY rows to the database in PostgreSQL's binary format",
+    )
+    p.add_argument(
+        "--server-delta",
+        dest="server_delta",
+        action="store_true",
+        default=False,
+        help="Let the database find which decks changed from a staging table",
+    )
+    p.add_argument(
+        "--parallel-load",
+        dest="parallel_load",
+        type=int,
+        default=0,
+        help="Stage tables on this many connections at once, "
+        "then merge them in one transaction",
+    )
+    p.add_argument(
+        "--chunk-rows",
+        dest="chunk_rows",
+        type=int,
+        default=None,
+        help="Commit decks and their cards N decks at a time, "
+        "so an interrupted load resumes from the last chunk",
+    )
+    p.add_argument(
+        "--cache",
+        dest="cache",
+        action="store_true",
+        default=False,
+        help="Merge the transformed decks into an Arrow file of the season "
+        "in CACHE_FOLDER, to reopen memory-mapped later",
+    )
+    p.add_argument(
+        "--full-decode",
+        dest="full_decode",
+        action="store_true",
+        default=False,
+        help="Parse whole deck pages with response.json() instead of "
+        "projecting them to the schema's columns with ColumnarDecoder",
+    )
     import time
 
     args = p.parse_args()
+    if args.parallel_load and args.chunk_rows:
+        p.error("--chunk-rows can't be used with --parallel-load")
     s = time.perf_counter()
     try:
         main(**vars(args))
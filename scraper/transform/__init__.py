@@ -1 +1,4 @@
 from .transformer import Transformer
+from .arrow_transformer import ArrowTransformer, arrow_schema
+from .decklists import Decklists, Board
+from .season_cache import SeasonCache
@@ -0,0 +1,118 @@
+from typing import Any, Dict, List
+import logging
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from .transformer import URL_PREFIX, COLORS
+
+# maindeck and sideboard, in format {'n':int, 'name':str}
+BOARD_TYPE = pa.list_(pa.struct([("n", pa.int16()), ("name", pa.string())]))
+ARROW_TYPES = {
+    "int64": pa.int64(),
+    "int16": pa.int16(),
+    "int8": pa.int8(),
+    "Int8": pa.int8(),
+    "bool": pa.bool_(),
+    "string": pa.string(),
+    "datetime64[ns]": pa.timestamp("ns"),
+    "category": pa.dictionary(pa.int32(), pa.string()),
+    "object": BOARD_TYPE,
+}
+
+
+def arrow_schema(schema: Dict[str, Dict[str, Any]]) -> pa.Schema:
+    """
+    Compiles transform/schema.json into an Arrow schema.
+    Nullable pandas dtypes such as Int8 map to the same Arrow type,
+    since every Arrow type can hold nulls.
+    """
+    return pa.schema(
+        [pa.field(source, ARROW_TYPES[dct["dtype"]]) for source, dct in schema.items()]
+    )
+
+
+class ArrowTransformer:
+    """
+    Does what Transformer does, but builds a pyarrow.Table that follows
+    `arrow_schema(schema)`, so boards stay as list<struct<n, name>>
+    instead of python lists of dicts.
+    """
+
+    def __init__(self, schema: Dict[str, Dict[str, Any]]):
+        self.schema = schema
+        self.arrow_schema = arrow_schema(schema)
+
+    @staticmethod
+    def to_table(records: "pa.Table | pd.DataFrame | List[Dict[str, Any]]") -> pa.Table:
+        if isinstance(records, pa.Table):
+            return records
+        if isinstance(records, pd.DataFrame):
+            return pa.Table.from_pandas(records, preserve_index=False)
+        return pa.Table.from_pylist(records)
+
+    @staticmethod
+    def color_flags(colors: pa.ChunkedArray) -> Dict[str, pa.Array]:
+        colors = colors.combine_chunks()
+        flat = pc.list_flatten(colors)
+        parents = pc.list_parent_indices(colors).to_numpy()
+        flags = {}
+        for c in COLORS:
+            has_color = np.zeros(len(colors), dtype=bool)
+            is_color = pc.equal(flat, c).to_numpy(zero_copy_only=False)
+            has_color[parents[is_color]] = True
+            flags[f"colorHas{c}"] = pa.array(has_color)
+        return flags
+
+    def cast(self, source: str, column: "pa.Array | pa.ChunkedArray") -> pa.Array:
+        dct = self.schema[source]
+        arrow_type = self.arrow_schema.field(source).type
+        if dct["dtype"] != "category":
+            return pc.cast(column, arrow_type)
+        column = pc.cast(column, pa.string())
+        if "categories" not in dct:
+            return pc.dictionary_encode(column)
+        # like pandas set_categories, other values become null
+        categories = pa.array(dct["categories"], pa.string())
+        indices = pc.index_in(column, value_set=categories)
+        return pa.DictionaryArray.from_arrays(
+            pc.cast(indices, pa.int32()).combine_chunks(), categories
+        )
+
+    def execute(
+        self, records: "pa.Table | pd.DataFrame | List[Dict[str, Any]]"
+    ) -> pa.Table:
+        table = self.to_table(records)
+        columns = {}
+        columns["url"] = pc.binary_join_element_wise(
+            URL_PREFIX, pc.cast(table["url"], pa.string()), ""
+        )
+        omw = pc.utf8_rtrim(pc.cast(table["omw"], pa.string()), characters="%")
+        omw = pc.if_else(pc.equal(omw, ""), pa.scalar(None, pa.string()), omw)
+        columns["omwPercent"] = pc.round(pc.cast(omw, pa.float64()))
+        wins, losses, draws = (
+            pc.cast(table[c], pa.int64()) for c in ["wins", "losses", "draws"]
+        )
+        columns["matches"] = pc.add(pc.add(wins, losses), draws)
+        archetype_id = pc.cast(table["archetypeId"], pa.float64())
+        columns["archetypeId"] = pc.fill_null(archetype_id, -1)
+        archetype_name = pc.cast(table["archetypeName"], pa.string())
+        columns["archetypeName"] = pc.if_else(
+            pc.fill_null(pc.equal(archetype_name, ""), True), "N/A", archetype_name
+        )
+        columns.update(self.color_flags(table["colors"]))
+        for target, source in [
+            ("createdDatetime", "createdDate"),
+            ("updatedDatetime", "updatedDate"),
+        ]:
+            seconds = pc.cast(table[source], pa.int64())
+            columns[target] = pc.cast(seconds, pa.timestamp("s"))
+
+        logging.info(f"Building table with schema {self.arrow_schema}")
+        arrays = []
+        for source in self.schema:
+            column = columns[source] if source in columns else table[source]
+            arrays.append(self.cast(source, column))
+        return pa.Table.from_arrays(arrays, schema=self.arrow_schema)
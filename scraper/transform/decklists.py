@@ -0,0 +1,160 @@
+from dataclasses import dataclass, field
+from itertools import chain
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+BOARDS = ["maindeck", "sideboard"]
+
+
+@dataclass
+class Board:
+    """
+    Every deck's maindeck (or sideboard) in compressed sparse row form:
+    the cards of deck i are at `offsets[i]:offsets[i + 1]`
+    of `card_ids` and `counts`.
+    """
+
+    offsets: np.ndarray
+    card_ids: np.ndarray
+    counts: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def rows(self) -> np.ndarray:
+        """
+        Returns the deck each card belongs to.
+        """
+        return np.repeat(np.arange(len(self)), self.lengths)
+
+    def explode(self, decks: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Like pd.DataFrame.explode, for a frame whose i-th row is deck `decks[i]`.
+
+        Args:
+            decks (np.ndarray): deck index of each row, may repeat
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: row, card id and count
+            of each card in those decks
+        """
+        decks = np.asarray(decks, dtype=np.int64)
+        lengths = self.lengths[decks]
+        rows = np.repeat(np.arange(len(decks)), lengths)
+        # position of each card within its deck
+        starts = np.cumsum(lengths) - lengths
+        within = np.arange(lengths.sum()) - np.repeat(starts, lengths)
+        positions = np.repeat(self.offsets[decks], lengths) + within
+        return rows, self.card_ids[positions], self.counts[positions]
+
+    def take(self, decks: np.ndarray) -> "Board":
+        rows, card_ids, counts = self.explode(decks)
+        lengths = self.lengths[np.asarray(decks, dtype=np.int64)]
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        return Board(offsets, card_ids, counts)
+
+
+@dataclass
+class Decklists:
+    """
+    Maindecks and sideboards of a batch of decks, with card names interned
+    into `names` so each card is an int32 id instead of a {'n', 'name'} dict.
+    Deck i is the i-th row of the frame or table they were built from.
+    """
+
+    names: np.ndarray
+    boards: Dict[str, Board] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(next(iter(self.boards.values())))
+
+    @classmethod
+    def _from_flat(
+        cls,
+        lengths: Dict[str, np.ndarray],
+        names: Dict[str, "np.ndarray | List[str]"],
+        counts: Dict[str, np.ndarray],
+    ) -> "Decklists":
+        # one dictionary shared by both boards
+        all_names = np.concatenate([np.asarray(names[b], dtype=object) for b in BOARDS])
+        codes, uniques = pd.factorize(all_names)
+        codes = codes.astype(np.int32)
+        boards = {}
+        start = 0
+        for board in BOARDS:
+            end = start + len(names[board])
+            offsets = np.concatenate([[0], np.cumsum(lengths[board])]).astype(np.int64)
+            boards[board] = Board(
+                offsets, codes[start:end], np.asarray(counts[board], dtype=np.int16)
+            )
+            start = end
+        return cls(np.asarray(uniques, dtype=object), boards)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "Decklists":
+        lengths, names, counts = {}, {}, {}
+        for board in BOARDS:
+            decks = df[board].map(lambda b: b if isinstance(b, list) else [])
+            cards = list(chain.from_iterable(decks))
+            lengths[board] = decks.map(len).to_numpy()
+            names[board] = [card["name"] for card in cards]
+            counts[board] = np.fromiter(
+                (card["n"] for card in cards), dtype=np.int16, count=len(cards)
+            )
+        return cls._from_flat(lengths, names, counts)
+
+    @classmethod
+    def from_table(cls, table: pa.Table) -> "Decklists":
+        lengths, names, counts = {}, {}, {}
+        for board in BOARDS:
+            decks = table[board].combine_chunks()
+            cards = pc.list_flatten(decks)
+            lengths[board] = pc.fill_null(pc.list_value_length(decks), 0).to_numpy()
+            names[board] = cards.field("name").to_numpy(zero_copy_only=False)
+            counts[board] = cards.field("n").to_numpy(zero_copy_only=False)
+        return cls._from_flat(lengths, names, counts)
+
+    @classmethod
+    def build(cls, df: "pd.DataFrame | pa.Table") -> "Decklists":
+        if isinstance(df, pa.Table):
+            return cls.from_table(df)
+        return cls.from_frame(df)
+
+    def take(self, decks: np.ndarray) -> "Decklists":
+        boards = {name: board.take(decks) for name, board in self.boards.items()}
+        return Decklists(self.names, boards)
+
+    def to_frame(self, board: str, deck_ids: np.ndarray) -> pd.DataFrame:
+        """
+        Returns the board as rows of deckId, n and name,
+        with names as a categorical over the shared dictionary.
+        """
+        _board = self.boards[board]
+        return pd.DataFrame(
+            {
+                "deckId": np.asarray(deck_ids)[_board.rows()],
+                "n": _board.counts,
+                "name": pd.Categorical.from_codes(_board.card_ids, self.names),
+            }
+        )
+
+    def to_table(self, board: str, deck_ids: np.ndarray) -> pa.Table:
+        _board = self.boards[board]
+        names = pa.DictionaryArray.from_arrays(
+            pa.array(_board.card_ids), pa.array(self.names, pa.string())
+        )
+        return pa.table(
+            {
+                "deckId": np.asarray(deck_ids)[_board.rows()],
+                "n": _board.counts,
+                "name": names,
+            }
+        )
@@ -0,0 +1,173 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional, Tuple
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from .decklists import BOARDS, Decklists
+
+# schema metadata the cache is validated with
+MAX_UPDATED_KEY = b"maxUpdatedDatetime"
+
+
+@dataclass
+class SeasonCache:
+    """
+    Keeps each season's transformed decks, decklists included, as an
+    uncompressed Arrow IPC file in a local folder.
+    Files are opened memory-mapped, so reading one takes no time and the
+    columns are only paged in as they're used.
+
+    Runs only fetch what changed, so saving merges the new decks into the
+    cached season, keeping the latest row of each deck. Runs in batches
+    append each one to a file of its own, and finish merges them at once.
+    A cache is valid for the max updatedDatetime it was saved with.
+    """
+
+    folder: str = "cache"
+
+    def path(self, seasonId: int) -> str:
+        return os.path.join(self.folder, f"season-{seasonId}.arrow")
+
+    @staticmethod
+    def max_updated(table: pa.Table) -> Optional[datetime]:
+        metadata = table.schema.metadata or {}
+        if MAX_UPDATED_KEY not in metadata:
+            return None
+        return datetime.fromisoformat(metadata[MAX_UPDATED_KEY].decode())
+
+    def load(
+        self, seasonId: int, max_updated: Optional[datetime] = None
+    ) -> Optional[pa.Table]:
+        """
+        Returns the cached season, memory-mapped, or None if there is none
+        or it isn't of `max_updated`, e.g. Watermark.max_updated().
+        """
+        path = self.path(seasonId)
+        if not os.path.exists(path):
+            return None
+        with pa.memory_map(path, "r") as source:
+            table = pa.ipc.open_file(source).read_all()
+        cached = self.max_updated(table)
+        if max_updated is not None and cached != max_updated:
+            logging.info(
+                f"Cache of season {seasonId} is of {cached}, not {max_updated}"
+            )
+            return None
+        return table
+
+    def load_frame(
+        self, seasonId: int, max_updated: Optional[datetime] = None
+    ) -> Optional[Tuple[pd.DataFrame, Decklists]]:
+        """
+        Like load, as the frame and Decklists the aggregators take.
+        Columns without nulls stay views of the mapped file.
+        """
+        table = self.load(seasonId, max_updated)
+        if table is None:
+            return None
+        decklists = Decklists.from_table(table)
+        df = table.drop(BOARDS).to_pandas(split_blocks=True)
+        return df, decklists
+
+    @staticmethod
+    def _latest_rows(table: pa.Table) -> np.ndarray:
+        ids = table["id"].to_numpy()
+        updated = table["updatedDatetime"].to_numpy().astype("datetime64[ns]")
+        # the later of two rows of the same deck wins, in order of the table
+        order = np.lexsort((np.arange(len(ids))[::-1], -updated.view(np.int64), ids))
+        is_first = np.append(True, ids[order][1:] != ids[order][:-1])
+        return np.sort(order[is_first])
+
+    @staticmethod
+    def _to_table(df: "pd.DataFrame | pa.Table") -> pa.Table:
+        if isinstance(df, pd.DataFrame):
+            return pa.Table.from_pandas(df, preserve_index=False)
+        return df
+
+    def _batch_paths(self, seasonId: int) -> List[str]:
+        if not os.path.isdir(self.folder):
+            return []
+        prefix = f"season-{seasonId}.batch-"
+        names = sorted(f for f in os.listdir(self.folder) if f.startswith(prefix))
+        return [os.path.join(self.folder, f) for f in names]
+
+    def append(self, seasonId: int, df: "pd.DataFrame | pa.Table") -> None:
+        """
+        Writes a batch of a run next to the cache, for finish to merge in,
+        so a run's batches don't have to be kept in memory until then.
+        """
+        table = self._to_table(df)
+        os.makedirs(self.folder, exist_ok=True)
+        number = len(self._batch_paths(seasonId))
+        path = os.path.join(self.folder, f"season-{seasonId}.batch-{number:05}.arrow")
+        with pa.OSFile(path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+    def finish(self, seasonId: int) -> Optional[pa.Table]:
+        """
+        Merges the batches appended since the last finish into the cached
+        season, see save, and removes them.
+        Batches left by a run that failed are merged too.
+        """
+        paths = self._batch_paths(seasonId)
+        if not paths:
+            return self.load(seasonId)
+        tables = []
+        for path in paths:
+            with pa.memory_map(path, "r") as source:
+                tables.append(pa.ipc.open_file(source).read_all())
+        table = self._merge(seasonId, pa.concat_tables(tables, promote=True))
+        for path in paths:
+            os.remove(path)
+        return table
+
+    def save(self, seasonId: int, df: "pd.DataFrame | pa.Table") -> pa.Table:
+        """
+        Merges `df` into the cached season and writes it back.
+        Returns the merged table, memory-mapped,
+        with its max updatedDatetime in its metadata.
+        """
+        return self._merge(seasonId, self._to_table(df))
+
+    def _merge(self, seasonId: int, table: pa.Table) -> pa.Table:
+        cached = self.load(seasonId)
+        if cached is not None:
+            try:
+                table = pa.concat_tables([cached, table.cast(cached.schema)])
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError, ValueError) as e:
+                logging.warning(f"Replacing cache of season {seasonId}: {e}")
+        # batches of an IPC file share one dictionary per column
+        table = table.unify_dictionaries()
+        keep = self._latest_rows(table)
+        latest = pd.Timestamp(np.max(table["updatedDatetime"].to_numpy()))
+        # microseconds, like Watermark.max_updated
+        max_updated = latest.floor("us").to_pydatetime()
+        metadata = {
+            **(table.schema.metadata or {}),
+            MAX_UPDATED_KEY: max_updated.isoformat().encode(),
+        }
+        schema = table.schema.with_metadata(metadata)
+        os.makedirs(self.folder, exist_ok=True)
+        path = self.path(seasonId)
+        # readers keep the file they mapped, the new one replaces it whole
+        with pa.OSFile(f"{path}.tmp", "wb") as sink:
+            with pa.ipc.new_file(sink, schema) as writer:
+                # a batch at a time, as the inputs are mapped, not in memory
+                start = 0
+                for batch in table.to_batches():
+                    end = start + batch.num_rows
+                    rows = keep[
+                        np.searchsorted(keep, start) : np.searchsorted(keep, end)
+                    ]
+                    if len(rows):
+                        writer.write_batch(batch.take(pa.array(rows - start)))
+                    start = end
+        os.replace(f"{path}.tmp", path)
+        logging.info(f"Cached {len(keep)} decks of season {seasonId} at {path}")
+        return self.load(seasonId)
@@ -1,7 +1,12 @@
+import numpy as np
 import pandas as pd
+from itertools import chain
 from typing import List, Callable, Dict, Any
 import logging
 
+URL_PREFIX = "https://pennydreadfulmagic.com"
+COLORS = "WUBRGC"
+
 
 class Transformer:
     def __init__(
@@ -11,35 +16,42 @@ class Transformer:
         self.schema = schema
         sources = set(self.schema.keys())
         self.source_columns = list(sources)
+        self.dtypes = {}
+        for source, dct in self.schema.items():
+            if dct["dtype"] == "object":
+                continue
+            if dct["dtype"] == "category" and "categories" in dct:
+                self.dtypes[source] = pd.CategoricalDtype(dct["categories"])
+            else:
+                self.dtypes[source] = dct["dtype"]
 
-    def execute(self, df: pd.DataFrame) -> pd.DataFrame:
-        df["url"] = "https://pennydreadfulmagic.com" + df["url"]
-        df["omw"] = df["omw"].str.replace("%", "")
-        df["omwPercent"] = df["omw"].replace("", None)
-        df["matches"] = df[["wins", "losses", "draws"]].sum(axis=1)
+    @staticmethod
+    def color_flags(colors: pd.Series) -> Dict[str, np.ndarray]:
+        # one pass over every deck's colors into a bitmask, one bit per colour
+        lengths = colors.map(len).to_numpy()
+        bits = pd.Series(list(chain.from_iterable(colors)), dtype=object)
+        bits = bits.map({c: 1 << i for i, c in enumerate(COLORS)})
+        bits = bits.fillna(0).to_numpy(dtype=np.int8)
+        mask = np.zeros(len(colors), dtype=np.int8)
+        np.bitwise_or.at(mask, np.repeat(np.arange(len(colors)), lengths), bits)
+        return {f"colorHas{c}": (mask & (1 << i)) != 0 for i, c in enumerate(COLORS)}
+
+    def execute(self, df: "pd.DataFrame | List[Dict[str, Any]]") -> pd.DataFrame:
+        if isinstance(df, list):
+            # whole decks from response.json(), without ColumnarDecoder
+            df = pd.DataFrame(df)
+        df["url"] = URL_PREFIX + df["url"]
+        omw = pd.to_numeric(df["omw"].str.rstrip("%"), errors="coerce")
+        df["omwPercent"] = omw.round()
+        df["matches"] = df["wins"] + df["losses"] + df["draws"]
         df["archetypeId"] = df["archetypeId"].fillna(-1)
-        df["archetypeName"] = df["archetypeName"].fillna("N/A")
-        df["archetypeName"] = df["archetypeName"].replace({"": "N/A"})
-        for c in "WUBRGC":
-            df[f"colorHas{c}"] = df["colors"].apply(lambda x: c in x)
+        archetype_missing = df["archetypeName"].isna() | (df["archetypeName"] == "")
+        df["archetypeName"] = df["archetypeName"].mask(archetype_missing, "N/A")
+        for column, flags in self.color_flags(df["colors"]).items():
+            df[column] = flags
         df["createdDatetime"] = pd.to_datetime(df["createdDate"], unit="s")
-        df["createdDate"] = df["createdDatetime"].dt.strftime("%Y%m%d")
         df["updatedDatetime"] = pd.to_datetime(df["updatedDate"], unit="s")
-        df["updatedDate"] = df["updatedDatetime"].dt.strftime("%Y%m%d")
 
-        keep_columns = []
-        for source, dct in self.schema.items():
-            if dct["dtype"] == "object":
-                logging.info(f"Setting {source} as dtype=object")
-                keep_columns.append(source)
-                continue
-            else:
-                logging.info(f"Setting {source} as dtype={dct['dtype']}")
-                df.loc[df[source].isna(), source] = None
-                df[source] = df[source].astype(dct["dtype"])
-            if dct["dtype"] == "category" and "categories" in dct:
-                logging.info(f"Setting categories for {source} as {dct['categories']}")
-                df[source] = df[source].cat.set_categories(dct["categories"])
-            keep_columns.append(source)
-        df = df[keep_columns].copy()
+        logging.info(f"Setting dtypes {self.dtypes}")
+        df = df[list(self.schema.keys())].astype(self.dtypes)
         return df
@@ -0,0 +1,153 @@
+import json
+import os
+import sys
+import threading
+import time
+
+import pytest
+import requests
+
+SCRAPER_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), "scraper")
+
+# modules are imported as the scraper runs them, from its folder,
+# where some of them read headers.json and the schema as they're imported
+sys.path.insert(0, SCRAPER_FOLDER)
+os.chdir(SCRAPER_FOLDER)
+
+from database import Database  # noqa: E402
+from extract.paginator import Paginator  # noqa: E402
+
+
+class FakeResponse:
+    def __init__(self, data: dict, status_code: int = 200):
+        self.status_code = status_code
+        self.content = json.dumps(data).encode()
+        self.headers = {}
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class FakeServer:
+    """
+    Serves `total` decks with increasing ids, `pageSize` of them per page,
+    at most `cap`, shuffling how long each page takes.
+    """
+
+    def __init__(self, total: int, cap: int = 1000, delays: bool = False):
+        self.total = total
+        self.cap = cap
+        self.delays = delays
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def get(self, url, headers=None, params=None):
+        size = min(params.get("pageSize", 10), self.cap)
+        page = params.get("page", 0)
+        with self.lock:
+            self.requests.append(dict(params))
+        if self.delays:
+            # later pages come back first
+            time.sleep(0.002 * ((7 - page) % 8))
+        objs = [
+            {"id": i} for i in range(page * size, min((page + 1) * size, self.total))
+        ]
+        return FakeResponse({"total": self.total, "objects": objs})
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    def make(*args, **kwargs) -> FakeServer:
+        server = FakeServer(*args, **kwargs)
+        monkeypatch.setattr(requests, "Session", lambda: server)
+        return server
+
+    return make
+
+
+def ids_of(paginator: Paginator) -> list:
+    return [obj["id"] for page in paginator.execute() for obj in page]
+
+
+class FakeCursor:
+    def __init__(self, connection: "FakeConnection"):
+        self.connection = connection
+        self.rowcount = -1
+        self.result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, sql: str, params=None):
+        sql = " ".join(sql.split())
+        self.connection.log.append(("sql", sql, params))
+        self.result = self.connection.handler(sql, params) or []
+
+    def copy_expert(self, sql: str, f, size: int = 8192):
+        data = f.read()
+        self.connection.log.append(("copy", " ".join(sql.split()), len(data)))
+        # rows of csv, like COPY reports them, test values have no newlines
+        self.rowcount = data.count(b"\n") if "CSV" in sql else -1
+
+    def fetchone(self):
+        return self.result[0] if self.result else None
+
+    def fetchall(self):
+        return self.result
+
+
+class FakeConnection:
+    """
+    Records the SQL it's given, answering queries with `handler`,
+    which returns the rows of a query or None. Counts are 0 by default.
+    """
+
+    closed = 0
+
+    def __init__(self):
+        self.log = []
+        self.handler = self.count_nothing
+
+    @staticmethod
+    def count_nothing(sql: str, params) -> "list | None":
+        return [(0,)] if sql.startswith("SELECT count(1)") else None
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.log.append(("commit",))
+
+    def rollback(self):
+        self.log.append(("rollback",))
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def statements(self, pattern: str = "") -> list:
+        return [e[1] for e in self.log if e[0] == "sql" and pattern in e[1]]
+
+
+@pytest.fixture
+def fake_db(monkeypatch) -> FakeConnection:
+    connection = FakeConnection()
+    monkeypatch.setattr(Database, "connection", lambda self: connection)
+    return connection
@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+import json
+
+import pytest
+
+from extract import CheckpointStore
+from extract.paginator import Paginator
+from conftest import ids_of
+
+
+@pytest.fixture
+def store(tmp_path) -> CheckpointStore:
+    return CheckpointStore(bucket=str(tmp_path))
+
+
+def paginator(store: CheckpointStore) -> Paginator:
+    return Paginator(
+        "url",
+        page_size=10,
+        min_time_between_calls=0.001,
+        params={"seasonId": 30},
+        checkpoint=store,
+    )
+
+
+def test_key_ignores_params_that_change_between_runs():
+    key = CheckpointStore.key("url", {"seasonId": 30, "page": 1, "pageSize": 10})
+    assert key == CheckpointStore.key("url", {"seasonId": 30, "since": 5})
+    assert key != CheckpointStore.key("url", {"seasonId": 31})
+
+
+def test_rerun_resumes_after_the_stored_pages(server, store):
+    fake = server(total=100)
+    pages = paginator(store).execute()
+    first_ids = [obj["id"] for _, objs in zip(range(3), pages) for obj in objs]
+    pages.close()
+    assert first_ids == list(range(30))
+
+    fake.requests.clear()
+    assert ids_of(paginator(store)) == list(range(100))
+    # only the pages after the checkpoint are fetched again
+    assert [r["page"] for r in fake.requests] == list(range(3, 10))
+
+
+def test_cleared_checkpoint_starts_over(server, store):
+    fake = server(total=50)
+    first = paginator(store)
+    assert ids_of(first) == list(range(50))
+    first.clear_checkpoint()
+
+    fake.requests.clear()
+    assert ids_of(paginator(store)) == list(range(50))
+    assert len(fake.requests) == 5
+
+
+def test_old_cursor_is_ignored(store):
+    store.save_page("key", 0, [{"id": 1}], {"total": 1, "offset": 1})
+    assert store.load_cursor("key")["pages"] == 1
+
+    path = store._path("key", "cursor.json")
+    cursor = json.loads(store.fs.cat_file(path))
+    cursor["updatedAt"] = (datetime.now() - timedelta(days=1)).isoformat()
+    store.fs.pipe_file(path, json.dumps(cursor).encode())
+    assert store.load_cursor("key") is None
+    assert not store.fs.exists(store._path("key"))
@@ -0,0 +1,98 @@
+import struct
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from load.copy_stream import (
+    BINARY_SIGNATURE,
+    BINARY_TRAILER,
+    POSTGRES_EPOCH_US,
+    binary_types,
+    copy_stream,
+)
+
+COLUMNS = ["id", "seasonId", "finish", "retired", "createdDatetime", "decklistHash"]
+
+
+@pytest.fixture
+def decks() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "id": [1, 70000],
+            "seasonId": [30, 31],
+            "finish": [3.0, np.nan],
+            "retired": [True, False],
+            "createdDatetime": pd.to_datetime(
+                ["2024-01-02 03:04:05.678901", "1999-12-31"]
+            ),
+            "decklistHash": ["abc", None],
+        }
+    )
+
+
+def parse(data: bytes, types: dict) -> list:
+    """
+    Reads rows back from binary COPY data, the way the server would.
+    """
+    assert data.startswith(BINARY_SIGNATURE)
+    assert data.endswith(BINARY_TRAILER)
+    formats = {"int2": ">h", "int4": ">i", "bool": "?", "timestamp": ">q"}
+    pos = len(BINARY_SIGNATURE)
+    rows = []
+    while pos < len(data) - len(BINARY_TRAILER):
+        (num_fields,) = struct.unpack_from(">h", data, pos)
+        assert num_fields == len(types)
+        pos += 2
+        row = []
+        for pg_type in types.values():
+            (length,) = struct.unpack_from(">i", data, pos)
+            pos += 4
+            if length == -1:
+                row.append(None)
+                continue
+            raw = data[pos : pos + length]
+            pos += length
+            if pg_type == "text":
+                row.append(raw.decode("utf-8"))
+            else:
+                row.append(struct.unpack(formats[pg_type], raw)[0])
+        rows.append(row)
+    return rows
+
+
+def timestamp(value: str) -> int:
+    return int(pd.Timestamp(value).value // 1000) - POSTGRES_EPOCH_US
+
+
+def test_types_come_from_the_models():
+    assert binary_types("decks", COLUMNS) == {
+        "id": "int4",
+        "seasonId": "int2",
+        "finish": "int2",
+        "retired": "bool",
+        "createdDatetime": "timestamp",
+        "decklistHash": "text",
+    }
+    assert binary_types("temp_table", COLUMNS) is None
+
+
+@pytest.mark.parametrize("as_table", [False, True])
+def test_binary_rows_round_trip(decks, as_table):
+    df = pa.Table.from_pandas(decks) if as_table else decks
+    # a chunk per row, which mustn't change the data
+    stream, copy_format = copy_stream(df, "decks", COLUMNS, "binary", chunk_rows=1)
+    assert copy_format == "binary"
+    rows = parse(stream.read(), binary_types("decks", COLUMNS))
+    assert rows == [
+        [1, 30, 3, True, timestamp("2024-01-02 03:04:05.678901"), "abc"],
+        [70000, 31, None, False, timestamp("1999-12-31"), None],
+    ]
+    assert stream.bytes_sent > 0
+
+
+def test_tables_without_a_model_fall_back_to_csv(decks):
+    stream, copy_format = copy_stream(decks[["id"]], "temp_table", ["id"], "binary")
+    assert copy_format == "csv"
+    assert stream.read() == b"1\n70000\n"
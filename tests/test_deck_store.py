@@ -0,0 +1,112 @@
+import pandas as pd
+import pytest
+
+from load import DeckStore, ParquetWriter, PartitionPlanner
+
+PARTITION_COLS = ["seasonId", "archetypeId", "archetypeName"]
+START = pd.Timestamp("2024-01-01")
+
+
+def make_decks(updated: "pd.Timestamp | None" = None) -> pd.DataFrame:
+    ids = list(range(1, 25))
+    created = [START + pd.Timedelta(days=i) for i in ids]
+    return pd.DataFrame(
+        {
+            "id": ids,
+            "seasonId": [30 + i % 2 for i in ids],
+            "archetypeId": [i % 3 for i in ids],
+            "archetypeName": [f"Archetype {i % 3}" for i in ids],
+            "sourceName": ["League" if i % 4 else "Gatherling" for i in ids],
+            "createdDatetime": created,
+            # a deck is updated after it's created
+            "updatedDatetime": updated or [c + pd.Timedelta(hours=1) for c in created],
+            "wins": 0,
+        }
+    )
+
+
+@pytest.fixture
+def store(tmp_path) -> DeckStore:
+    writer = ParquetWriter(str(tmp_path), planner=PartitionPlanner(min_file_bytes=1))
+    writer.execute(make_decks(), "decks.parquet", PARTITION_COLS)
+    return DeckStore(str(tmp_path), batch_size=5)
+
+
+def ids(df: pd.DataFrame) -> list:
+    return sorted(df["id"].tolist())
+
+
+@pytest.mark.parametrize(
+    "filters,expected",
+    [
+        ({}, lambda i: True),
+        ({"seasons": [31]}, lambda i: i % 2 == 1),
+        ({"archetypes": [0, 2]}, lambda i: i % 3 != 1),
+        ({"sources": ["Gatherling"]}, lambda i: i % 4 == 0),
+        ({"seasons": [30], "archetypes": [1]}, lambda i: i % 2 == 0 and i % 3 == 1),
+        (
+            {
+                "since": START + pd.Timedelta(days=5),
+                "until": START + pd.Timedelta(days=9),
+            },
+            lambda i: 5 <= i < 9,
+        ),
+    ],
+)
+def test_filters(store, filters, expected):
+    df = store.to_pandas(["id"], **filters)
+    assert ids(df) == [i for i in range(1, 25) if expected(i)]
+
+
+def test_partitions_are_picked_from_the_manifest(store):
+    manifest = store.manifest()
+    files = store.files(manifest, store._filters([30], [1], None))
+    assert files
+    assert all(f.startswith("seasonId=30/archetypeId=1/") for f in files)
+    assert len(files) < len(manifest.files())
+
+
+def test_batches_match_the_table(store):
+    batches = list(store.batches(["id", "wins"], as_pandas=True, seasons=[30]))
+    assert all(len(b) <= 5 for b in batches)
+    assert ids(pd.concat(batches)) == ids(store.to_pandas(["id"], seasons=[30]))
+
+
+def test_decklists_are_left_out_by_default(store):
+    assert "maindeck" not in store.to_table().column_names
+
+
+def test_decks_written_again_are_read_once(store, tmp_path):
+    writer = ParquetWriter(str(tmp_path), planner=PartitionPlanner(min_file_bytes=1))
+    updated = make_decks(START + pd.Timedelta(days=60)).iloc[:6].assign(wins=3)
+    writer.execute(updated, "decks.parquet", PARTITION_COLS)
+
+    df = store.to_pandas(["id", "wins"])
+    assert ids(df) == list(range(1, 25))
+    assert df.set_index("id")["wins"].to_dict() == {
+        i: 3 if i <= 6 else 0 for i in range(1, 25)
+    }
+    batches = pd.concat(store.batches(["wins", "id"], as_pandas=True))
+    assert list(batches.columns) == ["wins", "id"]
+    assert (
+        batches.sort_values("id")["wins"].tolist()
+        == df.sort_values("id")["wins"].tolist()
+    )
+
+
+def read_batches(store: DeckStore, columns: list, **filters) -> pd.DataFrame:
+    return pd.concat(store.batches(columns, as_pandas=True, **filters))
+
+
+@pytest.mark.parametrize("read", [DeckStore.to_pandas, read_batches])
+def test_deck_that_changed_archetype_is_only_in_the_new_one(store, tmp_path, read):
+    writer = ParquetWriter(str(tmp_path), planner=PartitionPlanner(min_file_bytes=1))
+    moved = make_decks(START + pd.Timedelta(days=60)).iloc[[2]]
+    moved = moved.assign(archetypeId=1, archetypeName="Archetype 1", wins=4)
+    writer.execute(moved, "decks.parquet", PARTITION_COLS)
+
+    # its old version is still in the files of archetype 0
+    assert 3 not in read(store, ["id"], archetypes=[0])["id"].tolist()
+    df = read(store, ["id", "wins"], archetypes=[1])
+    assert df.loc[df["id"] == 3, "wins"].tolist() == [4]
+    assert ids(read(store, ["id"])) == list(range(1, 25))
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from transform.decklists import BOARDS, Decklists
+
+
+@pytest.fixture
+def decks() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "id": [11, 12, 13, 14],
+            "maindeck": [
+                [{"n": 4, "name": "Ponder"}, {"n": 2, "name": "Island"}],
+                [],
+                [{"n": 1, "name": "Island"}],
+                [{"n": 3, "name": "Shock"}, {"n": 4, "name": "Ponder"}],
+            ],
+            "sideboard": [
+                [{"n": 2, "name": "Shock"}],
+                None,
+                [],
+                [{"n": 1, "name": "Negate"}],
+            ],
+        }
+    )
+
+
+def exploded(df: pd.DataFrame, board: str) -> pd.DataFrame:
+    # how Loader split the boards before Decklists
+    cards_df = df[["id", board]].explode(board)
+    cards_df = cards_df.dropna(subset=[board]).reset_index(drop=True)
+    board_df = pd.DataFrame(cards_df[board].values.tolist())
+    cards_df = pd.concat([cards_df, board_df], axis=1).drop(columns=board)
+    cards_df.columns = ["deckId", "n", "name"]
+    return cards_df
+
+
+@pytest.mark.parametrize("board", BOARDS)
+def test_to_frame_matches_explode(decks, board):
+    decklists = Decklists.from_frame(decks)
+    frame = decklists.to_frame(board, decks["id"].to_numpy())
+    expected = exploded(decks, board)
+    assert frame["deckId"].tolist() == expected["deckId"].tolist()
+    assert frame["n"].tolist() == expected["n"].tolist()
+    assert frame["name"].astype(str).tolist() == expected["name"].tolist()
+
+
+def test_boards_share_one_dictionary(decks):
+    decklists = Decklists.from_frame(decks)
+    assert sorted(decklists.names) == ["Island", "Negate", "Ponder", "Shock"]
+    assert len(decklists) == len(decks)
+
+
+@pytest.mark.parametrize("board", BOARDS)
+def test_from_table_matches_from_frame(decks, board):
+    from_frame = Decklists.from_frame(decks)
+    from_table = Decklists.from_table(pa.Table.from_pandas(decks))
+    ids = decks["id"].to_numpy()
+    pd.testing.assert_frame_equal(
+        from_table.to_frame(board, ids).astype({"name": str}),
+        from_frame.to_frame(board, ids).astype({"name": str}),
+    )
+
+
+def test_take_keeps_the_decks_in_order(decks):
+    decklists = Decklists.from_frame(decks)
+    rows = np.array([3, 0])
+    frame = decklists.take(rows).to_frame("maindeck", decks["id"].to_numpy()[rows])
+    assert frame["deckId"].tolist() == [14, 14, 11, 11]
+    assert frame["name"].astype(str).tolist() == ["Shock", "Ponder", "Ponder", "Island"]
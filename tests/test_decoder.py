@@ -0,0 +1,36 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from extract import ColumnarDecoder
+from transform import Transformer, ArrowTransformer
+
+with open("transform/schema.json") as f:
+    SCHEMA = json.load(f)
+with open(os.path.join(os.path.dirname(__file__), "default_values.json")) as f:
+    DECK = json.load(f)
+
+
+def page(num_decks: int) -> dict:
+    # ids within the schema's int16 personId, which pyarrow checks
+    objs = [
+        {**DECK, "id": i, "personId": i, "updatedDate": DECK["updatedDate"] + i}
+        for i in range(num_decks)
+    ]
+    return {"page": 0, "total": num_decks, "objects": objs}
+
+
+@pytest.mark.parametrize("arrow", [False, True])
+def test_projected_pages_transform_like_whole_decks(arrow):
+    content = json.dumps(page(3)).encode()
+    decoder = ColumnarDecoder(SCHEMA, output=("arrow" if arrow else "pandas"))
+    transformer = (ArrowTransformer if arrow else Transformer)(schema=SCHEMA)
+
+    projected = transformer.execute(decoder.decode(content)["objects"])
+    # what --full-decode passes on, the decks from response.json()
+    whole = transformer.execute(json.loads(content)["objects"])
+    if arrow:
+        projected, whole = projected.to_pandas(), whole.to_pandas()
+    pd.testing.assert_frame_equal(projected, whole)
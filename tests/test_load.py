@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from database import Watermark
+from load import Loader
+from transform import Decklists
+
+
+def make_decks(ids: list) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "id": ids,
+            "seasonId": 30,
+            "updatedDatetime": pd.Timestamp("2024-01-01"),
+            "personId": 1,
+            "person": "someone",
+            "archetypeId": 2,
+            "archetypeName": "Burn",
+            "maindeck": [[{"n": 4, "name": "Shock"}] for _ in ids],
+            "sideboard": [[] for _ in ids],
+        }
+    )
+
+
+class MemoryLoader(Loader):
+    # watermarks without a database
+    def get_watermark(self, seasonId: int) -> Watermark:
+        return self._watermarks.setdefault(seasonId, Watermark(seasonId))
+
+
+@pytest.fixture(autouse=True)
+def in_tmp_path(tmp_path, monkeypatch):
+    # split_frame writes decks.csv for debugging
+    monkeypatch.chdir(tmp_path)
+
+
+def test_staged_ids_are_dropped_when_the_write_fails(fake_db, monkeypatch):
+    loader = MemoryLoader()
+
+    def fail(df_dict):
+        raise RuntimeError("connection lost")
+
+    monkeypatch.setattr(loader, "write", fail)
+    with pytest.raises(RuntimeError, match="connection lost"):
+        loader.execute(make_decks([1, 2]))
+    assert fake_db.statements(f"CREATE TABLE {loader.deck_ids_table}")
+    drop = f"DROP TABLE IF EXISTS {loader.deck_ids_table};"
+    assert fake_db.statements()[-1] == drop
+    # rolled back first, so the drop isn't refused by the failed transaction
+    assert fake_db.log.index(("rollback",)) < fake_db.log.index(("sql", drop, None))
+
+
+def test_staged_ids_are_dropped_after_a_load(fake_db):
+    loader = MemoryLoader()
+    loader.execute(make_decks([1, 2]))
+    assert fake_db.statements()[-1] == f"DROP TABLE IF EXISTS {loader.deck_ids_table};"
+    watermark = loader.get_watermark(30)
+    assert watermark.ids.tolist() == [1, 2]
+    np.testing.assert_array_equal(
+        watermark.changed(np.array([1]), np.array([0])), [False]
+    )
+
+
+def test_chunked_load_resumes_when_more_decks_were_fetched(fake_db):
+    # an interrupted load committed decks 1 to 4 in 2 chunks
+    loaded = [(i, pd.Timestamp("2024-01-01").to_pydatetime()) for i in range(1, 5)]
+
+    def handler(sql, params):
+        if "SELECT chunks FROM load_progress" in sql:
+            assert params == ("decks:30:2",)
+            return [(2,)]
+        if sql.startswith('SELECT id, "updatedDatetime" FROM decks'):
+            return [r for r in loaded if r[0] in params[0]]
+        return fake_db.count_nothing(sql, params)
+
+    fake_db.handler = handler
+    # the rerun also fetched decks 5 to 7, and deck 2 was updated since
+    decks = make_decks(list(range(1, 8)))
+    decks.loc[decks["id"] == 2, "updatedDatetime"] = pd.Timestamp("2024-01-02")
+    loader = MemoryLoader(chunk_rows=2)
+    loader.execute(decks)
+
+    rewritten = [
+        deck_id
+        for e in fake_db.log
+        if e[0] == "sql" and e[1].startswith("DELETE FROM maindecks")
+        for deck_id in e[2][0]
+    ]
+    assert sorted(rewritten) == [2, 5, 6, 7]
+    progress = [
+        e[2][1]
+        for e in fake_db.log
+        if e[0] == "sql" and "INSERT INTO load_progress" in e[1]
+    ]
+    assert progress == [3, 4]
+    assert fake_db.statements("DELETE FROM load_progress")
+    assert [c["chunk"] for c in loader.chunk_stats] == [0, 1]
@@ -0,0 +1,97 @@
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from load.manifest import Manifest, latest_per_id, partition_values
+
+
+def entry(path: str, rows: int, min_updated: str, max_updated: str) -> dict:
+    return {
+        "path": path,
+        "rows": rows,
+        "bytes": 10 * rows,
+        "minUpdatedDatetime": min_updated,
+        "maxUpdatedDatetime": max_updated,
+    }
+
+
+@pytest.fixture
+def manifest() -> Manifest:
+    manifest = Manifest(["seasonId", "archetypeId"])
+    manifest.add(
+        entry("seasonId=30/archetypeId=1/a-0.parquet", 5, "2024-01-02", "2024-01-05")
+    )
+    manifest.add(
+        entry("seasonId=30/archetypeId=1/b-0.parquet", 3, "2024-01-01", "2024-01-09")
+    )
+    manifest.add(
+        entry("seasonId=30/archetypeId=2/a-0.parquet", 2, "2024-01-03", "2024-01-04")
+    )
+    return manifest
+
+
+def test_files_are_grouped_by_partition(manifest):
+    assert sorted(manifest.partitions) == [
+        "seasonId=30/archetypeId=1",
+        "seasonId=30/archetypeId=2",
+    ]
+    assert len(manifest.files()) == 3
+    assert len(manifest.files("seasonId=30/archetypeId=1")) == 2
+    assert partition_values("seasonId=30/archetypeId=2") == {
+        "seasonId": "30",
+        "archetypeId": "2",
+    }
+
+
+def test_summary_adds_up_the_files(manifest):
+    assert manifest.summary("seasonId=30/archetypeId=1") == {
+        "rows": 8,
+        "bytes": 80,
+        "minUpdatedDatetime": "2024-01-01",
+        "maxUpdatedDatetime": "2024-01-09",
+    }
+
+
+def test_adding_a_path_again_replaces_its_entry(manifest):
+    manifest.add(
+        entry("seasonId=30/archetypeId=2/a-0.parquet", 7, "2024-01-03", "2024-01-04")
+    )
+    assert [f["rows"] for f in manifest.files("seasonId=30/archetypeId=2")] == [7]
+
+
+def test_remove_drops_emptied_partitions(manifest):
+    manifest.remove(
+        [
+            "seasonId=30/archetypeId=1/a-0.parquet",
+            "seasonId=30/archetypeId=2/a-0.parquet",
+        ]
+    )
+    assert list(manifest.partitions) == ["seasonId=30/archetypeId=1"]
+    assert manifest.summary("seasonId=30/archetypeId=1")["rows"] == 3
+
+
+def test_json_round_trip(manifest):
+    manifest.bucket_cols = ["archetypeId"]
+    manifest.num_buckets = 4
+    assert Manifest.from_json(manifest.to_json()) == manifest
+
+
+def test_latest_per_id_keeps_the_last_version():
+    table = pa.table(
+        {
+            "id": [1, 2, 1, 3, 2],
+            "updatedDatetime": pd.to_datetime(
+                ["2024-01-01", "2024-01-05", "2024-01-03", "2024-01-02", "2024-01-04"]
+            ),
+            "wins": [0, 5, 3, 2, 4],
+        }
+    )
+    latest = latest_per_id(table)
+    # sorted by updatedDatetime, like compacted files
+    assert latest["id"].to_pylist() == [3, 1, 2]
+    assert latest["wins"].to_pylist() == [2, 3, 5]
+
+
+def test_latest_per_id_leaves_tables_without_versions():
+    table = pa.table({"card": ["a", "a"], "n": [1, 2]})
+    assert latest_per_id(table) == table
@@ -0,0 +1,52 @@
+import time
+
+import pytest
+
+from extract import RateLimiter
+from extract.paginator import Paginator
+from conftest import ids_of
+
+
+def test_rate_limiter_spaces_calls():
+    limiter = RateLimiter(rate=200)
+    start_time = time.monotonic()
+    for _ in range(11):
+        limiter.acquire()
+    # the first call uses the initial token, the other 10 wait for theirs
+    assert time.monotonic() - start_time >= 10 / 200 * 0.9
+
+
+def test_rate_limiter_backoff_blocks_until_it_ends():
+    limiter = RateLimiter(rate=1000)
+    limiter.backoff(0.05)
+    start_time = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - start_time >= 0.04
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_pages_are_yielded_in_order(server, concurrency):
+    fake = server(total=95, delays=True)
+    paginator = Paginator(
+        "url", page_size=10, min_time_between_calls=0.001, concurrency=concurrency
+    )
+    assert ids_of(paginator) == list(range(95))
+    assert len(fake.requests) == 10
+
+
+def test_capped_page_size_is_detected(server):
+    server(total=250, cap=40)
+    paginator = Paginator("url", page_size=100, min_time_between_calls=0.001)
+    assert ids_of(paginator) == list(range(250))
+
+
+def test_stop_condition_stops_fetching(server):
+    fake = server(total=1000)
+    paginator = Paginator(
+        "url",
+        page_size=10,
+        min_time_between_calls=0.001,
+        stop_condition=lambda objs: objs[-1]["id"] >= 29,
+    )
+    assert ids_of(paginator) == list(range(30))
+    assert len(fake.requests) == 3
@@ -0,0 +1,111 @@
+import os
+
+import pandas as pd
+import pytest
+
+from load import ParquetWriter, PartitionPlanner
+
+NOW = pd.Timestamp("2024-01-01")
+
+
+@pytest.fixture
+def writer(tmp_path) -> ParquetWriter:
+    return ParquetWriter(str(tmp_path))
+
+
+@pytest.fixture
+def partitioned_writer(tmp_path) -> ParquetWriter:
+    # a folder for every archetype, however few decks it has
+    return ParquetWriter(str(tmp_path), planner=PartitionPlanner(min_file_bytes=1))
+
+
+def decks(ids: list, updated: pd.Timestamp, wins: list) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "id": ids,
+            "seasonId": 30,
+            "archetypeId": 1,
+            "updatedDatetime": updated,
+            "wins": wins,
+        }
+    )
+
+
+def read(writer: ParquetWriter, filename: str) -> pd.DataFrame:
+    return pd.read_parquet(os.path.join(writer.bucket, filename))
+
+
+def test_results_without_ids_are_overwritten(writer):
+    agg = pd.DataFrame({"seasonId": [30, 30, 31], "card": ["a", "b", "c"], "n": 1})
+    writer.execute(agg.copy(), "agg.parquet", ["seasonId"])
+    writer.execute(agg[agg["seasonId"] == 30].assign(n=2), "agg.parquet", ["seasonId"])
+
+    df = read(writer, "agg.parquet").sort_values("card")
+    assert df["n"].tolist() == [2, 2, 1]
+    # season 31 wasn't written again, so it keeps its file
+    assert len(writer.load_manifest("agg.parquet").files()) == 2
+
+
+def test_decks_are_appended_and_compacted_to_the_latest(writer):
+    partition_cols = ["seasonId", "archetypeId"]
+    writer.execute(decks([1, 2], NOW, [0, 0]), "decks.parquet", partition_cols)
+    later = NOW + pd.Timedelta(days=1)
+    writer.execute(decks([2], later, [3]), "decks.parquet", partition_cols)
+    assert len(read(writer, "decks.parquet")) == 3
+
+    writer.compact("decks.parquet", partition_cols)
+    df = read(writer, "decks.parquet").sort_values("id")
+    assert df["id"].tolist() == [1, 2]
+    assert df["wins"].tolist() == [0, 3]
+    assert len(writer.load_manifest("decks.parquet").files()) == 1
+
+
+def test_failed_write_raises_and_leaves_the_manifest(writer, monkeypatch):
+    agg = pd.DataFrame({"seasonId": [30], "n": [1]})
+    writer.execute(agg.copy(), "agg.parquet", ["seasonId"])
+    before = writer.load_manifest("agg.parquet")
+
+    def fail(*args):
+        raise OSError("upload failed")
+
+    monkeypatch.setattr(writer, "_write", fail)
+    with pytest.raises(OSError, match="upload failed"):
+        writer.execute(agg.assign(n=2), "agg.parquet", ["seasonId"])
+    assert writer.load_manifest("agg.parquet") == before
+    assert read(writer, "agg.parquet")["n"].tolist() == [1]
+
+
+def test_compact_drops_versions_left_in_other_partitions(partitioned_writer):
+    writer = partitioned_writer
+    partition_cols = ["seasonId", "archetypeId"]
+    writer.execute(decks([1, 2], NOW, [0, 0]), "decks.parquet", partition_cols)
+    # deck 2 gets its archetype later, the other deck of archetype 1 stays
+    later = NOW + pd.Timedelta(days=1)
+    moved = decks([2], later, [3]).assign(archetypeId=2)
+    writer.execute(moved, "decks.parquet", partition_cols)
+    moved = decks([3], later, [1]).assign(archetypeId=3)
+    writer.execute(moved, "decks.parquet", partition_cols)
+    writer.execute(moved.assign(id=4), "decks.parquet", partition_cols)
+
+    writer.compact("decks.parquet", partition_cols)
+    df = read(writer, "decks.parquet").sort_values("id")
+    assert df["id"].tolist() == [1, 2, 3, 4]
+    assert df["archetypeId"].astype(int).tolist() == [1, 2, 3, 3]
+    manifest = writer.load_manifest("decks.parquet")
+    assert sum(f["rows"] for f in manifest.files()) == 4
+
+
+def test_compact_removes_partitions_left_empty(partitioned_writer):
+    writer = partitioned_writer
+    partition_cols = ["seasonId", "archetypeId"]
+    writer.execute(decks([1], NOW, [0]), "decks.parquet", partition_cols)
+    later = NOW + pd.Timedelta(days=1)
+    writer.execute(
+        decks([1], later, [2]).assign(archetypeId=2), "decks.parquet", partition_cols
+    )
+
+    writer.compact("decks.parquet", partition_cols)
+    assert read(writer, "decks.parquet")["wins"].tolist() == [2]
+    assert list(writer.load_manifest("decks.parquet").partitions) == [
+        "seasonId=30/archetypeId=2"
+    ]
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from load import PartitionPlan, PartitionPlanner
+from load.partition_planner import BUCKET_COLUMN, bucket_of
+
+PARTITION_COLS = ["seasonId", "archetypeId", "archetypeName"]
+
+
+@pytest.fixture
+def decks() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    archetypes = rng.integers(0, 60, size=20_000)
+    return pd.DataFrame(
+        {
+            "seasonId": 30,
+            "archetypeId": archetypes,
+            "archetypeName": [f"Archetype {a}" for a in archetypes],
+            "wins": rng.integers(0, 6, size=len(archetypes)),
+        }
+    )
+
+
+def test_keeps_every_key_while_files_are_big_enough(decks):
+    plan = PartitionPlanner(min_file_bytes=1).plan(decks, PARTITION_COLS)
+    assert plan.partition_cols == PARTITION_COLS
+    assert plan.num_buckets == 1
+    assert plan.num_partitions == 60
+
+
+def test_hashes_small_partitions_into_buckets(decks):
+    planner = PartitionPlanner(min_file_bytes=1)
+    total_bytes = planner._bytes_per_row(decks) * len(decks)
+    # room for 10 files of the minimum size
+    planner.min_file_bytes = int(total_bytes / 10)
+    plan = planner.plan(decks, PARTITION_COLS)
+    assert plan.partition_cols == ["seasonId"]
+    assert plan.bucket_cols == ["archetypeId"]
+    assert plan.num_buckets == 10
+    assert plan.folder_cols == ["seasonId", BUCKET_COLUMN]
+
+
+def test_stops_at_max_partitions(decks):
+    plan = PartitionPlanner(min_file_bytes=1, max_partitions=40).plan(
+        decks, PARTITION_COLS
+    )
+    assert plan.partition_cols == ["seasonId"]
+    assert plan.num_partitions <= 40
+
+
+def test_frames_and_tables_plan_alike(decks):
+    planner = PartitionPlanner(min_file_bytes=64 * 1024)
+    table = pa.Table.from_pandas(decks, preserve_index=False)
+    assert planner.plan(decks, PARTITION_COLS) == planner.plan(table, PARTITION_COLS)
+
+
+def test_buckets_are_found_from_the_value_alone(decks):
+    plan = PartitionPlan(["seasonId"], bucket_cols=["archetypeId"], num_buckets=8)
+    df = plan.apply(decks)
+    # as DeckStore finds the bucket of a filter value
+    wanted = bucket_of(pd.DataFrame({"archetypeId": [7]}), ["archetypeId"], 8)[0]
+    assert set(df.loc[df["archetypeId"] == 7, BUCKET_COLUMN]) == {wanted}
+    table = plan.apply(pa.Table.from_pandas(decks, preserve_index=False))
+    assert table[BUCKET_COLUMN].to_pylist() == df[BUCKET_COLUMN].tolist()
+
+
+def test_rows_per_file_follow_the_target_size(decks):
+    planner = PartitionPlanner(target_file_bytes=1024, row_group_bytes=4096)
+    plan = planner.plan(decks, PARTITION_COLS)
+    bytes_per_row = planner._bytes_per_row(decks)
+    assert plan.max_rows_per_file == int(1024 / bytes_per_row)
+    # row groups are never bigger than files
+    assert plan.max_rows_per_group == plan.max_rows_per_file
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from database import Watermark
+from extract import Preparer
+
+WATERMARK = datetime(2024, 3, 1)
+
+
+@pytest.fixture
+def is_older() -> Callable:
+    preparer = Preparer(seasonId=30)
+    preparer.lastUpdated = WATERMARK
+    return preparer.stop_condition(margin=timedelta(days=31))
+
+
+def page(*created: datetime) -> list:
+    # updated long after the watermark, which mustn't matter
+    updated = int(datetime(2024, 6, 1).timestamp())
+    return [
+        {"createdDate": int(c.timestamp()), "updatedDate": updated} for c in created
+    ]
+
+
+@pytest.mark.parametrize("as_type", [list, pd.DataFrame, pa.Table.from_pylist])
+def test_stops_on_created_date_before_the_margin(is_older, as_type):
+    before = page(WATERMARK - timedelta(days=40), WATERMARK - timedelta(days=32))
+    assert is_older(as_type(before))
+
+
+@pytest.mark.parametrize("as_type", [list, pd.DataFrame, pa.Table.from_pylist])
+def test_keeps_going_within_the_margin(is_older, as_type):
+    # decks created in the last league can still have been updated
+    within = page(WATERMARK - timedelta(days=40), WATERMARK - timedelta(days=20))
+    assert not is_older(as_type(within))
+
+
+class FixedWatermarkStore:
+    def __init__(self, max_updated: "datetime | None"):
+        self.max_updated = max_updated
+
+    def load(self, seasonId: int) -> Watermark:
+        watermark = Watermark(seasonId)
+        if self.max_updated is not None:
+            updated = np.array([self.max_updated], dtype="datetime64[ns]")
+            watermark.update(np.array([1]), updated.view(np.int64))
+        return watermark
+
+
+@pytest.mark.parametrize(
+    "bucket, expected",
+    [
+        # behind the database, so at worst decks are fetched again
+        (WATERMARK - timedelta(days=1), WATERMARK - timedelta(days=1)),
+        (WATERMARK, WATERMARK),
+        # ahead of the database, decks in between would be missed
+        (WATERMARK + timedelta(days=1), WATERMARK),
+        (None, WATERMARK),
+    ],
+)
+def test_watermark_is_used_only_when_not_ahead_of_the_database(
+    fake_db, bucket, expected
+):
+    fake_db.handler = lambda sql, params: [(WATERMARK,)]
+    preparer = Preparer(seasonId=30, watermark_store=FixedWatermarkStore(bucket))
+    preparer.execute()
+    assert preparer.lastUpdated == expected
+    assert len(fake_db.statements('max("updatedDatetime")')) == 1
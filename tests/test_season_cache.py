@@ -0,0 +1,78 @@
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from transform import SeasonCache
+
+
+def decks(ids: list, updated: str, wins: int = 0) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "id": ids,
+            "updatedDatetime": pd.Timestamp(updated),
+            "wins": wins,
+            "maindeck": [[{"n": 4, "name": "Ponder"}] for _ in ids],
+            "sideboard": [[{"n": 1, "name": "Negate"}] for _ in ids],
+        }
+    )
+
+
+@pytest.fixture
+def cache(tmp_path) -> SeasonCache:
+    return SeasonCache(str(tmp_path))
+
+
+def test_missing_season_is_none(cache):
+    assert cache.load(30) is None
+
+
+def test_cache_is_valid_for_its_max_updated(cache):
+    cache.save(30, decks([1, 2], "2024-01-01 10:00:00.123456"))
+    assert cache.load(30, datetime(2024, 1, 1, 10, 0, 0, 123456)) is not None
+    # a later load of the watermark means decks were loaded since
+    assert cache.load(30, datetime(2024, 1, 2)) is None
+    assert cache.load(30).num_rows == 2
+
+
+def test_save_merges_the_latest_version_of_each_deck(cache):
+    cache.save(30, decks([1, 2], "2024-01-01"))
+    table = cache.save(30, decks([2, 3], "2024-01-02", wins=3))
+    df = table.to_pandas().set_index("id")
+    assert df["wins"].to_dict() == {1: 0, 2: 3, 3: 3}
+    assert SeasonCache.max_updated(cache.load(30)) == datetime(2024, 1, 2)
+
+
+def test_appended_batches_are_merged_by_finish(cache):
+    cache.save(30, decks([1, 2], "2024-01-01"))
+    cache.append(30, decks([2], "2024-01-03", wins=5))
+    cache.append(30, decks([3], "2024-01-02", wins=1))
+    # nothing changes until the run finishes
+    assert cache.load(30).num_rows == 2
+
+    table = cache.finish(30)
+    df = table.to_pandas().set_index("id")
+    assert df["wins"].to_dict() == {1: 0, 2: 5, 3: 1}
+    assert SeasonCache.max_updated(table) == datetime(2024, 1, 3)
+    assert cache._batch_paths(30) == []
+    assert cache.finish(30).num_rows == 3
+
+
+def test_frame_keeps_the_decklists(cache):
+    cache.save(30, decks([1, 2], "2024-01-01"))
+    df, decklists = cache.load_frame(30)
+    assert "maindeck" not in df.columns
+    assert len(decklists) == 2
+    frame = decklists.to_frame("maindeck", df["id"].to_numpy())
+    assert frame["name"].astype(str).tolist() == ["Ponder", "Ponder"]
+
+
+def test_batches_with_their_own_dictionaries_are_merged(cache):
+    # ArrowTransformer dictionary-encodes names, each batch with its own values
+    for ids, name in [([1], "Burn"), ([2], "Tron")]:
+        table = pa.Table.from_pandas(decks(ids, "2024-01-01"), preserve_index=False)
+        names = pa.array([name] * len(ids)).dictionary_encode()
+        cache.append(30, table.append_column("archetypeName", names))
+    table = cache.finish(30)
+    assert table["archetypeName"].to_pylist() == ["Burn", "Tron"]
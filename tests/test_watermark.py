@@ -0,0 +1,41 @@
+from datetime import datetime
+
+import numpy as np
+
+from database import Watermark, WatermarkStore
+
+
+def nanoseconds(*dates: str) -> np.ndarray:
+    return np.array(dates, dtype="datetime64[ns]").view(np.int64)
+
+
+def test_update_keeps_the_latest_value_of_each_id():
+    watermark = Watermark(30)
+    watermark.update(np.array([3, 1]), nanoseconds("2024-01-03", "2024-01-01"))
+    watermark.update(np.array([1, 2]), nanoseconds("2024-01-05", "2024-01-02"))
+    assert watermark.ids.tolist() == [1, 2, 3]
+    assert watermark.lookup(np.array([1, 4])).tolist() == [
+        nanoseconds("2024-01-05")[0],
+        -1,
+    ]
+    assert watermark.max_updated == datetime(2024, 1, 5)
+
+
+def test_changed_finds_new_and_updated_ids():
+    watermark = Watermark(30)
+    watermark.update(np.array([1, 2]), nanoseconds("2024-01-01", "2024-01-01"))
+    updated = nanoseconds("2024-01-01", "2024-01-02", "2024-01-01")
+    changed = watermark.changed(np.array([1, 2, 3]), updated)
+    assert changed.tolist() == [False, True, True]
+
+
+def test_store_round_trip(tmp_path):
+    watermark = Watermark(30)
+    watermark.update(np.array([5, 7]), nanoseconds("2024-02-01", "2024-02-03"))
+    WatermarkStore(bucket=str(tmp_path)).save(watermark)
+
+    # a new store only has the file to go by
+    loaded = WatermarkStore(bucket=str(tmp_path)).load(30)
+    np.testing.assert_array_equal(loaded.ids, watermark.ids)
+    np.testing.assert_array_equal(loaded.updated, watermark.updated)
+    assert loaded.max_updated == watermark.max_updated